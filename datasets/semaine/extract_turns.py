@@ -4,27 +4,36 @@ from pathlib import Path
 
 import numpy as np
 import soundfile
+from emotion_recognition.segments import Segment, write_segment_manifest
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("input_dir", type=Path, default="combined")
     parser.add_argument("annotation_file", type=Path, default="annot.txt")
+    parser.add_argument(
+        "--manifest", type=Path, help="Write a segment manifest of the turns "
+        "to this file instead of writing each turn to a separate file."
+    )
     args = parser.parse_args()
 
     if not args.input_dir.exists():
         raise FileNotFoundError("Directory doesn't exist: " + args.input_dir)
 
     annot_file = open(args.annotation_file, 'w')
+    segments = []
 
     recording_dirs = filter(Path.is_dir, args.input_dir.glob('*'))
     for recording_dir in sorted(recording_dirs):
         if not recording_dir.is_dir():
             continue
 
-        operator_audio, _ = soundfile.read(
-            recording_dir / 'operator_audio.wav')
-        user_audio, _ = soundfile.read(recording_dir / 'user_audio.wav')
+        operator_path = recording_dir / 'operator_audio.wav'
+        user_path = recording_dir / 'user_audio.wav'
+        operator_audio = user_audio = None
+        if not args.manifest:
+            operator_audio, _ = soundfile.read(operator_path)
+            user_audio, _ = soundfile.read(user_path)
         with open(recording_dir / 'emotions.txt') as fid:
             lines = [l.strip() for l in fid][1:]  # Ignore header line
             emotion_data = np.array([
@@ -51,19 +60,24 @@ def main():
                                 d[turn] = []
                             d[turn].append((start, end, word))
 
-        for d, p, audio in [(user_turns, 'u', user_audio),
-                            (operator_turns, 'o', operator_audio)]:
+        for d, p, path, audio in [
+                (user_turns, 'u', user_path, user_audio),
+                (operator_turns, 'o', operator_path, operator_audio)]:
             out_dir = recording_dir / 'turns'
-            out_dir.mkdir(exist_ok=True)
+            if not args.manifest:
+                out_dir.mkdir(exist_ok=True)
             for turn, words in sorted(d.items()):
                 start = words[0][0]
                 end = words[-1][1]
 
                 name = "{:02d}_{}_{:03d}".format(int(recording_dir.stem), p,
                                                  turn)
-                filename = name + '.wav'
-                soundfile.write(out_dir / filename, audio[start:end],
-                                samplerate=16000)
+                if args.manifest:
+                    segments.append(Segment(path.resolve(), start, end, name))
+                else:
+                    filename = name + '.wav'
+                    soundfile.write(out_dir / filename, audio[start:end],
+                                    samplerate=16000)
 
                 if p == 'u':
                     start_idx, end_idx = np.searchsorted(
@@ -79,6 +93,8 @@ def main():
                             file=annot_file
                         )
     annot_file.close()
+    if args.manifest:
+        write_segment_manifest(args.manifest, segments)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,253 @@
+"""Compact model files for trained support vector classifiers.
+
+Only what is needed for inference is stored: the support vectors (as
+float32), dual coefficients, intercepts, Platt scaling parameters,
+kernel parameters, class names and normalisation statistics. Files are
+uncompressed NumPy .npz archives, which can be loaded without pickle in
+time and memory proportional to the number of support vectors.
+"""
+
+from os import PathLike
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Union
+
+import numpy as np
+from sklearn.svm import SVC
+from sklearn.utils.multiclass import _ovr_decision_function
+
+from .classification import PrecomputedSVC
+
+__all__ = ['CompactSVC', 'save_svc', 'load_svc', 'FORMAT_VERSION']
+
+# Incremented whenever the stored arrays change in an incompatible way.
+FORMAT_VERSION = 1
+
+# Minimum pairwise probability, as in libsvm.
+_MIN_PROB = 1e-7
+
+
+def _multiclass_probability(r: np.ndarray) -> np.ndarray:
+    """Couples pairwise probabilities r, of shape (n, k, k), into class
+    probabilities using the second method of Wu, Lin and Weng (2004), as
+    in libsvm.
+    """
+    n, k, _ = r.shape
+    # Q_tt = sum_{j != t} r_jt^2, Q_tj = -r_jt r_tj
+    Q = -r.transpose(0, 2, 1) * r
+    idx = np.arange(k)
+    Q[:, idx, idx] = np.sum(r**2, axis=1)
+    p = np.full((n, k), 1 / k)
+    eps = 0.005 / k
+    for _ in range(max(100, k)):
+        Qp = np.einsum('nij,nj->ni', Q, p)
+        pQp = np.sum(p * Qp, axis=1)
+        # Instances that have converged are left as they are.
+        active = np.max(np.abs(Qp - pQp[:, None]), axis=1) >= eps
+        if not np.any(active):
+            break
+        # libsvm updates each coordinate in turn.
+        for t in range(k):
+            diff = np.where(active, (-Qp[:, t] + pQp) / Q[:, t, t], 0)
+            p[:, t] += diff
+            pQp = (pQp + diff * (diff * Q[:, t, t] + 2 * Qp[:, t])) \
+                / (1 + diff)**2
+            Qp = (Qp + diff[:, None] * Q[:, t, :]) / (1 + diff[:, None])
+            p /= 1 + diff[:, None]
+    return p
+
+
+class CompactSVC:
+    """A trained support vector classifier restored from a model file,
+    with the same prediction methods as scikit-learn's SVC.
+
+    Parameters:
+    -----------
+    arrays: dict
+        The stored arrays, as written by `save_svc()`.
+    """
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.kernel = str(arrays['kernel'])
+        self.gamma = float(arrays['gamma'])
+        self.degree = int(arrays['degree'])
+        self.coef0 = float(arrays['coef0'])
+        self.support_vectors_ = arrays['support_vectors']
+        self.dual_coef_ = arrays['dual_coef']
+        self.intercept_ = arrays['intercept']
+        self.n_support_ = arrays['n_support']
+        self.classes_ = arrays['classes']
+        self.class_names = [str(x) for x in arrays['class_names']]
+        self.probA_ = arrays['probA']
+        self.probB_ = arrays['probB']
+        self.decision_function_shape = str(arrays['decision_function_shape'])
+        self.norm_scheme = str(arrays['norm_scheme'])
+        self.norm_mean = arrays['norm_mean']
+        self.norm_scale = arrays['norm_scale']
+
+    def _kernel(self, X: np.ndarray) -> np.ndarray:
+        sv = self.support_vectors_
+        X = np.asarray(X, dtype=sv.dtype)
+        a = X @ sv.T
+        if self.kernel == 'linear':
+            return a
+        if self.kernel == 'poly':
+            return (self.gamma * a + self.coef0)**self.degree
+        if self.kernel == 'sigmoid':
+            return np.tanh(self.gamma * a + self.coef0)
+        # <x - y, x - y> = <x, x> + <y, y> - 2<x, y>
+        s = np.sum(X**2, axis=1)[:, None] + np.sum(sv**2, axis=1)[None, :]
+        return np.exp(-self.gamma * np.maximum(s - 2 * a, 0))
+
+    def _ovo_decision(self, X: np.ndarray) -> np.ndarray:
+        """Returns the libsvm one-vs-one decision values, which are
+        positive for the first class of each pair.
+        """
+        K = self._kernel(X).astype(np.float64)
+        n_classes = len(self.classes_)
+        start = np.concatenate([[0], np.cumsum(self.n_support_)])
+        dec = []
+        p = 0
+        for i in range(n_classes):
+            si = slice(start[i], start[i + 1])
+            for j in range(i + 1, n_classes):
+                sj = slice(start[j], start[j + 1])
+                d = (K[:, si] @ self.dual_coef_[j - 1, si]
+                     + K[:, sj] @ self.dual_coef_[i, sj] + self.intercept_[p])
+                dec.append(d)
+                p += 1
+        return np.stack(dec, axis=1)
+
+    def normalise(self, x: np.ndarray) -> np.ndarray:
+        """Applies the stored normalisation statistics to x, if any were
+        stored. Otherwise x is returned unchanged, and should be
+        normalised with `norm_scheme` by the caller.
+        """
+        if self.norm_mean.size == 0:
+            return x
+        return (x - self.norm_mean) / self.norm_scale
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        dec = self._ovo_decision(X)
+        if len(self.classes_) == 2:
+            return -dec[:, 0]
+        if self.decision_function_shape == 'ovr':
+            return _ovr_decision_function(dec < 0, -dec, len(self.classes_))
+        return dec
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        dec = self._ovo_decision(X)
+        n_classes = len(self.classes_)
+        votes = np.zeros((len(dec), n_classes), dtype=int)
+        p = 0
+        for i in range(n_classes):
+            for j in range(i + 1, n_classes):
+                pos = dec[:, p] > 0
+                votes[pos, i] += 1
+                votes[~pos, j] += 1
+                p += 1
+        return self.classes_[np.argmax(votes, axis=1)]
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        if self.probA_.size == 0:
+            raise AttributeError(
+                "Model was not trained with probability=True.")
+        dec = self._ovo_decision(X)
+        n_classes = len(self.classes_)
+        pair_prob = 1 / (1 + np.exp(dec * self.probA_ + self.probB_))
+        pair_prob = np.clip(pair_prob, _MIN_PROB, 1 - _MIN_PROB)
+        # The libsvm version used by scikit-learn couples probabilities
+        # even for binary problems.
+        r = np.zeros((len(dec), n_classes, n_classes))
+        p = 0
+        for i in range(n_classes):
+            for j in range(i + 1, n_classes):
+                r[:, i, j] = pair_prob[:, p]
+                r[:, j, i] = 1 - pair_prob[:, p]
+                p += 1
+        return _multiclass_probability(r)
+
+
+def save_svc(path: Union[PathLike, str],
+             clf: SVC,
+             class_names: Optional[Sequence[str]] = None,
+             norm_scheme: str = 'none',
+             norm_mean: Optional[np.ndarray] = None,
+             norm_scale: Optional[np.ndarray] = None):
+    """Saves a trained SVC or PrecomputedSVC to a compact model file.
+
+    Args:
+    -----
+    path: pathlike or str
+        The path of the .npz file to write.
+    clf: SVC
+        The trained classifier. Its kernel must be one of 'linear',
+        'poly', 'rbf' or 'sigmoid', or a PrecomputedSVC.
+    class_names: list of str, optional
+        Names of the classes in clf.classes_. Default is the string
+        representation of each class.
+    norm_scheme: str
+        The normalisation scheme used for the training data.
+    norm_mean, norm_scale: numpy.ndarray, optional
+        Global normalisation statistics to apply to inputs before
+        prediction, for example from a StandardScaler.
+    """
+    if isinstance(clf, PrecomputedSVC):
+        kernel = clf.kernel_name
+        if not hasattr(clf, 'kernel_support_vectors_'):
+            raise ValueError("PrecomputedSVC must be fit before saving.")
+        sv = clf.kernel_support_vectors_
+        gamma = clf.gamma
+        if gamma == 'auto':
+            gamma = 1 / sv.shape[1]
+    elif clf.kernel in {'linear', 'poly', 'rbf', 'sigmoid'}:
+        kernel = clf.kernel
+        sv = clf.support_vectors_
+        gamma = clf._gamma
+    else:
+        raise ValueError("Can't save SVC with kernel {!r}.".format(
+            clf.kernel))
+
+    if class_names is None:
+        class_names = [str(x) for x in clf.classes_]
+    empty = np.empty(0)
+    arrays: Dict[str, Any] = {
+        'format_version': FORMAT_VERSION,
+        'model': 'svc',
+        'kernel': kernel,
+        'gamma': float(gamma),
+        'degree': int(clf.degree),
+        'coef0': float(clf.coef0),
+        'support_vectors': np.asarray(sv, dtype=np.float32),
+        'dual_coef': clf.dual_coef_,
+        'intercept': clf.intercept_,
+        'n_support': clf.n_support_,
+        'classes': clf.classes_,
+        'class_names': np.array(class_names, dtype=str),
+        'probA': clf.probA_ if clf.probability else empty,
+        'probB': clf.probB_ if clf.probability else empty,
+        'decision_function_shape': clf.decision_function_shape,
+        'norm_scheme': norm_scheme,
+        'norm_mean': empty if norm_mean is None else norm_mean,
+        'norm_scale': empty if norm_scale is None else norm_scale
+    }
+    if len(clf.classes_) == 2:
+        # scikit-learn flips the sign of binary coefficients so that
+        # positive values correspond to the second class. Store them in
+        # libsvm's convention, like the multi-class ones.
+        arrays['dual_coef'] = -clf.dual_coef_
+        arrays['intercept'] = -clf.intercept_
+    with open(path, 'wb') as fid:
+        np.savez(fid, **arrays)
+
+
+def load_svc(path: Union[PathLike, str]) -> CompactSVC:
+    """Loads a model file written by `save_svc()`."""
+    with np.load(Path(path), allow_pickle=False) as data:
+        version = int(data['format_version'])
+        if version > FORMAT_VERSION:
+            raise ValueError(
+                "Model file {} has format version {}, but only versions up to "
+                "{} are supported.".format(path, version, FORMAT_VERSION))
+        if str(data['model']) != 'svc':
+            raise ValueError("Model file {} is not an SVC.".format(path))
+        arrays = {k: data[k] for k in data.files}
+    return CompactSVC(arrays)
@@ -0,0 +1,118 @@
+"""A persistent index of audio file metadata, so that corpus-wide
+questions such as clip lengths and sample rates can be answered without
+opening every file.
+"""
+
+import os
+from os import PathLike
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+import soundfile
+from joblib import Parallel, delayed
+
+__all__ = ['INDEX_COLUMNS', 'scan_audio', 'AudioIndex']
+
+INDEX_COLUMNS = ['duration', 'sample_rate', 'channels', 'frames', 'size',
+                 'mtime_ns']
+
+
+def _file_info(path: str) -> tuple:
+    stat = os.stat(path)
+    info = soundfile.info(path)
+    return (path, info.frames / info.samplerate, info.samplerate,
+            info.channels, info.frames, stat.st_size, stat.st_mtime_ns)
+
+
+def scan_audio(paths: Sequence[Union[PathLike, str]],
+               n_jobs: int = -1) -> pd.DataFrame:
+    """Reads the header of each audio file in parallel threads. Returns
+    a DataFrame indexed by absolute path, with columns `INDEX_COLUMNS`.
+    """
+    paths = [str(Path(p).resolve()) for p in paths]
+    rows = []
+    if len(paths) > 0:
+        rows = Parallel(n_jobs=n_jobs, prefer='threads', batch_size=64)(
+            delayed(_file_info)(p) for p in paths)
+    return pd.DataFrame(rows, columns=['path'] + INDEX_COLUMNS) \
+        .set_index('path')
+
+
+class AudioIndex:
+    """Metadata of audio files, stored as a CSV file and updated
+    incrementally. Only files that are new, or whose size or
+    modification time has changed, are read again.
+
+    Args:
+    -----
+    path: pathlike or str, optional
+        The index file. If None, the index is only kept in memory.
+    """
+    def __init__(self, path: Optional[Union[PathLike, str]] = None):
+        self.path = None if path is None else Path(path)
+        self.table = scan_audio([])
+        if self.path is not None and self.path.exists():
+            self.table = pd.read_csv(self.path, index_col='path')
+        self._changed = False
+
+    def update(self, paths: Sequence[Union[PathLike, str]],
+               n_jobs: int = -1, prune: bool = False) -> pd.DataFrame:
+        """Adds or refreshes the given files in the index, and returns
+        their metadata, in the same order as paths.
+
+        Args:
+        -----
+        paths: list of pathlike or str
+            The audio files.
+        n_jobs: int
+            The number of threads used to read new files.
+        prune: bool
+            Also remove files from the index that aren't in paths.
+
+        Returns:
+        --------
+        info: pandas.DataFrame
+            The metadata of each file, indexed by absolute path.
+        """
+        paths = [str(Path(p).resolve()) for p in paths]
+        stats = [os.stat(p) for p in paths]
+        size = np.array([x.st_size for x in stats], dtype=np.int64)
+        mtime = np.array([x.st_mtime_ns for x in stats], dtype=np.int64)
+        idx = self.table.index.get_indexer(paths)
+        known = idx >= 0
+        unchanged = np.zeros(len(paths), dtype=bool)
+        unchanged[known] = (
+            (self.table['size'].to_numpy()[idx[known]] == size[known])
+            & (self.table['mtime_ns'].to_numpy()[idx[known]] == mtime[known])
+        )
+        # Paths may be repeated, but each file is scanned only once so
+        # that the index stays unique.
+        todo = list(dict.fromkeys(
+            p for p, x in zip(paths, unchanged) if not x))
+        if len(todo) > 0:
+            scanned = scan_audio(todo, n_jobs)
+            if len(self.table) > 0:
+                scanned = pd.concat([
+                    self.table.drop(todo, errors='ignore'), scanned])
+            self.table = scanned
+            self._changed = True
+        if prune:
+            removed = self.table.index.difference(paths)
+            if len(removed) > 0:
+                self.table = self.table.drop(removed)
+                self._changed = True
+        return self.table.loc[paths]
+
+    def save(self):
+        """Writes the index, if it has changed."""
+        if self.path is None or not self._changed:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so that an interrupted write
+        # never leaves a partial index behind.
+        tmp = self.path.with_suffix('.tmp')
+        self.table.sort_index().to_csv(tmp)
+        os.replace(tmp, self.path)
+        self._changed = False
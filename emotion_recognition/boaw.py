@@ -0,0 +1,136 @@
+"""Bag-of-audio-words (BoAW) encoding of LLD sequences, as an
+alternative to openXBOW that runs in-process on the concatenated LLD
+matrix of a netCDF dataset.
+"""
+
+from typing import Optional, Sequence
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+__all__ = ['BoAWEncoder']
+
+
+class BoAWEncoder:
+    """Learns a codebook of LLD vectors and encodes each instance as a
+    histogram of the codewords closest to each of its frames, like
+    openXBOW.
+
+    Parameters:
+    -----------
+    size: int
+        The number of codewords, which is the number of output features.
+    n_assigned: int
+        The number of closest codewords incremented for each frame
+        (openXBOW's -a option).
+    codebook: str, one of {'random', 'kmeans'}
+        How to learn the codebook. 'random' picks random LLD vectors,
+        which is openXBOW's default. 'kmeans' uses mini-batch k-means.
+    log: bool
+        Use logarithmic term frequencies, log10(1 + tf).
+    norm: bool
+        Divide the term frequencies of each instance by its number of
+        frames (openXBOW's -norm 1), before any log weighting.
+    max_samples: int
+        The maximum number of LLD vectors used to learn the codebook.
+    chunk_size: int
+        The number of frames to encode at once, which bounds the size
+        of the distance matrix.
+    random_state: int, optional
+        Seed for codebook learning.
+    """
+    def __init__(self, size: int = 500, n_assigned: int = 1,
+                 codebook: str = 'random', log: bool = False,
+                 norm: bool = False, max_samples: int = 100000,
+                 chunk_size: int = 10000,
+                 random_state: Optional[int] = None):
+        if codebook not in {'random', 'kmeans'}:
+            raise ValueError("Invalid codebook method {!r}.".format(codebook))
+        if not 1 <= n_assigned <= size:
+            raise ValueError("n_assigned must be between 1 and size.")
+        self.size = size
+        self.n_assigned = n_assigned
+        self.codebook = codebook
+        self.log = log
+        self.norm = norm
+        self.max_samples = max_samples
+        self.chunk_size = chunk_size
+        self.random_state = random_state
+
+    def fit(self, x: np.ndarray) -> 'BoAWEncoder':
+        """Learns the codebook from an array of LLD vectors of shape
+        (n_frames, n_lld).
+        """
+        rng = np.random.default_rng(self.random_state)
+        if len(x) > self.max_samples:
+            x = x[np.sort(rng.choice(len(x), self.max_samples,
+                                     replace=False))]
+        x = np.asarray(x, dtype=np.float32)
+        if self.codebook == 'random':
+            idx = rng.choice(len(x), self.size, replace=len(x) < self.size)
+            self.codebook_ = x[idx].copy()
+        else:
+            kmeans = MiniBatchKMeans(
+                self.size, n_init=3, batch_size=4096,
+                random_state=self.random_state
+            )
+            kmeans.fit(x)
+            self.codebook_ = kmeans.cluster_centers_.astype(np.float32)
+        self._codebook_sq = np.sum(self.codebook_**2, axis=1)
+        return self
+
+    def assign(self, x: np.ndarray) -> np.ndarray:
+        """Returns the indices of the `n_assigned` closest codewords to
+        each LLD vector, as an array of shape (n_frames, n_assigned).
+        """
+        x = np.asarray(x, dtype=np.float32)
+        # Squared Euclidean distance, without the constant |x|^2 term.
+        dist = self._codebook_sq - 2 * x @ self.codebook_.T
+        if self.n_assigned == 1:
+            return np.argmin(dist, axis=1)[:, np.newaxis]
+        if self.n_assigned == self.size:
+            return np.broadcast_to(np.arange(self.size),
+                                   (len(x), self.size))
+        return np.argpartition(dist, self.n_assigned - 1,
+                               axis=1)[:, :self.n_assigned]
+
+    def transform(self, x: np.ndarray, slices: Sequence[int]) -> np.ndarray:
+        """Encodes each instance of a concatenated LLD matrix.
+
+        Args:
+        -----
+        x: numpy.ndarray
+            The LLD vectors of all instances, of shape (n_frames, n_lld).
+            This can be any array-like that supports slicing, such as a
+            netCDF variable, and is read in chunks.
+        slices: list of int
+            The number of frames of each instance.
+
+        Returns:
+        --------
+        boaw: numpy.ndarray
+            The BoAW features of shape (n_instances, size).
+        """
+        slices = np.asarray(slices, dtype=np.int64)
+        segment = np.repeat(np.arange(len(slices)), slices)
+        counts = np.zeros(len(slices) * self.size, dtype=np.int64)
+        for start in range(0, len(segment), self.chunk_size):
+            end = min(start + self.chunk_size, len(segment))
+            codes = self.assign(np.asarray(x[start:end]))
+            # Only the instances in this chunk are counted, so the cost
+            # doesn't grow with the total number of instances.
+            first = segment[start]
+            last = segment[end - 1] + 1
+            idx = (segment[start:end, np.newaxis] - first) * self.size + codes
+            counts[first * self.size:last * self.size] += np.bincount(
+                idx.ravel(), minlength=(last - first) * self.size)
+        tf = counts.reshape(len(slices), self.size).astype(np.float64)
+        if self.norm:
+            tf /= np.maximum(slices, 1)[:, np.newaxis]
+        if self.log:
+            tf = np.log10(1 + tf)
+        return tf.astype(np.float32)
+
+    def fit_transform(self, x: np.ndarray,
+                      slices: Sequence[int]) -> np.ndarray:
+        return self.fit(np.asarray(x)).transform(x, slices)
@@ -0,0 +1,145 @@
+"""A per-file feature cache, so that feature extraction only needs to
+process files that are new or have changed since the last run.
+"""
+
+import hashlib
+import json
+import os
+from os import PathLike
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+
+from .segments import Segment
+from .utils import json_default, write_json
+
+__all__ = ['file_hash', 'config_hash', 'FeatureCache']
+
+# An input file, or a segment of one
+_Input = Union[PathLike, str, Segment]
+
+
+def file_hash(path: Union[PathLike, str], block_size: int = 1 << 20) -> str:
+    """Returns the SHA-1 hex digest of the contents of a file."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as fid:
+        for block in iter(lambda: fid.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def config_hash(config: Mapping[str, Any]) -> str:
+    """Returns a hex digest identifying an extractor configuration. The
+    configuration must be JSON serialisable.
+    """
+    desc = json.dumps(dict(config), sort_keys=True, default=json_default)
+    return hashlib.sha1(desc.encode()).hexdigest()
+
+
+class FeatureCache:
+    """Stores the features extracted from each input file, keyed by the
+    file contents and the extractor configuration.
+
+    The manifest, `manifest.json` in the cache directory, records the
+    content hash of each input file along with its size and
+    modification time, so that unchanged files needn't be read again to
+    be hashed. Results are stored one .npy file per input file, under a
+    directory for each configuration, sharded by the first two
+    characters of the content hash. Since results are keyed by content,
+    renamed or copied files are also found in the cache. Segments of
+    files can be used in place of paths, and are keyed by the content of
+    the source file and the segment's start and end.
+
+    Args:
+    -----
+    cache_dir: pathlike or str
+        The cache directory. This can be shared between extractors and
+        configurations.
+    config: dict
+        The extractor configuration. Any options that change the
+        extracted features must be included, such as a hash of a
+        configuration file, as given by `file_hash()`.
+    """
+    def __init__(self, cache_dir: Union[PathLike, str],
+                 config: Mapping[str, Any]):
+        self.cache_dir = Path(cache_dir)
+        self.config = dict(config)
+        self.config_hash = config_hash(self.config)
+        self.store_dir = self.cache_dir / self.config_hash[:16]
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        config_file = self.store_dir / 'config.json'
+        if not config_file.exists():
+            write_json(config_file, self.config)
+
+        self.manifest_path = self.cache_dir / 'manifest.json'
+        self.manifest: Dict[str, Dict[str, Any]] = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path) as fid:
+                self.manifest = json.load(fid)['files']
+        self._changed = False
+
+    def content_hash(self, path: Union[PathLike, str]) -> str:
+        """Returns the content hash of a file, reusing the hash in the
+        manifest if the file's size and modification time are unchanged.
+        """
+        path = Path(path).resolve()
+        stat = path.stat()
+        entry = self.manifest.get(str(path))
+        if (entry is not None and entry['size'] == stat.st_size
+                and entry['mtime_ns'] == stat.st_mtime_ns):
+            return entry['sha1']
+        sha1 = file_hash(path)
+        self.manifest[str(path)] = {'size': stat.st_size,
+                                    'mtime_ns': stat.st_mtime_ns,
+                                    'sha1': sha1}
+        self._changed = True
+        return sha1
+
+    def path(self, path: _Input) -> Path:
+        """Returns the path of the cached result for an input file or
+        segment.
+        """
+        if isinstance(path, Segment):
+            sha1 = self.content_hash(path.path)
+            key = sha1
+            if path.start != 0 or path.end is not None:
+                key = '{}_{}_{}'.format(sha1, path.start, path.end)
+        else:
+            sha1 = key = self.content_hash(path)
+        return self.store_dir / sha1[:2] / '{}.npy'.format(key)
+
+    def __contains__(self, path: _Input) -> bool:
+        return self.path(path).exists()
+
+    def missing(self, paths: Sequence[_Input]) -> List[int]:
+        """Returns the indices of the paths without a cached result."""
+        return [i for i, p in enumerate(paths) if p not in self]
+
+    def load(self, path: _Input) -> np.ndarray:
+        """Returns the cached result for an input file."""
+        return np.load(self.path(path), allow_pickle=False)
+
+    def get(self, path: _Input) -> Optional[np.ndarray]:
+        """Returns the cached result for an input file, or None."""
+        cached = self.path(path)
+        if not cached.exists():
+            return None
+        return np.load(cached, allow_pickle=False)
+
+    def store(self, path: _Input, features: np.ndarray):
+        """Stores the result for an input file."""
+        cached = self.path(path)
+        cached.parent.mkdir(exist_ok=True)
+        # Write to a temporary file first so that an interrupted write
+        # never leaves a partial result behind.
+        tmp = cached.with_suffix('.tmp')
+        with open(tmp, 'wb') as fid:
+            np.save(fid, np.asarray(features), allow_pickle=False)
+        os.replace(tmp, cached)
+
+    def save(self):
+        """Writes the manifest, if it has changed."""
+        if self._changed:
+            write_json(self.manifest_path, {'files': self.manifest})
+            self._changed = False
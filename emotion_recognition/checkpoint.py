@@ -0,0 +1,127 @@
+"""Per-fold result checkpoints, so that long cross-validation runs can
+be resumed after they are interrupted.
+"""
+
+import hashlib
+import json
+from os import PathLike
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Union
+
+import numpy as np
+
+from .utils import json_default, write_json
+
+__all__ = ['array_hash', 'FoldCheckpoint']
+
+
+def _update_hash(h, arr):
+    arr = np.asarray(arr)
+    h.update('{}{}'.format(arr.dtype.str, arr.shape).encode())
+    if arr.dtype == object:
+        for x in arr.flat:
+            _update_hash(h, x)
+    else:
+        h.update(np.ascontiguousarray(arr).data)
+
+
+def array_hash(*arrays: np.ndarray) -> str:
+    """Returns a hex digest identifying the shape, type and contents of
+    the given arrays. Arrays of dtype object, such as variable-length
+    sequences, are hashed element by element.
+    """
+    h = hashlib.sha1()
+    for arr in arrays:
+        _update_hash(h, arr)
+    return h.hexdigest()
+
+
+class FoldCheckpoint:
+    """Persists the results of each cross-validation fold to a run
+    directory. Each result is stored in its own JSON file, named by a
+    hash of the dataset, model kind, hyperparameters, seed and fold
+    index, so a restarted run with the same configuration only computes
+    the folds that are missing.
+
+    Args:
+    -----
+    run_dir: pathlike or str
+        The directory in which to store fold results.
+    data_hash: str
+        A hash identifying the dataset, as given by `array_hash()`.
+    kind: str
+        The kind of model.
+    params: dict, optional
+        Hyperparameters identifying this run. These must be JSON
+        serialisable.
+    seed: int
+        The random seed or repetition number of this run.
+    """
+    def __init__(self, run_dir: Union[PathLike, str], data_hash: str,
+                 kind: str, params: Mapping[str, Any] = {}, seed: int = 0):
+        self.run_dir = Path(run_dir)
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        self.data_hash = data_hash
+        self.kind = kind
+        self.params = dict(params)
+        self.seed = seed
+
+        desc = json.dumps([data_hash, kind, self.params, seed],
+                          sort_keys=True, default=json_default)
+        self.run_key = hashlib.sha1(desc.encode()).hexdigest()[:16]
+
+    def key(self, fold: int) -> str:
+        """Returns the key identifying the given fold of this run."""
+        desc = json.dumps([self.run_key, fold])
+        return hashlib.sha1(desc.encode()).hexdigest()[:16]
+
+    def path(self, fold: int) -> Path:
+        """Returns the path of the result file for the given fold."""
+        return self.run_dir / 'fold_{}.json'.format(self.key(fold))
+
+    def load(self, fold: int) -> Optional[Dict[str, Any]]:
+        """Returns the stored result of the given fold, or None if that
+        fold hasn't been completed.
+        """
+        path = self.path(fold)
+        if not path.exists():
+            return None
+        with open(path) as fid:
+            return json.load(fid)['result']
+
+    def load_all(self, n_folds: int) -> Dict[int, Dict[str, Any]]:
+        """Returns a dictionary mapping fold index to stored result for
+        each of the first `n_folds` folds that have been completed.
+        """
+        results = {}
+        for fold in range(n_folds):
+            result = self.load(fold)
+            if result is not None:
+                results[fold] = result
+        return results
+
+    def save(self, fold: int, result: Mapping[str, Any]):
+        """Stores the result of the given fold. The result must be a
+        mapping of JSON serialisable values, or NumPy arrays/scalars.
+        """
+        record = {'data_hash': self.data_hash, 'kind': self.kind,
+                  'params': self.params, 'seed': self.seed, 'fold': fold,
+                  'result': dict(result)}
+        write_json(self.path(fold), record)
+
+    def load_params(self) -> Optional[Dict[str, Any]]:
+        """Returns the stored selected hyperparameters of this run, or
+        None if they haven't been stored.
+        """
+        path = self.run_dir / 'params_{}.json'.format(self.run_key)
+        if not path.exists():
+            return None
+        with open(path) as fid:
+            return json.load(fid)
+
+    def save_params(self, params: Mapping[str, Any]):
+        """Stores the hyperparameters selected for this run (e.g. by an
+        inner grid search), so they needn't be searched again.
+        """
+        write_json(self.run_dir / 'params_{}.json'.format(self.run_key),
+                   dict(params))
@@ -1,19 +1,27 @@
 import abc
 import os
+import time
+from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor
 from functools import partial
-from typing import (Any, Callable, Dict, Iterable, List, Optional, Sequence,
-                    Tuple, Union)
+from os import PathLike
+from pathlib import Path
+from typing import (Any, Callable, Dict, Iterable, List, Mapping, Optional,
+                    Sequence, Tuple, Union)
 
 import numpy as np
 import pandas as pd
-from sklearn.base import BaseEstimator, ClassifierMixin
-from sklearn.metrics import precision_score, recall_score
-from sklearn.model_selection import (BaseCrossValidator, KFold,
-                                     LeaveOneGroupOut, ParameterGrid)
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from sklearn.metrics import get_scorer, precision_score, recall_score
+from sklearn.model_selection import (BaseCrossValidator, GridSearchCV,
+                                     KFold, LeaveOneGroupOut, ParameterGrid,
+                                     cross_validate)
 from sklearn.svm import SVC
 
+from .checkpoint import FoldCheckpoint, array_hash
 from .dataset import CombinedDataset, LabelledDataset
+from .svm import WarmStartSVC
 from .utils import shuffle_multiple
 
 __all__ = ['PrecomputedSVC', 'Classifier', 'SKLearnClassifier']
@@ -24,6 +32,9 @@ KernelFunction = Callable[[np.ndarray, np.ndarray], np.ndarray]
 
 METRICS = ['prec', 'rec', 'uap', 'uar', 'war']
 
+# Parameters of PrecomputedSVC that determine the kernel matrix.
+KERNEL_PARAMS = ['kernel', 'degree', 'gamma', 'coef0']
+
 
 def linear_kernel(x, y) -> np.ndarray:
     return np.matmul(x, y.T)
@@ -73,6 +84,13 @@ class PrecomputedSVC(SVC):
         self.kernel_name = kernel
         self.kernel = self._get_kernel_func()
 
+    def fit(self, X, y, sample_weight=None) -> BaseEstimator:
+        super().fit(X, y, sample_weight=sample_weight)
+        # Keep the support vectors so that the model can be saved without
+        # the full training matrix.
+        self.kernel_support_vectors_ = np.asarray(X)[self.support_]
+        return self
+
     def get_params(self, deep) -> Dict[str, Any]:
         params = super().get_params(deep)
         params['kernel'] = self.kernel_name
@@ -90,13 +108,243 @@ class PrecomputedSVC(SVC):
         predict(). This is calculated at runtime in order to more easily
         handle changes in parameters such as kernel, gamma, etc.
         """
-        f = self.KERNELS[self.kernel]
-        params = {}
-        if self.kernel == 'poly':
-            params = {'d': self.degree, 'r': self.coef0, 'gamma': self.gamma}
-        elif self.kernel == 'rbf':
-            params = {'gamma': self.gamma}
-        return partial(f, **params)
+        return get_kernel_func(self.kernel_name, degree=self.degree,
+                               gamma=self.gamma, coef0=self.coef0)
+
+
+def get_kernel_func(kernel: str = 'rbf', degree: int = 3,
+                    gamma: Union[str, float] = 'auto',
+                    coef0: float = 0.0) -> KernelFunction:
+    """Returns the kernel function used by PrecomputedSVC for the given
+    kernel name and parameters.
+    """
+    f = PrecomputedSVC.KERNELS[kernel]
+    params = {}
+    if kernel == 'poly':
+        params = {'d': degree, 'r': coef0, 'gamma': gamma}
+    elif kernel == 'rbf':
+        params = {'gamma': gamma}
+    return partial(f, **params)
+
+
+def gram_matrix(x: np.ndarray, kernel: str = 'rbf', degree: int = 3,
+                gamma: Union[str, float] = 'auto', coef0: float = 0.0,
+                cache_dir: Optional[Union[PathLike, str]] = None) \
+        -> np.ndarray:
+    """Computes the kernel matrix between all pairs of instances in x,
+    using the same kernel functions and parameters as PrecomputedSVC.
+
+    Args:
+    -----
+    x: numpy.ndarray
+        The 2-D data matrix.
+    kernel, degree, gamma, coef0:
+        Kernel parameters, as for PrecomputedSVC.
+    cache_dir: pathlike or str, optional
+        If given, the matrix is stored in this directory, named by a
+        hash of x and the kernel parameters, and is loaded from there
+        rather than recomputed if it already exists.
+
+    Returns:
+    --------
+    gram: numpy.ndarray
+        The (n_instances, n_instances) kernel matrix.
+    """
+    kernel_fn = get_kernel_func(kernel, degree=degree, gamma=gamma,
+                                coef0=coef0)
+    if cache_dir is None:
+        return kernel_fn(x, x)
+
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    params = [kernel, degree, gamma, coef0] if kernel == 'poly' else (
+        [kernel, gamma] if kernel == 'rbf' else [kernel])
+    key = array_hash(x, np.array([str(p) for p in params]))
+    path = cache_dir / 'gram_{}.npy'.format(key)
+    if path.exists():
+        return np.load(path, mmap_mode='r')
+    gram = kernel_fn(x, x)
+    np.save(path, gram)
+    return gram
+
+
+def _split_kernel_params(params: Mapping[str, Any]) \
+        -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    kernel_params = {k: v for k, v in params.items() if k in KERNEL_PARAMS}
+    svc_params = {k: v for k, v in params.items() if k not in KERNEL_PARAMS}
+    return kernel_params, svc_params
+
+
+def precomputed_svc(x: np.ndarray, params: Mapping[str, Any],
+                    cache_dir: Optional[Union[PathLike, str]] = None) \
+        -> Tuple[SVC, np.ndarray]:
+    """Returns an SVC with a precomputed kernel, along with the kernel
+    matrix for x, equivalent to PrecomputedSVC(**params). The kernel
+    matrix is passed in place of x to fit() and scikit-learn's
+    cross-validation utilities, which slice it by row and column for
+    each split.
+    """
+    kernel_params, svc_params = _split_kernel_params(params)
+    gram = gram_matrix(x, **kernel_params, cache_dir=cache_dir)
+    return SVC(kernel='precomputed', **svc_params), gram
+
+
+def _c_path_split(gram, y, train, test, candidates, scorer, sample_weight):
+    """Fits candidates on one split in order of increasing C, warm
+    starting each fit from the previous solution with the same other
+    parameters.
+    """
+    k_train = gram[np.ix_(train, train)]
+    k_test = gram[np.ix_(test, train)]
+    sw = None if sample_weight is None else sample_weight[train]
+    n = len(candidates)
+    scores, fit_times, score_times = np.empty(n), np.empty(n), np.empty(n)
+    paths = defaultdict(list)
+    for i, params in enumerate(candidates):
+        others = {k: v for k, v in params.items() if k != 'C'}
+        paths[repr(sorted(others.items()))].append(i)
+    for path in paths.values():
+        clf = WarmStartSVC(warm_start=True)
+        for i in sorted(path, key=lambda i: candidates[i]['C']):
+            clf.set_params(**candidates[i])
+            start_time = time.perf_counter()
+            clf.fit(k_train, y[train], sample_weight=sw)
+            fit_times[i] = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            scores[i] = scorer(clf, k_test, y[test])
+            score_times[i] = time.perf_counter() - start_time
+    return scores, fit_times, score_times
+
+
+def _c_path_search(gram, y, splits, svc_grid, scoring, sample_weight,
+                   n_jobs=None, verbose=0) -> Dict[str, Any]:
+    """Evaluates all candidates in svc_grid on each split by following
+    regularisation paths over C with WarmStartSVC. The results have the
+    same format as GridSearchCV.cv_results_.
+    """
+    candidates = list(ParameterGrid(svc_grid))
+    scorer = get_scorer(scoring) if isinstance(scoring, str) else scoring
+    out = Parallel(n_jobs=n_jobs, verbose=verbose)(
+        delayed(_c_path_split)(gram, y, train, test, candidates, scorer,
+                               sample_weight)
+        for train, test in splits
+    )
+    scores, fit_times, score_times = (np.stack(x, axis=1) for x in zip(*out))
+    results = {
+        'mean_fit_time': fit_times.mean(1),
+        'std_fit_time': fit_times.std(1),
+        'mean_score_time': score_times.mean(1),
+        'std_score_time': score_times.std(1),
+        'params': candidates
+    }
+    for i in range(len(splits)):
+        results['split{}_test_score'.format(i)] = scores[:, i]
+    results['mean_test_score'] = scores.mean(1)
+    results['std_test_score'] = scores.std(1)
+    return results
+
+
+def precomputed_grid_search(x: np.ndarray,
+                            y: np.ndarray,
+                            param_grid: Mapping[str, Sequence],
+                            cv: BaseCrossValidator = KFold(10),
+                            groups: Optional[np.ndarray] = None,
+                            scoring: Union[str, Callable] = 'accuracy',
+                            sample_weight: Optional[np.ndarray] = None,
+                            cache_dir: Optional[Union[PathLike, str]] = None,
+                            n_jobs: Optional[int] = None,
+                            verbose: int = 0,
+                            warm_start: bool = False) \
+        -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """Grid search over PrecomputedSVC parameters that computes the
+    kernel matrix over the whole dataset once per kernel configuration,
+    rather than once per split and candidate. Each split then uses the
+    relevant rows and columns of that matrix.
+
+    With `warm_start=True` the values of C for each kernel are instead
+    fit in increasing order by `WarmStartSVC`, each starting from the
+    previous solution. The selected parameters are still intended for
+    PrecomputedSVC or `precomputed_svc()`.
+
+    Args:
+    -----
+    x: numpy.ndarray
+        The 2-D data matrix.
+    y: numpy.ndarray
+        The labels for x.
+    param_grid: dict
+        Parameter grid for PrecomputedSVC. Kernel parameters (kernel,
+        degree, gamma, coef0) determine the kernel matrices computed,
+        all other parameters are searched for each kernel matrix.
+    cv: BaseCrossValidator
+        The cross-validation splitter.
+    groups: numpy.ndarray, optional
+        Groups used by some cross-validation splitters.
+    scoring: str or callable
+        Scoring used to select the best parameters.
+    sample_weight: numpy.ndarray, optional
+        Sample weights passed to SVC.fit().
+    cache_dir: pathlike or str, optional
+        Directory in which to cache kernel matrices. See
+        `gram_matrix()`.
+    n_jobs: int, optional
+        Number of jobs for each inner grid search.
+    verbose: int
+        Verbosity level.
+    warm_start: bool
+        Whether to follow warm-started regularisation paths over C
+        rather than fitting each value of C from scratch.
+
+    Returns:
+    --------
+    best_params: dict
+        The best parameter combination, which can be given to
+        PrecomputedSVC or `precomputed_svc()`.
+    cv_results: dict
+        Combined results for all parameter combinations, in the same
+        format as `GridSearchCV.cv_results_`.
+    """
+    kernel_grid, svc_grid = _split_kernel_params(param_grid)
+    splits = list(cv.split(x, y, groups))
+    fit_params = {}
+    if sample_weight is not None:
+        fit_params['sample_weight'] = sample_weight
+
+    results = defaultdict(list)
+    for kernel_params in ParameterGrid(kernel_grid):
+        gram = gram_matrix(x, **kernel_params, cache_dir=cache_dir)
+        if warm_start:
+            kernel_results = _c_path_search(
+                gram, y, splits, svc_grid, scoring, sample_weight,
+                n_jobs=n_jobs, verbose=verbose
+            )
+        else:
+            search = GridSearchCV(SVC(kernel='precomputed'), svc_grid,
+                                  cv=splits, scoring=scoring, n_jobs=n_jobs,
+                                  verbose=verbose)
+            search.fit(gram, y, **fit_params)
+            kernel_results = search.cv_results_
+        for k, v in kernel_results.items():
+            if k == 'params':
+                results[k].extend({**kernel_params, **p} for p in v)
+            elif not k.startswith('param_') and not k.startswith('rank_'):
+                results[k].extend(v)
+
+    cv_results = {k: np.array(v) for k, v in results.items() if k != 'params'}
+    cv_results['params'] = results['params']
+    for name in sorted(set(k for p in cv_results['params'] for k in p)):
+        cv_results['param_' + name] = np.ma.masked_array(
+            [p.get(name) for p in cv_results['params']],
+            mask=[name not in p for p in cv_results['params']], dtype=object
+        )
+    for k in list(cv_results):
+        if k.startswith('mean_test_'):
+            scores = cv_results[k]
+            # Same ranking as GridSearchCV, ties get the lowest rank.
+            cv_results['rank_' + k[5:]] = np.searchsorted(
+                np.sort(-scores), -scores) + 1
+    best = int(np.argmax(cv_results['mean_test_score']))
+    return cv_results['params'][best], cv_results
 
 
 class Classifier(abc.ABC):
@@ -322,20 +570,177 @@ def cross_corpus_cross_validation(clf: Classifier,
     return df
 
 
+def _cross_validate_fold(estimator, x, y, groups, split, fold, scoring,
+                         fit_params, checkpoint):
+    scores = cross_validate(clone(estimator), x, y, groups=groups,
+                            cv=[split], scoring=scoring, fit_params=fit_params)
+    result = {k: v[0] for k, v in scores.items()}
+    if checkpoint is not None:
+        # Saved in the worker so that each fold is persisted as soon as
+        # it finishes.
+        checkpoint.save(fold, result)
+    return result
+
+
+def cross_validate_checkpoint(estimator: BaseEstimator,
+                              x: np.ndarray,
+                              y: np.ndarray,
+                              groups: Optional[np.ndarray] = None,
+                              cv: BaseCrossValidator = KFold(10),
+                              scoring=None,
+                              fit_params: Optional[Dict[str, Any]] = None,
+                              checkpoint: Optional[FoldCheckpoint] = None,
+                              n_jobs: Optional[int] = None,
+                              verbose: int = 0) -> Dict[str, np.ndarray]:
+    """Equivalent to scikit-learn's `cross_validate()`, except that the
+    result of each fold is stored in `checkpoint` as soon as it is
+    computed, and folds that already have a stored result are not
+    recomputed.
+
+    Args:
+    -----
+    estimator: BaseEstimator
+        The estimator to cross-validate. It is cloned for each fold.
+    x: numpy.ndarray
+        The data matrix.
+    y: numpy.ndarray
+        The labels for x.
+    groups: numpy.ndarray, optional
+        Groups used by some cross-validation splitters.
+    cv: BaseCrossValidator
+        The cross-validation splitter. The splits must be deterministic
+        for results to be resumed correctly.
+    scoring: str, callable, list or dict, optional
+        Scoring, as for `cross_validate()`.
+    fit_params: dict, optional
+        Parameters passed to the estimator's `fit()` method.
+    checkpoint: FoldCheckpoint, optional
+        Where to store and look up fold results. If not given, this is
+        identical to `cross_validate()`.
+    n_jobs: int, optional
+        Number of folds to compute in parallel.
+    verbose: int
+        Verbosity level.
+
+    Returns:
+    --------
+    scores: dict
+        A dictionary of arrays of per-fold scores and timings, as
+        returned by `cross_validate()`.
+    """
+    splits = list(cv.split(x, y, groups))
+    results = {}
+    if checkpoint is not None:
+        results = checkpoint.load_all(len(splits))
+        if len(results) > 0:
+            print("Loaded {}/{} folds from checkpoint.".format(
+                len(results), len(splits)))
+    todo = [i for i in range(len(splits)) if i not in results]
+    new_results = Parallel(n_jobs=n_jobs, verbose=verbose)(
+        delayed(_cross_validate_fold)(
+            estimator, x, y, groups, splits[i], i, scoring, fit_params,
+            checkpoint
+        ) for i in todo
+    )
+    results.update(zip(todo, new_results))
+
+    keys = results[0].keys()
+    return {k: np.array([results[i][k] for i in range(len(splits))])
+            for k in keys}
+
+
+def _one_vs_rest_fits(model_fn, candidates: List[Dict[str, Any]],
+                      x: np.ndarray, grams: Dict[str, np.ndarray]) \
+        -> List[Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]]:
+    """Returns, for each parameter candidate, a function that fits a
+    model on (y, train) and predicts for test. PrecomputedSVC candidates
+    use the shared kernel matrices in grams, which are computed as
+    needed.
+    """
+    fits = []
+    for params in candidates:
+        clf = model_fn(**params)
+        if not isinstance(clf, PrecomputedSVC):
+            def fit(y, train, test, clf=clf):
+                clf = clone(clf).fit(x[train], y[train])
+                return clf.predict(x[test])
+            fits.append(fit)
+            continue
+
+        kernel_params, svc_params = _split_kernel_params(
+            clf.get_params(deep=False))
+        key = repr(sorted(kernel_params.items()))
+        if key not in grams:
+            grams[key] = gram_matrix(x, **kernel_params)
+
+        def fit(y, train, test, gram=grams[key], svc_params=svc_params):
+            clf = SVC(kernel='precomputed', **svc_params)
+            clf.fit(gram[np.ix_(train, train)], y[train])
+            return clf.predict(gram[np.ix_(test, train)])
+        fits.append(fit)
+    return fits
+
+
+def _one_vs_rest_class(fits, y: np.ndarray, splits) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """Runs the binary task given by y on each rep and fold, choosing
+    the candidate with the best recall on each fold.
+    """
+    prec = np.empty((len(splits), len(splits[0])))
+    rec = np.empty_like(prec)
+    for rep, rep_splits in enumerate(splits):
+        for fold, (train, test) in enumerate(rep_splits):
+            max_score = -1
+            for fit in fits:
+                y_pred = fit(y, train, test)
+                score = recall_score(y[test], y_pred)
+                if score > max_score:
+                    max_score = score
+                    best_pred = y_pred
+            prec[rep, fold] = precision_score(y[test], best_pred)
+            rec[rep, fold] = max_score
+    return prec, rec
+
+
 def test_one_vs_rest(model_fn,
                      dataset: LabelledDataset,
                      gender: str = 'all',
                      reps: int = 1,
-                     param_grid: Optional[Dict[str, Any]] = None,
-                     splitter: BaseCrossValidator = KFold(10)) -> pd.DataFrame:
-    labels = sorted([x[:3] for x in dataset.classes])
+                     param_grid: Optional[Iterable[Dict[str, Any]]] = None,
+                     splitter: BaseCrossValidator = KFold(10),
+                     max_workers: Optional[int] = None) -> pd.DataFrame:
+    """Tests binary classification of each class against all others.
 
-    rec = pd.DataFrame(
-        index=pd.RangeIndex(splitter.get_n_splits(
-            dataset.x, dataset.labels[0], dataset.speaker_indices)),
-        columns=pd.MultiIndex.from_product(
-            [['prec', 'rec'], labels, list(range(reps))],
-            names=['metric', 'class', 'rep']))
+    The splits for each rep are computed once and shared between all
+    classes, as are kernel matrices when model_fn gives a
+    PrecomputedSVC. The binary tasks for each class are run in
+    parallel.
+
+    Args:
+    -----
+    model_fn: callable
+        A function or class that creates a classifier from keyword
+        parameters.
+    dataset: LabelledDataset
+        The dataset to use.
+    gender: str
+        One of 'all', 'male' or 'female', to select instances.
+    reps: int
+        The number of repetitions.
+    param_grid: iterable of dict, optional
+        Parameter combinations to give to model_fn. On each fold, the
+        combination with the highest recall is used.
+    splitter: BaseCrossValidator
+        The cross-validation splitter.
+    max_workers: int, optional
+        The number of threads. Default is the number of available CPUs.
+
+    Returns:
+    --------
+    df: pandas.DataFrame
+        The precision and recall of each class, indexed by fold, with
+        columns (metric, class, rep).
+    """
     if gender == 'male':
         gender_indices = dataset.male_indices
     elif gender == 'female':
@@ -345,27 +750,34 @@ def test_one_vs_rest(model_fn,
 
     groups = dataset.speaker_indices[gender_indices]
     x = dataset.x[gender_indices]
-    for cls in dataset.classes:
-        y = dataset.labels[cls][gender_indices]
-        for rep in range(reps):
-            for fold, (train, test) in enumerate(
-                    splitter.split(x, y, groups)):
-                x_train, y_train = x[train], y[train]
-                x_test, y_test = x[test], y[test]
-
-                if param_grid:
-                    classifier = optimise_params(
-                        param_grid, model_fn, recall_score, x_train, y_train,
-                        x_test, y_test
-                    )
-                else:
-                    classifier = model_fn()
-
-                y_pred = classifier.predict(x_test)
-                rec[('prec', cls[:3], rep)][fold] = precision_score(y_test,
-                                                                    y_pred)
-                rec[('rec', cls[:3], rep)][fold] = recall_score(y_test, y_pred)
-    return rec
+    y = dataset.y[gender_indices]
+    splits = [list(splitter.split(x, y, groups)) for _ in range(reps)]
+
+    candidates = list(param_grid) if param_grid else [{}]
+    fits = _one_vs_rest_fits(model_fn, candidates, x, {})
+
+    labels = sorted([c[:3] for c in dataset.classes])
+    df = pd.DataFrame(
+        index=pd.RangeIndex(len(splits[0])),
+        columns=pd.MultiIndex.from_product(
+            [['prec', 'rec'], labels, list(range(reps))],
+            names=['metric', 'class', 'rep']))
+
+    if max_workers is None:
+        try:
+            max_workers = len(os.sched_getaffinity(0))
+        except AttributeError:  # sched_getaffinity is only on Unix
+            max_workers = os.cpu_count()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = pool.map(
+            lambda c: _one_vs_rest_class(fits, (y == c).astype(int), splits),
+            range(len(dataset.classes))
+        )
+        for cls, (prec, rec) in zip(dataset.classes, results):
+            for rep in range(reps):
+                df.loc[:, ('prec', cls[:3], rep)] = prec[rep]
+                df.loc[:, ('rec', cls[:3], rep)] = rec[rep]
+    return df
 
 
 def _test_one_param(params, cls, score_fn, x_train, y_train, x_valid, y_valid):
@@ -0,0 +1,52 @@
+"""The `emotion-recognition` command line interface.
+
+Subcommands are listed here by module and only imported when they are
+used, and each subcommand imports its heavy dependencies when it runs,
+so that `--help` and simple metadata commands start quickly.
+"""
+
+import importlib
+from typing import List, Mapping, Optional
+
+import click
+
+__all__ = ['LazyGroup', 'main']
+
+COMMANDS = {
+    'corpora': 'emotion_recognition.cli.corpora:corpora',
+    'folds': 'emotion_recognition.cli.folds:folds',
+    'index': 'emotion_recognition.cli.index:index',
+    'info': 'emotion_recognition.cli.info:info'
+}
+
+
+class LazyGroup(click.Group):
+    """A click group with subcommands given as 'module:attribute'
+    strings, which are imported when the subcommand is first used.
+
+    Args:
+    -----
+    lazy_commands: dict
+        Mapping from subcommand name to 'module:attribute'.
+    """
+    def __init__(self, *args,
+                 lazy_commands: Optional[Mapping[str, str]] = None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = dict(lazy_commands or {})
+
+    def list_commands(self, ctx: click.Context) -> List[str]:
+        return sorted(set(super().list_commands(ctx))
+                      | set(self.lazy_commands))
+
+    def get_command(self, ctx: click.Context,
+                    cmd_name: str) -> Optional[click.Command]:
+        if cmd_name in self.lazy_commands:
+            module, attr = self.lazy_commands[cmd_name].split(':')
+            return getattr(importlib.import_module(module), attr)
+        return super().get_command(ctx, cmd_name)
+
+
+@click.group(cls=LazyGroup, lazy_commands=COMMANDS)
+def main():
+    """Tools for emotion recognition datasets and models."""
@@ -0,0 +1,20 @@
+"""Lists the corpora with known metadata."""
+
+import click
+
+
+@click.command()
+@click.option('--speakers', is_flag=True,
+              help="Also list the speakers of each corpus.")
+def corpora(speakers: bool):
+    """Lists the corpora with known metadata."""
+    from ..corpora import corpora as corpus_info
+
+    for name, info in sorted(corpus_info.items()):
+        line = '{}: {} speakers'.format(name, len(info.speakers))
+        if hasattr(info, 'emotion_map'):
+            line += ', classes: {}'.format(
+                ', '.join(sorted(set(info.emotion_map.values()))))
+        click.echo(line)
+        if speakers:
+            click.echo('\t{}'.format(' '.join(info.speakers)))
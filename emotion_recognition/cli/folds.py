@@ -0,0 +1,31 @@
+"""Writes a manifest of speaker cross-validation folds."""
+
+from pathlib import Path
+
+import click
+
+
+@click.command()
+@click.argument('input_list', type=click.Path(exists=True, dir_okay=False,
+                                              path_type=Path))
+@click.argument('output', type=click.Path(dir_okay=False, path_type=Path))
+@click.option('--corpus', required=True, help="Corpus of the clips.")
+@click.option('--annotations', required=True,
+              type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              help="Annotations file.")
+def folds(input_list: Path, output: Path, corpus: str, annotations: Path):
+    """Assigns the clips listed in INPUT_LIST to one fold per speaker
+    and writes the fold manifest to OUTPUT.
+    """
+    from ..dataset import (get_audio_paths,
+                           parse_classification_annotations)
+    from ..folds import speaker_fold_entries, write_fold_manifest
+
+    entries = speaker_fold_entries(
+        get_audio_paths(input_list), corpus,
+        parse_classification_annotations(annotations)
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    write_fold_manifest(output, entries)
+    click.echo("Wrote {} clips in {} folds to {}".format(
+        len(entries), len(set(x.fold for x in entries)), output))
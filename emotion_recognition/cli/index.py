@@ -0,0 +1,43 @@
+"""Builds or updates an index of audio file metadata."""
+
+import time
+from pathlib import Path
+from typing import Tuple
+
+import click
+
+
+@click.command()
+@click.argument('input', nargs=-1, required=True,
+                type=click.Path(exists=True, path_type=Path))
+@click.option('--output', required=True, type=click.Path(path_type=Path),
+              help="Index file.")
+@click.option('--ext', default='wav',
+              help="Extension of audio files in directories.")
+@click.option('--jobs', type=int, default=-1,
+              help="Number of threads to use.")
+@click.option('--prune', is_flag=True,
+              help="Remove files from the index that weren't found.")
+def index(input: Tuple[Path], output: Path, ext: str, jobs: int,
+          prune: bool):
+    """Indexes the audio files in INPUT, which are directories or files
+    containing lists of audio files.
+    """
+    from ..audio_index import AudioIndex
+    from ..dataset import get_audio_paths
+
+    paths = []
+    for path in input:
+        if path.is_dir():
+            paths.extend(sorted(path.glob('**/*.{}'.format(ext))))
+        else:
+            paths.extend(get_audio_paths(path))
+
+    start_time = time.perf_counter()
+    audio_index = AudioIndex(output)
+    n_indexed = len(audio_index.table)
+    info = audio_index.update(paths, n_jobs=jobs, prune=prune)
+    audio_index.save()
+    click.echo("Indexed {} files ({} previously) in {:.2f}s".format(
+        len(info), n_indexed, time.perf_counter() - start_time))
+    click.echo("Total duration: {:.1f}s".format(info['duration'].sum()))
@@ -0,0 +1,20 @@
+"""Prints a summary of a dataset."""
+
+from pathlib import Path
+
+import click
+
+
+@click.command()
+@click.argument('path', type=click.Path(dir_okay=False, resolve_path=True,
+                                        path_type=Path))
+@click.option('--labels/--no-labels', default=True,
+              help="Whether the dataset has labels.")
+def info(path: Path, labels: bool):
+    """Prints a summary of the dataset at PATH. Only the libraries
+    needed for the dataset's format are loaded.
+    """
+    from ..dataset import Dataset, LabelledDataset
+
+    dataset = LabelledDataset(path) if labels else Dataset(path)
+    click.echo(str(dataset), nl=False)
@@ -4,25 +4,28 @@ import warnings
 from collections import Counter
 from os import PathLike
 from pathlib import Path
-from typing import (Collection, Dict, List, Mapping, Optional, Sequence, Set,
-                    Tuple, Union)
+from typing import (TYPE_CHECKING, Collection, Dict, List, Mapping, Optional,
+                    Sequence, Set, Tuple, Union)
 
-import arff
-import netCDF4
 import numpy as np
-import pandas as pd
-import soundfile
-from sklearn.base import TransformerMixin
-from sklearn.preprocessing import StandardScaler, label_binarize
 
 from .binary_arff import decode as decode_arff
 from .corpora import corpora
+from .segments import Segment, read_segment_manifest, read_segments
 from .utils import clip_arrays, frame_arrays, pad_arrays, transpose_time
 
+# netCDF4, pandas, scikit-learn and liac-arff are imported where they are
+# used, so that importing this module is fast.
+if TYPE_CHECKING:
+    import netCDF4
+    from sklearn.base import TransformerMixin
+
 
 def parse_regression_annotations(filename: Union[PathLike, str]) \
         -> Dict[str, Dict[str, float]]:
     """Returns a dict of the form {'name': {'v1': v1, ...}}."""
+    import pandas as pd
+
     df = pd.read_csv(filename, index_col=0)
     annotations = df.to_dict(orient='index')
     return annotations
@@ -31,6 +34,8 @@ def parse_regression_annotations(filename: Union[PathLike, str]) \
 def parse_classification_annotations(filename: Union[PathLike, str]) \
         -> Dict[str, str]:
     """Returns a dict of the form {'name': emotion}."""
+    import pandas as pd
+
     df = pd.read_csv(filename, index_col=0)
     annotations = df.to_dict()[df.columns[0]]
     return annotations
@@ -58,46 +63,53 @@ def get_audio_paths(file: Union[PathLike, str]) -> Sequence[Path]:
     return paths
 
 
-def write_netcdf_dataset(path: Union[PathLike, str],
-                         names: List[str],
-                         features: np.ndarray,
-                         slices: List[int],
-                         corpus: str = '',
-                         annotations: Optional[np.ndarray] = None,
-                         annotation_path: Optional[Union[PathLike, str]] = None,  # noqa
-                         annotation_type: str = 'classification'):
-    """Writes a netCDF4 dataset to the given path. The dataset should
-    contain features and annotations. Note that the features matrix has
-    to be 2-D, and can either be a vector per instance, or a sequence of
-    vectors per instance. Also note that this cannot represent the
-    spectrograms in the format required by auDeep, since that is a 3-D
-    matrix of one spectrogram per instance.
+def get_audio_segments(file: Union[PathLike, str]) -> List[Segment]:
+    """Given a path to either a file containing a list of audio files,
+    or a segment manifest CSV file, returns a list of audio segments.
+    Each file in a list of audio files is a single segment.
 
     Args:
     -----
-    path: pathlike or str
-        The path to write the dataset.
-    corpus: str
-        The corpus name
-    names: list of str
-        A list of instance names.
-    features: ndarray
-        A features matrix of shape (length, n_features).
-    slices: list of int
-        The size of each slice along axis 0 of features. If there is one
-        vector per instance, then this will be all 1's, otherwise will
-        have the length of the sequence corresponding to each instance.
-    annotations: np.ndarray, optional
-        Annotations obtained elsewhere.
-    annotation_path: pathlike or str, optional
-        The path to an annotation file.
-    annotation_type: str
-        The type of annotations, one of {regression, classification}.
+    file: pathlike or str
+        Path to a list of audio clips, or to a segment manifest, which
+        must have a .csv extension.
+
+    Returns:
+    --------
+        List of segments.
     """
+    if Path(file).suffix == '.csv':
+        return read_segment_manifest(file)
+    return [Segment.from_file(p) for p in get_audio_paths(file)]
+
+
+def create_netcdf_dataset(path: Union[PathLike, str],
+                          names: List[str],
+                          n_features: int,
+                          slices: List[int],
+                          corpus: str = '',
+                          annotations: Optional[np.ndarray] = None,
+                          annotation_path: Optional[Union[PathLike, str]] = None,  # noqa
+                          annotation_type: str = 'classification',
+                          chunk_size: Optional[int] = None) \
+        -> 'netCDF4.Dataset':
+    """Creates a netCDF4 dataset in the same format as
+    `write_netcdf_dataset()`, with names and annotations, but doesn't
+    write the features. This allows features to be written in batches
+    to the 'features' variable, of shape (sum(slices), n_features),
+    instead of all being held in memory. The dataset is returned open
+    and must be closed by the caller.
+
+    See `write_netcdf_dataset()` for a description of the other
+    arguments. If chunk_size is given, the features are stored in
+    chunks of that many rows, rather than contiguously.
+    """
+    import netCDF4
+
     dataset = netCDF4.Dataset(path, 'w')
     dataset.createDimension('instance', len(names))
-    dataset.createDimension('concat', features.shape[0])
-    dataset.createDimension('features', features.shape[1])
+    dataset.createDimension('concat', sum(slices))
+    dataset.createDimension('features', n_features)
 
     _slices = dataset.createVariable('slices', int, ('instance',))
     _slices[:] = slices
@@ -123,7 +135,7 @@ def write_netcdf_dataset(path: Union[PathLike, str],
                                      json.dumps(['label_nominal']))
     elif annotations is not None:
         if annotation_type == 'regression':
-            for k, arr in annotations:
+            for k, arr in annotations.items():
                 var = dataset.createVariable(k, np.float32, ('instance',))
                 var[:] = arr
             dataset.setncattr_string(
@@ -141,16 +153,160 @@ def write_netcdf_dataset(path: Union[PathLike, str],
         dataset.setncattr_string('annotation_vars',
                                  json.dumps(['label_nominal']))
 
-    _features = dataset.createVariable('features', np.float32,
-                                       ('concat', 'features'))
-    _features[:, :] = features
-
+    chunksizes = None
+    if chunk_size is not None:
+        chunksizes = (min(chunk_size, max(sum(slices), 1)), n_features)
+    dataset.createVariable('features', np.float32, ('concat', 'features'),
+                           chunksizes=chunksizes)
     dataset.setncattr_string('feature_dims',
                              json.dumps(['concat', 'features']))
     dataset.setncattr_string('corpus', corpus)
+    return dataset
+
+
+def write_netcdf_dataset(path: Union[PathLike, str],
+                         names: List[str],
+                         features: np.ndarray,
+                         slices: List[int],
+                         corpus: str = '',
+                         annotations: Optional[np.ndarray] = None,
+                         annotation_path: Optional[Union[PathLike, str]] = None,  # noqa
+                         annotation_type: str = 'classification'):
+    """Writes a netCDF4 dataset to the given path. The dataset should
+    contain features and annotations. Note that the features matrix has
+    to be 2-D, and can either be a vector per instance, or a sequence of
+    vectors per instance. Also note that this cannot represent the
+    spectrograms in the format required by auDeep, since that is a 3-D
+    matrix of one spectrogram per instance.
+
+    Args:
+    -----
+    path: pathlike or str
+        The path to write the dataset.
+    corpus: str
+        The corpus name
+    names: list of str
+        A list of instance names.
+    features: ndarray
+        A features matrix of shape (length, n_features).
+    slices: list of int
+        The size of each slice along axis 0 of features. If there is one
+        vector per instance, then this will be all 1's, otherwise will
+        have the length of the sequence corresponding to each instance.
+    annotations: np.ndarray, optional
+        Annotations obtained elsewhere.
+    annotation_path: pathlike or str, optional
+        The path to an annotation file.
+    annotation_type: str
+        The type of annotations, one of {regression, classification}.
+    """
+    dataset = create_netcdf_dataset(
+        path, names, features.shape[1], slices, corpus=corpus,
+        annotations=annotations, annotation_path=annotation_path,
+        annotation_type=annotation_type
+    )
+    dataset.variables['features'][:, :] = features
     dataset.close()
 
 
+def concat_netcdf_datasets(paths: Sequence[Union[PathLike, str]],
+                           output: Union[PathLike, str],
+                           concat_dims: Collection[str] = ('instance',
+                                                           'concat'),
+                           corpus: Optional[str] = None,
+                           compression: Optional[int] = None,
+                           block_bytes: int = 64 * 2**20):
+    """Concatenates netCDF4 datasets with the same variables, such as
+    those written by `write_netcdf_dataset()` or auDeep spectrogram
+    datasets. The output variables are created at their full size and
+    the inputs are copied into them block by block, so only one block is
+    held in memory at a time.
+
+    Args:
+    -----
+    paths: list of pathlike or str
+        The input datasets.
+    output: pathlike or str
+        The output dataset.
+    concat_dims: list of str
+        The dimensions to concatenate along. Variables whose first
+        dimension is one of these are concatenated, and all other
+        dimensions must be the same size in all inputs.
+    corpus: str, optional
+        The corpus name of the output. Default is that of the first
+        input.
+    compression: int, optional
+        If given, numeric variables are compressed with zlib at this
+        level, from 1 to 9.
+    block_bytes: int
+        The approximate size of each block copied.
+    """
+    import netCDF4
+
+    inputs = [netCDF4.Dataset(str(p)) for p in paths]
+    try:
+        first = inputs[0]
+        for data in inputs[1:]:
+            if set(data.variables) != set(first.variables):
+                raise ValueError("All datasets must have the same "
+                                 "variables.")
+            for name, dim in first.dimensions.items():
+                if (name not in concat_dims
+                        and len(data.dimensions[name]) != len(dim)):
+                    raise ValueError("Size of dimension {} must match in all "
+                                     "datasets.".format(name))
+
+        dataset = netCDF4.Dataset(str(output), 'w')
+        for name, dim in first.dimensions.items():
+            size = len(dim)
+            if name in concat_dims:
+                size = sum(len(x.dimensions[name]) for x in inputs)
+            dataset.createDimension(name, None if dim.isunlimited() else size)
+        for k in first.ncattrs():
+            value = first.getncattr(k)
+            if isinstance(value, str):
+                dataset.setncattr_string(k, value)
+            else:
+                dataset.setncattr(k, value)
+        if corpus is not None:
+            dataset.setncattr_string('corpus', corpus)
+
+        for name, var in first.variables.items():
+            attrs = {k: var.getncattr(k) for k in var.ncattrs()}
+            fill_value = attrs.pop('_FillValue', None)
+            numeric = var.dtype is not str
+            out = dataset.createVariable(
+                name, var.datatype if numeric else str, var.dimensions,
+                zlib=numeric and compression is not None,
+                complevel=compression or 4, fill_value=fill_value
+            )
+            out.setncatts(attrs)
+
+            concat = (len(var.dimensions) > 0
+                      and var.dimensions[0] in concat_dims)
+            if not concat:
+                if var.size > 0:
+                    out[...] = var[...]
+                continue
+            row_bytes = max(var.dtype.itemsize if numeric else 64, 1)
+            row_bytes *= int(np.prod(var.shape[1:]))
+            block = max(block_bytes // max(row_bytes, 1), 1)
+            pos = 0
+            for data in inputs:
+                src = data.variables[name]
+                if src.size == 0:
+                    pos += len(src)
+                    continue
+                for start in range(0, len(src), block):
+                    end = min(start + block, len(src))
+                    out[pos + start:pos + end] = src[start:end]
+                pos += len(src)
+        dataset.close()
+    finally:
+        for data in inputs:
+            data.close()
+
+
 def _make_flat(a: np.ndarray) -> Tuple[np.ndarray, List[int]]:
     """Flattens an array of variable-length sequences."""
     slices = [x.shape[0] for x in a]
@@ -236,6 +392,8 @@ class NetCDFBackend(DatasetBackend):
     is modified from the format used by the auDeep toolkit.
     """
     def __init__(self, path: Union[PathLike, str]):
+        import netCDF4
+
         dataset = netCDF4.Dataset(path)
         if not hasattr(dataset, 'corpus'):
             raise AttributeError(
@@ -257,19 +415,17 @@ class NetCDFBackend(DatasetBackend):
 
 
 class RawAudioBackend(DatasetBackend):
-    """Backend that uses audio clip filepaths from a file and loads the
-    audio as raw data.
+    """Backend that uses audio clip filepaths from a file, or segments
+    from a segment manifest, and loads the audio as raw data.
     """
     def __init__(self, path: Union[PathLike, str]) -> None:
         path = Path(path)
         self.feature_names.append('pcm')
 
-        filepaths = get_audio_paths(path)
-        self._features = np.empty(len(filepaths), dtype=object)
-        for i, filepath in enumerate(filepaths):
-            self.names.append(filepath.stem)
-            audio, _ = soundfile.read(filepath, always_2d=True,
-                                      dtype='float32')
+        segments = get_audio_segments(path)
+        self._features = np.empty(len(segments), dtype=object)
+        for i, (audio, _) in enumerate(read_segments(segments)):
+            self.names.append(segments[i].name)
             self.features[i] = audio
 
         # We assume the file list is at the root of the dataset directory
@@ -291,6 +447,8 @@ class ARFFBackend(DatasetBackend):
             with open(path, 'rb') as fid:
                 data = decode_arff(fid)
         else:
+            import arff
+
             with open(path) as fid:
                 data = arff.load(fid)
 
@@ -301,9 +459,9 @@ class ARFFBackend(DatasetBackend):
         self._names = list(counts.keys())
 
         x = np.array([x[1:-1] for x in data['data']])
-        slices = np.array(counts.values())
+        slices = np.array(list(counts.values()))
         self._features = _reshape_data_array(x, slices)
-        self._labels = list(dict.fromkeys(x[-1] for x in data['data']).keys())
+        self._labels = list({x[0]: x[-1] for x in data['data']}.values())
 
 
 class Dataset(abc.ABC):
@@ -311,10 +469,13 @@ class Dataset(abc.ABC):
         path = Path(path)
         if path.suffix == '.nc':
             self.backend = NetCDFBackend(path)
-        elif path.suffix == '.txt':
+        elif path.suffix in {'.txt', '.csv'}:
             self.backend = RawAudioBackend(path)
         elif path.suffixes[0] == '.arff':
             self.backend = ARFFBackend(path)
+        elif path.suffix == '.tfrecord':
+            from .tensorflow.dataset import TFRecordBackend
+            self.backend = TFRecordBackend(path)
         else:
             raise NotImplementedError('Unknown filetype.')
 
@@ -358,12 +519,15 @@ class Dataset(abc.ABC):
         self._speaker_group_indices = speaker_indices_to_group[
             self.speaker_indices]
 
-    def normalise(self, normaliser: TransformerMixin = StandardScaler(),
+    def normalise(self, normaliser: Optional['TransformerMixin'] = None,
                   scheme: str = 'speaker'):
         """Transforms the X data matrix of this dataset using some
         normalisation method. I think in theory this should be
-        idempotent.
+        idempotent. The default normaliser is StandardScaler.
         """
+        if normaliser is None:
+            from sklearn.preprocessing import StandardScaler
+            normaliser = StandardScaler()
         fqn = '{}.{}'.format(normaliser.__class__.__module__,
                              normaliser.__class__.__name__)
         print("Normalising dataset with scheme '{}' using {}.".format(scheme,
@@ -534,6 +698,8 @@ class LabelledDataset(Dataset):
         """Creates a N x C array of binary values B, where B[i, j] is 1
         if instance i belongs to class j, and 0 otherwise.
         """
+        from sklearn.preprocessing import label_binarize
+
         self.binary_y = label_binarize(self.y, np.arange(self.n_classes))
         self._labels.update(
             {c: self.binary_y[:, i] for c, i in enumerate(self.classes)})
@@ -691,8 +857,11 @@ class CombinedDataset(LabelledDataset):
         other_idx = np.nonzero(~cond)[0]
         return corpus_idx, other_idx
 
-    def normalise(self, normaliser: TransformerMixin = StandardScaler(),
+    def normalise(self, normaliser: Optional['TransformerMixin'] = None,
                   scheme: str = 'speaker'):
+        if normaliser is None:
+            from sklearn.preprocessing import StandardScaler
+            normaliser = StandardScaler()
 
         if scheme == 'corpus':
             fqn = '{}.{}'.format(normaliser.__class__.__module__,
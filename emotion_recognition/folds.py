@@ -0,0 +1,112 @@
+"""Speaker-independent cross-validation folds. Fold i holds the
+instances of speaker i of the corpus, numbered from 1, so folds can be
+used directly from a dataset's speaker indices, or stored as a fold
+manifest rather than as copies of the audio.
+
+A fold manifest is a CSV file with columns 'fold', 'emotion' and
+'path', one row per clip.
+"""
+
+import csv
+from os import PathLike
+from pathlib import Path
+from typing import (Iterable, Iterator, List, Mapping, NamedTuple, Sequence,
+                    Tuple, Union)
+
+import numpy as np
+from sklearn.model_selection import BaseCrossValidator
+
+from .corpora import corpora
+
+__all__ = ['SpeakerFoldSplitter', 'FoldEntry', 'speaker_fold_entries',
+           'read_fold_manifest', 'write_fold_manifest']
+
+
+class SpeakerFoldSplitter(BaseCrossValidator):
+    """Cross-validator with one test fold per speaker, in the order of
+    speaker index. Speakers with no instances give no fold. The groups
+    passed to `split()` are speaker indices, e.g.
+    `Dataset.speaker_indices`.
+    """
+    def _iter_test_indices(self, X=None, y=None, groups=None):
+        if groups is None:
+            raise ValueError("The 'groups' parameter should not be None.")
+        groups = np.asarray(groups)
+        for speaker in np.unique(groups):
+            yield np.flatnonzero(groups == speaker)
+
+    def get_n_splits(self, X=None, y=None, groups=None) -> int:
+        if groups is None:
+            raise ValueError("The 'groups' parameter should not be None.")
+        return len(np.unique(groups))
+
+    def fold_names(self, groups: np.ndarray) -> List[str]:
+        """Names of the folds given by `split()`, e.g. 'fold_3' for the
+        speaker with index 2.
+        """
+        return ['fold_{:d}'.format(i + 1) for i in np.unique(groups)]
+
+    def folds(self, groups: np.ndarray) \
+            -> Iterator[Tuple[str, np.ndarray]]:
+        """Yields the name and test indices of each fold."""
+        names = self.fold_names(groups)
+        for name, test in zip(names, self._iter_test_indices(groups=groups)):
+            yield name, test
+
+
+class FoldEntry(NamedTuple):
+    """A clip assigned to a cross-validation fold."""
+    fold: str
+    emotion: str
+    path: Path
+
+
+def speaker_fold_entries(paths: Sequence[Path], corpus: str,
+                         annotations: Mapping[str, str]) -> List[FoldEntry]:
+    """Assigns each clip of a corpus to the fold of its speaker.
+
+    Args:
+    -----
+    paths: list of Path
+        The audio clips, named by instance name.
+    corpus: str
+        The corpus the clips belong to.
+    annotations: dict
+        Mapping from instance name to emotion.
+
+    Returns:
+    --------
+    entries: list of FoldEntry
+        The fold, emotion and path of each clip, ordered by fold.
+    """
+    get_speaker = corpora[corpus].get_speaker
+    speakers = corpora[corpus].speakers
+    speaker_indices = np.array(
+        [speakers.index(get_speaker(p.stem)) for p in paths], dtype=int)
+    entries = []
+    for fold, test in SpeakerFoldSplitter().folds(speaker_indices):
+        for i in test:
+            entries.append(FoldEntry(fold, annotations[paths[i].stem],
+                                     paths[i]))
+    return entries
+
+
+def read_fold_manifest(file: Union[PathLike, str]) -> List[FoldEntry]:
+    """Reads a fold manifest. Relative paths are relative to the
+    manifest.
+    """
+    file = Path(file)
+    with open(file, newline='') as fid:
+        return [FoldEntry(row['fold'], row['emotion'],
+                          file.parent / row['path'])
+                for row in csv.DictReader(fid)]
+
+
+def write_fold_manifest(file: Union[PathLike, str],
+                        entries: Iterable[FoldEntry]):
+    """Writes a fold manifest."""
+    with open(file, 'w', newline='') as fid:
+        writer = csv.writer(fid)
+        writer.writerow(['fold', 'emotion', 'path'])
+        for entry in entries:
+            writer.writerow([entry.fold, entry.emotion, str(entry.path)])
@@ -0,0 +1,212 @@
+"""Functionals of LLD sequences, computed for all instances at once with
+segment reductions over the concatenated LLD matrix, as stored in
+netCDF datasets. This gives the same features as openSMILE's
+cFunctionals, without processing the audio again.
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+__all__ = ['FUNCTIONAL_SETS', 'segment_functionals']
+
+# The IS09 set is in the order openSMILE outputs it, so that
+# logmel_IS09_func can be derived from logmel.
+FUNCTIONAL_SETS = {
+    'is09': ['max', 'min', 'range', 'maxPos', 'minPos', 'amean',
+             'linregc1', 'linregc2', 'linregerrQ', 'stddev', 'skewness',
+             'kurtosis'],
+    'default': ['amean', 'stddev', 'skewness', 'kurtosis', 'min', 'max',
+                'range', 'minPos', 'maxPos', 'percentile1.0',
+                'percentile25.0', 'percentile50.0', 'percentile75.0',
+                'percentile99.0', 'iqr1-3', 'linregc1', 'linregc2',
+                'linregerrA', 'linregerrQ']
+}
+
+
+class _Segments:
+    """Segment reductions over the rows of a concatenated matrix."""
+    def __init__(self, x: np.ndarray, slices: Sequence[int]):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.lengths = np.asarray(slices, dtype=np.int64)
+        if np.any(self.lengths <= 0):
+            raise ValueError("All instances must have at least one frame.")
+        if self.lengths.sum() != len(self.x):
+            raise ValueError("Slices don't match the number of frames.")
+        self.offsets = np.concatenate([[0], np.cumsum(self.lengths)[:-1]])
+        self.segment = np.repeat(np.arange(len(self.lengths)), self.lengths)
+        # Index of each frame within its instance
+        self.t = np.arange(len(self.x)) - self.offsets[self.segment]
+        self._cache = {}
+
+    def sum(self, a: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(a, self.offsets, axis=0)
+
+    def expand(self, a: np.ndarray) -> np.ndarray:
+        """Repeats per-instance values for each frame."""
+        return a[self.segment]
+
+    def cached(self, name, fn):
+        if name not in self._cache:
+            self._cache[name] = fn()
+        return self._cache[name]
+
+    @property
+    def n(self) -> np.ndarray:
+        return self.lengths[:, np.newaxis].astype(np.float64)
+
+    def mean(self) -> np.ndarray:
+        return self.cached('mean', lambda: self.sum(self.x) / self.n)
+
+    def moment(self, k: int) -> np.ndarray:
+        def fn():
+            d = self.x - self.expand(self.mean())
+            return self.sum(d**k) / self.n
+        return self.cached('m{}'.format(k), fn)
+
+    def max(self) -> np.ndarray:
+        return self.cached('max', lambda: np.maximum.reduceat(
+            self.x, self.offsets, axis=0))
+
+    def min(self) -> np.ndarray:
+        return self.cached('min', lambda: np.minimum.reduceat(
+            self.x, self.offsets, axis=0))
+
+    def position(self, values: np.ndarray) -> np.ndarray:
+        # Index of the first frame equal to the given per-instance value
+        t = np.where(self.x == self.expand(values), self.t[:, np.newaxis],
+                     np.iinfo(np.int64).max)
+        return np.minimum.reduceat(t, self.offsets, axis=0) \
+            .astype(np.float64)
+
+    def regression(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the slope and offset of the least-squares line
+        through each instance, against frame index.
+        """
+        def fn():
+            n = self.lengths.astype(np.float64)
+            t_mean = (n - 1) / 2
+            s_tt = n * (n**2 - 1) / 12
+            t_centred = self.t - t_mean[self.segment]
+            s_ty = self.sum(t_centred[:, np.newaxis] * self.x)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                slope = np.where(s_tt[:, np.newaxis] > 0,
+                                 s_ty / s_tt[:, np.newaxis], 0)
+            offset = self.mean() - slope * t_mean[:, np.newaxis]
+            return slope, offset
+        return self.cached('regression', fn)
+
+    def residuals(self) -> np.ndarray:
+        def fn():
+            slope, offset = self.regression()
+            pred = (self.expand(slope) * self.t[:, np.newaxis]
+                    + self.expand(offset))
+            return self.x - pred
+        return self.cached('residuals', fn)
+
+    def sorted(self) -> np.ndarray:
+        """Returns the frames sorted within each instance, for each
+        feature.
+        """
+        def fn():
+            out = np.empty_like(self.x)
+            for j in range(self.x.shape[1]):
+                out[:, j] = self.x[np.lexsort((self.x[:, j], self.segment)),
+                                   j]
+            return out
+        return self.cached('sorted', fn)
+
+    def percentile(self, p: float) -> np.ndarray:
+        # Linear interpolation between the closest ranks, as in
+        # np.percentile().
+        pos = p / 100 * (self.lengths - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        frac = (pos - lo)[:, np.newaxis]
+        s = self.sorted()
+        return (s[self.offsets + lo] * (1 - frac)
+                + s[self.offsets + hi] * frac)
+
+
+def _ratio(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(den > 0, num / den, 0)
+
+
+def _functional(seg: _Segments, name: str) -> np.ndarray:
+    if name == 'amean':
+        return seg.mean()
+    if name == 'max':
+        return seg.max()
+    if name == 'min':
+        return seg.min()
+    if name == 'range':
+        return seg.max() - seg.min()
+    if name == 'maxPos':
+        return seg.position(seg.max())
+    if name == 'minPos':
+        return seg.position(seg.min())
+    if name == 'stddev':
+        return np.sqrt(seg.moment(2))
+    if name == 'variance':
+        return seg.moment(2)
+    if name == 'skewness':
+        return _ratio(seg.moment(3), seg.moment(2)**1.5)
+    if name == 'kurtosis':
+        return _ratio(seg.moment(4), seg.moment(2)**2)
+    if name == 'linregc1':
+        return seg.regression()[0]
+    if name == 'linregc2':
+        return seg.regression()[1]
+    if name == 'linregerrA':
+        return seg.sum(np.abs(seg.residuals())) / seg.n
+    if name == 'linregerrQ':
+        return seg.sum(seg.residuals()**2) / seg.n
+    if name.startswith('percentile'):
+        return seg.percentile(float(name[len('percentile'):]))
+    if name.startswith('iqr'):
+        # Inter-quartile ranges, e.g. iqr1-3 is the 75th minus the 25th
+        # percentile.
+        q1, q2 = (int(x) for x in name[len('iqr'):].split('-'))
+        return seg.percentile(25 * q2) - seg.percentile(25 * q1)
+    raise ValueError("Unknown functional {}.".format(name))
+
+
+def segment_functionals(x: np.ndarray, slices: Sequence[int],
+                        functionals: Sequence[str] = FUNCTIONAL_SETS['is09'],
+                        feature_names: Optional[Sequence[str]] = None) \
+        -> Tuple[np.ndarray, List[str]]:
+    """Calculates functionals of each LLD over each instance.
+
+    Args:
+    -----
+    x: numpy.ndarray
+        The concatenated LLD matrix, of shape (n_frames, n_lld).
+    slices: list of int
+        The number of frames of each instance.
+    functionals: list of str
+        The functionals to calculate. Any of 'amean', 'stddev',
+        'variance', 'skewness', 'kurtosis', 'max', 'min', 'range',
+        'maxPos', 'minPos', 'linregc1', 'linregc2', 'linregerrA',
+        'linregerrQ', 'percentileP' for 0 <= P <= 100 and 'iqrA-B' for
+        quartiles A < B. Positions are frame indices, and moments are
+        population moments, as in openSMILE.
+    feature_names: list of str, optional
+        Names of the LLDs. Default is the LLD index.
+
+    Returns:
+    --------
+    features: numpy.ndarray
+        Array of shape (n_instances, n_lld * n_functionals), with all
+        functionals of the first LLD, then the second, and so on.
+    names: list of str
+        The name of each feature.
+    """
+    seg = _Segments(x, slices)
+    values = np.stack([_functional(seg, f) for f in functionals], axis=-1)
+    n_lld = seg.x.shape[1]
+    if feature_names is None:
+        feature_names = [str(i) for i in range(n_lld)]
+    names = ['{}_{}'.format(lld, f) for lld in feature_names
+             for f in functionals]
+    return values.reshape(len(seg.lengths), -1).astype(np.float32), names
@@ -0,0 +1,343 @@
+"""Runs the openSMILE toolkit on batches of audio files, reading the
+output through a pipe instead of from a temporary file per clip, and
+composes several openSMILE configs into one, so that several feature
+sets can be extracted in a single pass.
+"""
+
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from collections import OrderedDict
+from os import PathLike
+from pathlib import Path
+from typing import Dict, List, Mapping, Sequence, Tuple, Union
+
+import numpy as np
+
+from .segments import Segment
+
+__all__ = ['OPENSMILE_BIN', 'physical_cores', 'parse_csv_output',
+           'opensmile_batch', 'compose_configs', 'opensmile_multi_batch']
+
+if sys.platform == 'win32':
+    OPENSMILE_BIN = 'third_party\\opensmile\\SMILExtract.exe'
+else:
+    OPENSMILE_BIN = 'third_party/opensmile/SMILExtract'
+
+
+def physical_cores() -> int:
+    """Returns the number of physical CPU cores available to this
+    process. openSMILE is compute bound, so running a process on each
+    hyperthread gives little benefit.
+    """
+    n_cpus = os.cpu_count() or 1
+    if hasattr(os, 'sched_getaffinity'):
+        n_cpus = len(os.sched_getaffinity(0))
+    try:
+        cores = set()
+        with open('/proc/cpuinfo') as fid:
+            physical_id = None
+            for line in fid:
+                key, _, value = line.partition(':')
+                key = key.strip()
+                if key == 'physical id':
+                    physical_id = value.strip()
+                elif key == 'core id':
+                    cores.add((physical_id, value.strip()))
+        if len(cores) > 0:
+            return min(len(cores), n_cpus)
+    except OSError:
+        pass
+    return n_cpus
+
+
+def parse_csv_output(output: bytes) -> np.ndarray:
+    """Parses openSMILE CSV output without a header, where each line is
+    the quoted instance name followed by the feature values. Returns an
+    array of shape (n_lines, n_features).
+    """
+    lines = output.splitlines()
+    lines = [x for x in lines if x]
+    if len(lines) == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+    # Remove the instance name, which is quoted and may contain commas.
+    values = [x[x.index(b"',", 1) + 2:] if x.startswith(b"'")
+              else x.split(b',', 1)[1] for x in lines]
+    arr = np.array(b','.join(values).split(b','), dtype=np.float32)
+    return arr.reshape(len(lines), -1)
+
+
+def _input_args(path: Union[PathLike, str, Segment]) -> List[str]:
+    # Segments are read from the source file with the startSamples and
+    # endSamples options of the wave input.
+    if isinstance(path, Segment):
+        return ['-I', str(path.path), '-instname', path.name,
+                '-startSamples', str(path.start),
+                '-endSamples', str(-1 if path.end is None else path.end)]
+    return ['-I', str(path), '-instname', Path(path).stem]
+
+
+def opensmile_batch(paths: Sequence[Union[PathLike, str, Segment]],
+                    config: Union[PathLike, str],
+                    restargs: Sequence[str] = (),
+                    opensmile_bin: Union[PathLike, str] = OPENSMILE_BIN,
+                    debug: bool = False) -> List[np.ndarray]:
+    """Runs openSMILE on each of a batch of files in turn, and returns
+    the features for each file. openSMILE 3.0 takes one input file per
+    process, so the output is read from a pipe to avoid writing and
+    parsing a CSV file per clip.
+
+    Args:
+    -----
+    paths: list of pathlike, str or Segment
+        The audio files to process. Segments of files are read using the
+        'startSamples' and 'endSamples' options of the config's wave
+        input.
+    config: pathlike or str
+        The openSMILE config file, which must have a 'csvoutput' option.
+    restargs: list of str
+        Additional options to pass to openSMILE.
+    opensmile_bin: pathlike or str
+        Path to the SMILExtract binary.
+    debug: bool
+        Show the openSMILE log.
+
+    Returns:
+    --------
+    features: list of numpy.ndarray
+        The features for each file, of shape (n_frames, n_features).
+        For functional configs n_frames is 1.
+    """
+    with tempfile.TemporaryDirectory(prefix='opensmile') as tmp:
+        if sys.platform == 'win32':
+            output = str(Path(tmp) / 'output.csv')
+        else:
+            output = '/dev/stdout'
+        results = []
+        for path in paths:
+            smile_args = [
+                str(opensmile_bin),
+                '-C', str(config),
+                *_input_args(path),
+                '-csvoutput', output,
+                '-classes', '{unknown}',
+                '-class', 'unknown',
+                '-l', '2' if debug else '0',
+                '-nologfile',
+                *restargs
+            ]
+            proc = subprocess.run(
+                smile_args, stdout=subprocess.PIPE,
+                stderr=None if debug else subprocess.PIPE
+            )
+            if proc.returncode != 0:
+                raise RuntimeError("openSMILE failed for {}: {}".format(
+                    path, (proc.stderr or b'').decode(errors='replace')))
+            if sys.platform == 'win32':
+                with open(output, 'rb') as fid:
+                    results.append(parse_csv_output(fid.read()))
+                os.remove(output)
+            else:
+                results.append(parse_csv_output(proc.stdout))
+    return results
+
+
+_INCLUDE = re.compile(r'^\s*\\\{(.*)\}\s*$')
+_CM_INCLUDE = re.compile(r'^\\cm\[(\w+)(?:\{([^}]*)\})?')
+_SECTION = re.compile(r'^\[([^:\]]+):(\w+)\]')
+_INSTANCE = re.compile(r'^instance\[([^\]]+)\]\.(\w+)$')
+_CM_OPTION = re.compile(r'\\cm\[(\w+)')
+# Command line options of output components that aren't renamed.
+_SHARED_OPTIONS = {'instname', 'class', 'classes', 'corpus'}
+
+
+def _read_config_lines(path: Path, defaults: Dict[str, str]) -> List[str]:
+    # Expands includes, including those that name a file with a command
+    # line option, which take the option's default value.
+    lines = []
+    with open(path) as fid:
+        for line in fid:
+            match = _INCLUDE.match(line)
+            if match is None:
+                lines.append(line.strip())
+                continue
+            target = match.group(1)
+            cm = _CM_INCLUDE.match(target)
+            if cm is not None:
+                if cm.group(2) is not None:
+                    defaults[cm.group(1)] = cm.group(2)
+                target = defaults[cm.group(1)]
+            lines.extend(_read_config_lines(path.parent / target, defaults))
+    return lines
+
+
+def _parse_config(path: Union[PathLike, str]) \
+        -> Tuple[Dict[str, str], Dict[str, List[Tuple[str, str]]], List[str]]:
+    # Returns the component types, the options of each component and the
+    # options of the component manager.
+    types = OrderedDict()
+    options = OrderedDict()
+    manager = []
+    section = None
+    for line in _read_config_lines(Path(path), {}):
+        if line == '' or line.startswith(';') or line.startswith('//'):
+            continue
+        match = _SECTION.match(line)
+        if match is not None:
+            section = match.group(1)
+            if match.group(2) != 'cComponentManager':
+                options.setdefault(section, [])
+            continue
+        key, _, value = (x.strip() for x in line.partition('='))
+        if section == 'componentInstances':
+            instance = _INSTANCE.match(key)
+            if instance is not None and instance.group(2) == 'type':
+                types[instance.group(1)] = value
+            else:
+                manager.append('{} = {}'.format(key, value))
+        elif section is not None:
+            options[section].append((key, value))
+    return types, options, manager
+
+
+def _rename_levels(value: str, mapping: Mapping[str, str]) -> str:
+    levels = [x.strip() for x in value.split(';') if x.strip() != '']
+    return ';'.join(mapping.get(x, x) for x in levels)
+
+
+def compose_configs(configs: Mapping[str, Union[PathLike, str]]) -> str:
+    """Composes several openSMILE configs into one, which computes all
+    of the feature sets from a single reading of the input.
+
+    Components and data memory levels of each config are prefixed with
+    the feature set name, then components with the same type and
+    options, reading the same levels, are merged until no more can be
+    merged. This means the wave input, and framing and spectra that are
+    configured identically in several configs, are only computed once.
+    The output options of each feature set are prefixed with its name,
+    so the CSV output of feature set 'IS09' is given by the
+    '-IS09_csvoutput' option. Other command line options, such as
+    '-nMelBands', apply to all feature sets that use them, and included
+    files named by options take their default values.
+
+    Args:
+    -----
+    configs: dict
+        Mapping from feature set name to config file.
+
+    Returns:
+    --------
+    config: str
+        The contents of the composed config file.
+    """
+    types = OrderedDict()
+    options = OrderedDict()
+    manager = []
+    for name, path in configs.items():
+        _types, _options, _manager = _parse_config(path)
+        for x in _manager:
+            if x not in manager:
+                manager.append(x)
+
+        levels = {}
+        for opts in _options.values():
+            for key, value in opts:
+                if key.endswith('dmLevel'):
+                    for level in _rename_levels(value, {}).split(';'):
+                        levels[level] = '{}_{}'.format(name, level)
+
+        for comp, typ in _types.items():
+            if typ == 'cDataMemory':
+                types.setdefault(comp, typ)
+                continue
+            new_opts = []
+            for key, value in _options.get(comp, []):
+                if key.endswith('dmLevel'):
+                    value = _rename_levels(value, levels)
+                elif typ.endswith('Sink'):
+                    value = _CM_OPTION.sub(
+                        lambda m: m.group(0) if m.group(1) in _SHARED_OPTIONS
+                        else '\\cm[{}_{}'.format(name, m.group(1)), value)
+                new_opts.append((key, value))
+            comp = '{}_{}'.format(name, comp)
+            types[comp] = typ
+            options[comp] = new_opts
+
+    # Merge identical components, and redirect readers of the removed
+    # component's level to the level of the one that is kept.
+    merged = True
+    while merged:
+        merged = False
+        seen = {}
+        for comp in list(types):
+            opts = dict(options.get(comp, []))
+            if 'writer.dmLevel' not in opts:
+                continue
+            level = opts.pop('writer.dmLevel')
+            key = (types[comp], tuple(sorted(opts.items())))
+            if key not in seen:
+                seen[key] = level
+                continue
+            mapping = {level: seen[key]}
+            del types[comp]
+            del options[comp]
+            for other in options:
+                options[other] = [
+                    (k, _rename_levels(v, mapping)
+                     if k.endswith('dmLevel') else v)
+                    for k, v in options[other]
+                ]
+            merged = True
+
+    lines = ['[componentInstances:cComponentManager]']
+    lines.extend('instance[{}].type = {}'.format(comp, typ)
+                 for comp, typ in types.items())
+    lines.extend(manager)
+    for comp, opts in options.items():
+        lines.append('')
+        lines.append('[{}:{}]'.format(comp, types[comp]))
+        lines.extend('{} = {}'.format(k, v) for k, v in opts)
+    return '\n'.join(lines) + '\n'
+
+
+def opensmile_multi_batch(paths: Sequence[Union[PathLike, str, Segment]],
+                          config: Union[PathLike, str],
+                          feature_sets: Sequence[str],
+                          restargs: Sequence[str] = (),
+                          opensmile_bin: Union[PathLike, str] = OPENSMILE_BIN,
+                          debug: bool = False) \
+        -> List[Dict[str, np.ndarray]]:
+    """Like `opensmile_batch()`, but for a config composed with
+    `compose_configs()`. Returns a dict for each file, mapping feature
+    set name to features.
+    """
+    with tempfile.TemporaryDirectory(prefix='opensmile') as tmp:
+        outputs = {x: Path(tmp) / '{}.csv'.format(x) for x in feature_sets}
+        results = []
+        for path in paths:
+            smile_args = [
+                str(opensmile_bin),
+                '-C', str(config),
+                *_input_args(path),
+                '-l', '2' if debug else '0',
+                '-nologfile'
+            ]
+            for name, output in outputs.items():
+                smile_args.extend(['-{}_csvoutput'.format(name), str(output)])
+            smile_args.extend(restargs)
+            proc = subprocess.run(
+                smile_args, stdout=subprocess.DEVNULL,
+                stderr=None if debug else subprocess.PIPE
+            )
+            if proc.returncode != 0:
+                raise RuntimeError("openSMILE failed for {}: {}".format(
+                    path, (proc.stderr or b'').decode(errors='replace')))
+            features = {}
+            for name, output in outputs.items():
+                # The CSV sink appends, so each file is removed after use.
+                features[name] = parse_csv_output(output.read_bytes())
+                output.unlink()
+            results.append(features)
+    return results
@@ -0,0 +1,116 @@
+"""Streaming polyphase resampling, which gives the same output as
+`scipy.signal.resample_poly()` but processes a signal in blocks, so that
+long recordings needn't be held in memory.
+"""
+
+from functools import lru_cache
+from math import gcd
+from typing import Iterable, Iterator, Tuple
+
+import numpy as np
+from scipy.signal import firwin, upfirdn
+
+__all__ = ['polyphase_filter', 'PolyphaseResampler', 'resample_blocks']
+
+
+@lru_cache(maxsize=None)
+def polyphase_filter(up: int, down: int) -> Tuple[np.ndarray, int]:
+    """Returns the anti-aliasing filter used by
+    `scipy.signal.resample_poly()` for the given (coprime) rates, padded
+    so that output samples are centred, and the number of initial output
+    samples to discard. Filters are cached, since the same few rate
+    conversions are used for a whole corpus.
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = firwin(2 * half_len + 1, 1 / max_rate, window=('kaiser', 5.0)) * up
+    n_pre_pad = down - half_len % down
+    h = np.concatenate([np.zeros(n_pre_pad), h])
+    h.flags.writeable = False
+    return h, (half_len + n_pre_pad) // down
+
+
+class PolyphaseResampler:
+    """Resamples a 1D signal given in blocks of any size.
+
+    Args:
+    -----
+    sr_in: int
+        The input sample rate.
+    sr_out: int
+        The output sample rate.
+    """
+    def __init__(self, sr_in: int, sr_out: int):
+        g = gcd(sr_in, sr_out)
+        self.up = sr_out // g
+        self.down = sr_in // g
+        self.h, self._offset = np.ones(1), 0
+        if self.up != self.down:
+            self.h, self._offset = polyphase_filter(self.up, self.down)
+        # Input samples that are still needed, starting at global index
+        # _buf_start, which is always a multiple of down so that output
+        # samples of upfirdn() line up with those of the whole signal.
+        self._buf = np.zeros(0)
+        self._buf_start = 0
+        self._n_in = 0
+        self._next = self._offset
+
+    def _process(self, n_end: int) -> np.ndarray:
+        # Returns the outputs whose inputs are all available, up to full
+        # output index n_end.
+        n_end = min(n_end, -(-self._n_in * self.up // self.down))
+        if n_end <= self._next or len(self._buf) == 0:
+            return np.zeros(0)
+        y = upfirdn(self.h, self._buf, self.up, self.down)
+        base = self._buf_start * self.up // self.down
+        out = y[self._next - base:n_end - base]
+        self._next = n_end
+
+        # Discard input that no later output depends on.
+        n_min = max((self._next * self.down - len(self.h) + 1) // self.up, 0)
+        new_start = n_min // self.down * self.down
+        if new_start > self._buf_start:
+            self._buf = self._buf[new_start - self._buf_start:]
+            self._buf_start = new_start
+        return out
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Adds a block of input and returns any new output."""
+        if self.up == self.down:
+            return np.asarray(block, dtype=np.float64)
+        self._buf = np.concatenate([self._buf, block])
+        self._n_in += len(block)
+        return self._process(np.iinfo(np.int64).max)
+
+    def finish(self) -> np.ndarray:
+        """Returns the remaining output, after the last block."""
+        if self.up == self.down:
+            return np.zeros(0)
+        n_out = -(-self._n_in * self.up // self.down)
+        end = self._offset + n_out
+        # The signal is zero after its end, as in upfirdn().
+        n_pad = -(-end * self.down // self.up) - self._n_in + 1
+        self._buf = np.concatenate([self._buf, np.zeros(max(n_pad, 0))])
+        self._n_in += max(n_pad, 0)
+        return self._process(end)
+
+    @staticmethod
+    def output_length(n_in: int, sr_in: int, sr_out: int) -> int:
+        """Returns the number of output samples for n_in input samples."""
+        g = gcd(sr_in, sr_out)
+        return -(-n_in * (sr_out // g) // (sr_in // g))
+
+
+def resample_blocks(blocks: Iterable[np.ndarray], sr_in: int,
+                    sr_out: int) -> Iterator[np.ndarray]:
+    """Resamples a signal given as an iterable of 1D blocks, and yields
+    blocks of output.
+    """
+    resampler = PolyphaseResampler(sr_in, sr_out)
+    for block in blocks:
+        out = resampler.process(block)
+        if len(out) > 0:
+            yield out
+    out = resampler.finish()
+    if len(out) > 0:
+        yield out
@@ -0,0 +1,133 @@
+"""Segment manifests, which describe a dataset of audio clips as
+segments of longer source recordings, so that the clips needn't be
+written to separate files. Each segment is read directly from its source
+file by seeking, and each source file is opened once per batch of
+segments.
+
+A manifest is a CSV file with columns 'file', 'start', 'end' and
+optionally 'name'. Start and end are in samples, an empty end means the
+end of the file, and relative paths are relative to the manifest. If
+there is no name column, each segment is named after its source file.
+"""
+
+import csv
+from collections import defaultdict
+from os import PathLike
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+__all__ = ['Segment', 'read_segment_manifest', 'write_segment_manifest',
+           'group_by_source', 'segment_lengths', 'read_segments']
+
+
+class Segment(NamedTuple):
+    """A segment of an audio file, from sample `start` up to but not
+    including sample `end`. If end is None the segment continues to the
+    end of the file.
+    """
+    path: Path
+    start: int
+    end: Optional[int]
+    name: str
+
+    @classmethod
+    def from_file(cls, path: Union[PathLike, str]) -> 'Segment':
+        """Returns a segment covering the whole file."""
+        path = Path(path)
+        return cls(path, 0, None, path.stem)
+
+
+def read_segment_manifest(file: Union[PathLike, str]) -> List[Segment]:
+    """Reads a segment manifest CSV file. Relative paths are resolved
+    relative to the directory containing the manifest.
+    """
+    file = Path(file)
+    segments = []
+    with open(file, newline='') as fid:
+        for row in csv.DictReader(fid):
+            path = Path(row['file'])
+            if not path.is_absolute():
+                path = (file.parent / path).resolve()
+            end = row['end'].strip()
+            segments.append(Segment(
+                path, int(row['start']), int(end) if end else None,
+                row.get('name') or path.stem
+            ))
+    return segments
+
+
+def write_segment_manifest(file: Union[PathLike, str],
+                           segments: Iterable[Segment]):
+    """Writes a segment manifest CSV file."""
+    with open(file, 'w', newline='') as fid:
+        writer = csv.writer(fid)
+        writer.writerow(['file', 'start', 'end', 'name'])
+        for seg in segments:
+            writer.writerow([seg.path, seg.start,
+                             '' if seg.end is None else seg.end, seg.name])
+
+
+def group_by_source(segments: Sequence[Segment]) -> List[List[int]]:
+    """Groups segments by source file. Returns a list of indices into
+    segments for each source file, ordered by start sample, so that each
+    source can be read through once.
+    """
+    groups = defaultdict(list)
+    for i, seg in enumerate(segments):
+        groups[seg.path].append(i)
+    return [sorted(idx, key=lambda i: segments[i].start)
+            for idx in groups.values()]
+
+
+def segment_lengths(segments: Sequence[Segment]) -> np.ndarray:
+    """Returns the length of each segment in samples. Only the headers
+    of source files are read, for segments without an end.
+    """
+    import soundfile
+
+    frames = {}
+    lengths = np.empty(len(segments), dtype=np.int64)
+    for i, seg in enumerate(segments):
+        end = seg.end
+        if end is None:
+            if seg.path not in frames:
+                frames[seg.path] = soundfile.info(str(seg.path)).frames
+            end = frames[seg.path]
+        lengths[i] = max(end - seg.start, 0)
+    return lengths
+
+
+def read_segments(segments: Sequence[Segment], dtype: str = 'float32',
+                  always_2d: bool = True) -> List[Tuple[np.ndarray, int]]:
+    """Reads the audio of each segment, opening each source file once.
+
+    Args:
+    -----
+    segments: list of Segment
+        The segments to read.
+    dtype: str
+        The data type to read, as for `soundfile.read()`.
+    always_2d: bool
+        Always return arrays of shape (n_samples, n_channels).
+
+    Returns:
+    --------
+    audio: list of tuple
+        The audio and sample rate of each segment, in the same order as
+        segments.
+    """
+    import soundfile
+
+    audio = [None] * len(segments)
+    for idx in group_by_source(segments):
+        with soundfile.SoundFile(str(segments[idx[0]].path)) as fid:
+            for i in idx:
+                seg = segments[i]
+                end = fid.frames if seg.end is None else seg.end
+                fid.seek(min(seg.start, fid.frames))
+                x = fid.read(max(end - seg.start, 0), dtype=dtype,
+                             always_2d=always_2d)
+                audio[i] = (x, fid.samplerate)
+    return audio
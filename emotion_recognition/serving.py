@@ -0,0 +1,423 @@
+"""Low-latency inference service for trained classifiers. Concurrent
+requests are grouped into micro-batches within a latency budget, and
+feature extraction and prediction run in a worker pool. The service
+speaks a minimal subset of HTTP/1.1 over TCP or a Unix socket, using
+only the standard library.
+"""
+
+import asyncio
+import json
+import math
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import Executor, ThreadPoolExecutor
+from os import PathLike
+from pathlib import Path
+from typing import (Any, Callable, Dict, List, Optional, Sequence, Tuple,
+                    Union)
+
+import numpy as np
+
+from .opensmile import OPENSMILE_BIN, opensmile_batch
+
+__all__ = ['LatencyHistogram', 'MicroBatcher', 'InferenceService',
+           'opensmile_features', 'read_http_message', 'write_http_message']
+
+
+class LatencyHistogram:
+    """Histogram of latencies with logarithmically spaced buckets, from
+    10 microseconds to about 100 seconds with four buckets per octave.
+    """
+    BOUNDS = 1e-5 * 2**(np.arange(94) / 4)
+
+    def __init__(self):
+        self.counts = np.zeros(len(self.BOUNDS) + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        """Records one latency, in seconds."""
+        self.counts[np.searchsorted(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Returns an upper bound on the q-quantile of the recorded
+        latencies, given by the bucket it falls in.
+        """
+        if self.count == 0:
+            return math.nan
+        idx = int(np.searchsorted(np.cumsum(self.counts), q * self.count))
+        if idx >= len(self.BOUNDS):
+            return self.max
+        return min(float(self.BOUNDS[idx]), self.max)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns a summary in milliseconds, along with the non-empty
+        buckets, keyed by their upper bound in milliseconds.
+        """
+        summary = {
+            'count': self.count,
+            'mean_ms': 1000 * self.total / self.count if self.count else None,
+            'max_ms': 1000 * self.max
+        }
+        for q in [0.5, 0.9, 0.99]:
+            summary['p{:g}_ms'.format(100 * q)] = 1000 * self.quantile(q)
+        bounds = np.append(self.BOUNDS, np.inf)
+        summary['buckets'] = {'{:.4g}'.format(1000 * bounds[i]): int(c)
+                              for i, c in enumerate(self.counts) if c > 0}
+        return summary
+
+
+class MicroBatcher:
+    """Groups concurrently submitted items into batches for a function
+    that processes many items at once.
+
+    A batch is started when the first item arrives, and is run once it
+    has `max_batch_size` items, or `max_latency` seconds after the first
+    item arrived. At most `max_workers` batches run concurrently; while
+    all workers are busy, waiting items accumulate into the next batch.
+
+    Parameters:
+    -----------
+    fn: callable
+        Function taking a list of items and returning a sequence of
+        results of the same length. It is run in `executor`.
+    max_batch_size: int
+        The maximum number of items in a batch.
+    max_latency: float
+        The maximum time, in seconds, to wait for more items.
+    executor: concurrent.futures.Executor, optional
+        The executor in which to run fn. Default is the event loop's
+        default executor.
+    max_workers: int
+        The maximum number of batches to run at once.
+    """
+    def __init__(self, fn: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 32, max_latency: float = 0.005,
+                 executor: Optional[Executor] = None, max_workers: int = 1):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.executor = executor
+        self.max_workers = max_workers
+
+        self.queue_latency = LatencyHistogram()
+        self.batch_latency = LatencyHistogram()
+        self.batch_sizes: Counter = Counter()
+        self._queue: Optional[asyncio.Queue] = None
+        self._arrival: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: set = set()
+
+    def start(self):
+        """Starts processing batches. Must be called from within the
+        event loop.
+        """
+        self._queue = asyncio.Queue()
+        self._arrival = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_workers)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stops processing batches."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, item: Any) -> Any:
+        """Submits an item and waits for its result."""
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, fut, time.perf_counter()))
+        self._arrival.set()
+        return await fut
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                while not self._queue.empty() \
+                        and len(batch) < self.max_batch_size:
+                    batch.append(self._queue.get_nowait())
+                timeout = deadline - loop.time()
+                if len(batch) == self.max_batch_size or timeout <= 0:
+                    break
+                self._arrival.clear()
+                try:
+                    await asyncio.wait_for(self._arrival.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            # Keep a reference so the task isn't garbage collected.
+            task = loop.create_task(self._process(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _process(self, batch: List[Tuple[Any, asyncio.Future, float]]):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        for _, _, submitted in batch:
+            self.queue_latency.record(start - submitted)
+        self.batch_sizes[len(batch)] += 1
+        try:
+            results = await loop.run_in_executor(
+                self.executor, self.fn, [item for item, _, _ in batch])
+        except Exception as e:
+            for _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            for (_, fut, _), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+        finally:
+            self.batch_latency.record(time.perf_counter() - start)
+            self._slots.release()
+
+
+def opensmile_features(audio: bytes, config: Union[PathLike, str],
+                       opensmile_bin: Union[PathLike, str] = OPENSMILE_BIN) \
+        -> np.ndarray:
+    """Runs openSMILE on the given audio file contents and returns the
+    feature vector. The config must produce a single vector of
+    functionals per clip.
+    """
+    with tempfile.TemporaryDirectory(prefix='serve') as tmp:
+        wav = Path(tmp) / 'input.wav'
+        wav.write_bytes(audio)
+        try:
+            features = opensmile_batch([wav], config,
+                                       opensmile_bin=opensmile_bin)[0]
+        except RuntimeError as e:
+            raise ValueError(str(e)) from e
+    if len(features) != 1:
+        raise ValueError("openSMILE config must produce one feature vector "
+                         "per clip, but produced {}.".format(len(features)))
+    return features[0]
+
+
+async def read_http_message(reader: asyncio.StreamReader) \
+        -> Optional[Tuple[str, Dict[str, str], bytes]]:
+    """Reads one HTTP/1.1 request or response. Returns the start line,
+    the headers (with lowercase names) and the body, or None if the
+    connection was closed.
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    headers = {}
+    while True:
+        header = await reader.readline()
+        if header in (b'\r\n', b'\n', b''):
+            break
+        name, value = header.decode('latin-1').split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    body = await reader.readexactly(length) if length > 0 else b''
+    return line.decode('latin-1').strip(), headers, body
+
+
+def write_http_message(writer: asyncio.StreamWriter, start_line: str,
+                       body: bytes = b'',
+                       headers: Optional[Dict[str, str]] = None):
+    """Writes an HTTP/1.1 request or response with the given body."""
+    headers = dict(headers or {})
+    headers['Content-Length'] = str(len(body))
+    head = start_line + '\r\n' + ''.join(
+        '{}: {}\r\n'.format(k, v) for k, v in headers.items()) + '\r\n'
+    writer.write(head.encode('latin-1') + body)
+
+
+class InferenceService:
+    """Serves predictions from a trained model over HTTP.
+
+    Endpoints:
+        POST /predict        JSON {"features": [...]} with one feature
+                             vector or a list of vectors.
+        POST /predict_audio  The contents of an audio file. Requires
+                             `opensmile_config`.
+        GET  /metrics        Latency histograms for each stage, and the
+                             distribution of batch sizes.
+        GET  /health         Returns {"status": "ok"}.
+
+    Parameters:
+    -----------
+    model:
+        A trained classifier with predict() and optionally
+        predict_proba(), such as a CompactSVC from `load_svc()`. If it
+        has a normalise() method, it is applied to each batch.
+    class_names: list of str, optional
+        Names of the model's classes.
+    opensmile_config: pathlike or str, optional
+        openSMILE config used to extract features from audio.
+    max_batch_size: int
+        Maximum prediction batch size.
+    max_latency: float
+        Maximum time, in seconds, to wait for a batch to fill.
+    workers: int
+        Number of worker threads for feature extraction and prediction.
+    """
+    def __init__(self, model, class_names: Optional[Sequence[str]] = None,
+                 opensmile_config: Optional[Union[PathLike, str]] = None,
+                 opensmile_bin: Union[PathLike, str] = OPENSMILE_BIN,
+                 max_batch_size: int = 32, max_latency: float = 0.005,
+                 workers: int = 4):
+        self.model = model
+        if class_names is None:
+            class_names = getattr(model, 'class_names',
+                                  [str(c) for c in model.classes_])
+        self.class_names = list(class_names)
+        self.opensmile_config = opensmile_config
+        self.opensmile_bin = opensmile_bin
+        # Requests are batched with those of other clients, so features
+        # of the wrong length must be rejected before they are batched.
+        self.n_features = getattr(model, 'n_features_in_', None)
+        if self.n_features is None and hasattr(model, 'support_vectors_'):
+            self.n_features = model.support_vectors_.shape[1]
+
+        self.executor = ThreadPoolExecutor(workers)
+        self.batcher = MicroBatcher(
+            self._predict_batch, max_batch_size=max_batch_size,
+            max_latency=max_latency, executor=self.executor,
+            max_workers=max(1, workers // 2)
+        )
+        self.histograms = {
+            'extract': LatencyHistogram(),
+            'total': LatencyHistogram()
+        }
+
+    def _predict_batch(self, batch: List[np.ndarray]) -> List[Dict[str, Any]]:
+        x = np.stack(batch)
+        if hasattr(self.model, 'normalise'):
+            x = self.model.normalise(x)
+        probs = None
+        if hasattr(self.model, 'predict_proba'):
+            try:
+                probs = self.model.predict_proba(x)
+            except AttributeError:
+                probs = None
+        if probs is None:
+            idx = np.searchsorted(self.model.classes_, self.model.predict(x))
+            return [{'label': self.class_names[i]} for i in idx]
+        return [{
+            'label': self.class_names[int(np.argmax(p))],
+            'probabilities': dict(zip(self.class_names, p.tolist()))
+        } for p in probs]
+
+    def _check_features(self, features: np.ndarray):
+        if self.n_features is not None \
+                and features.shape[-1] != self.n_features:
+            raise ValueError("Expected {} features, got {}.".format(
+                self.n_features, features.shape[-1]))
+
+    async def predict(self, features: np.ndarray) -> List[Dict[str, Any]]:
+        """Predicts for each row of the 2-D feature matrix."""
+        self._check_features(features)
+        return list(await asyncio.gather(
+            *(self.batcher.submit(x) for x in features)))
+
+    async def predict_audio(self, audio: bytes) -> Dict[str, Any]:
+        """Extracts features from audio file contents and predicts."""
+        if self.opensmile_config is None:
+            raise ValueError("Server was started without an openSMILE config.")
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        features = await loop.run_in_executor(
+            self.executor, opensmile_features, audio, self.opensmile_config,
+            self.opensmile_bin)
+        self.histograms['extract'].record(time.perf_counter() - start)
+        self._check_features(features)
+        return await self.batcher.submit(features)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Returns latency histograms and batch size counts."""
+        stages = {
+            'queue': self.batcher.queue_latency.to_dict(),
+            'predict': self.batcher.batch_latency.to_dict(),
+            **{k: v.to_dict() for k, v in self.histograms.items()}
+        }
+        return {'stages': stages, 'batch_sizes': {
+            str(k): v for k, v in sorted(self.batcher.batch_sizes.items())}}
+
+    async def _route(self, method: str, path: str, body: bytes) \
+            -> Tuple[int, Any]:
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok'}
+        if method == 'GET' and path == '/metrics':
+            return 200, self.metrics()
+        if method == 'POST' and path == '/predict':
+            features = np.array(json.loads(body)['features'],
+                                dtype=np.float32)
+            if features.ndim == 1:
+                features = features[np.newaxis, :]
+            if features.ndim != 2:
+                raise ValueError("features must be a vector or matrix.")
+            return 200, {'predictions': await self.predict(features)}
+        if method == 'POST' and path == '/predict_audio':
+            return 200, {'predictions': [await self.predict_audio(body)]}
+        return 404, {'error': 'Not found: {} {}'.format(method, path)}
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await read_http_message(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+                start_line, headers, body = request
+                start = time.perf_counter()
+                method = ''
+                try:
+                    method, path, _ = start_line.split()
+                    status, result = await self._route(method, path, body)
+                except (ValueError, KeyError, TypeError) as e:
+                    status, result = 400, {'error': str(e)}
+                except Exception as e:
+                    status, result = 500, {'error': repr(e)}
+                if status == 200 and method == 'POST':
+                    self.histograms['total'].record(
+                        time.perf_counter() - start)
+                reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                          500: 'Internal Server Error'}[status]
+                write_http_message(
+                    writer, 'HTTP/1.1 {} {}'.format(status, reason),
+                    json.dumps(result).encode(),
+                    {'Content-Type': 'application/json'}
+                )
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080,
+                    socket_path: Optional[Union[PathLike, str]] = None):
+        """Runs the service until cancelled, on the given TCP address,
+        or on a Unix socket if socket_path is given.
+        """
+        self.batcher.start()
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self._handle,
+                                                     str(socket_path))
+            print("Serving on {}".format(socket_path))
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+            print("Serving on http://{}:{}".format(host, port))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+            self.executor.shutdown(wait=False)
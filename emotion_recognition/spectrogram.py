@@ -0,0 +1,307 @@
+"""Mel spectrogram computation in NumPy, matching the TensorFlow path in
+extract_spectrograms.py, including a stateful extractor for streaming
+audio.
+"""
+
+from functools import lru_cache
+from typing import Optional, Sequence, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .streaming import Framer
+
+__all__ = ['mel_filterbank', 'mel_power_db', 'audeep_scale',
+           'calculate_spectrogram', 'StreamingSpectrogram']
+
+
+def _hertz_to_mel(f: np.ndarray) -> np.ndarray:
+    # HTK mel scale, as used by TensorFlow
+    return 1127.0 * np.log(1 + f / 700.0)
+
+
+@lru_cache(maxsize=None)
+def mel_filterbank(n_mels: int, n_bins: int, sample_rate: int,
+                   fmin: float = 0, fmax: float = 8000) -> np.ndarray:
+    """Returns the (n_bins, n_mels) matrix mapping a linear magnitude
+    spectrum to mel bands. This is a port of
+    `tf.signal.linear_to_mel_weight_matrix()`, which is used by
+    `tfio.experimental.audio.melscale()`. Matrices are cached, and are
+    read-only.
+    """
+    # The DC bin is given zero weight.
+    freqs = np.linspace(0, sample_rate / 2, n_bins)[1:]
+    bins_mel = _hertz_to_mel(freqs)[:, np.newaxis]
+    edges = np.linspace(_hertz_to_mel(fmin), _hertz_to_mel(fmax), n_mels + 2)
+    lower, center, upper = edges[:-2], edges[1:-1], edges[2:]
+    lower_slopes = (bins_mel - lower) / (center - lower)
+    upper_slopes = (upper - bins_mel) / (upper - center)
+    weights = np.maximum(0, np.minimum(lower_slopes, upper_slopes))
+    weights = np.pad(weights, [[1, 0], [0, 0]]).astype(np.float32)
+    weights.flags.writeable = False
+    return weights
+
+
+def _frame_params(sample_rate: int, window_size: float,
+                  window_shift: float):
+    frame_length = int(round(window_size * sample_rate))
+    frame_shift = int(round(window_shift * sample_rate))
+    fft_length = 2**int(np.ceil(np.log2(frame_length)))
+    return frame_length, frame_shift, fft_length
+
+
+@lru_cache(maxsize=None)
+def _hann(length: int) -> np.ndarray:
+    # Periodic Hann window, as used by tf.signal.stft()
+    window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(length) / length)) \
+        .astype(np.float32)
+    window.flags.writeable = False
+    return window
+
+
+def _frames_to_db(frames: np.ndarray, window: np.ndarray, fft_length: int,
+                  mel_matrix: np.ndarray) -> np.ndarray:
+    spectrum = np.abs(np.fft.rfft(frames * window, fft_length))
+    # The product is done in double precision, so that the result
+    # doesn't depend on how many frames are computed at once.
+    mel = (spectrum @ mel_matrix.astype(np.float64)).astype(np.float32)
+    with np.errstate(divide='ignore'):
+        return 10 * np.log10(np.square(mel))
+
+
+def mel_power_db(audio: np.ndarray, sample_rate: int = 16000,
+                 window_size: float = 0.05, window_shift: float = 0.025,
+                 n_mels: int = 120, pre_emphasis: float = 0.95,
+                 fmin: float = 0, fmax: float = 8000) -> np.ndarray:
+    """Calculates the mel power spectrogram, in dB, of a 1-D signal,
+    with pre-emphasis, a periodic Hann window and FFT length the next
+    power of 2 of the window length, like `tf.signal.stft()`. Only full
+    frames are used.
+
+    Returns:
+    --------
+    db: numpy.ndarray
+        Array of shape (n_frames, n_mels).
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    if pre_emphasis > 0:
+        audio = np.concatenate(
+            [audio[:1], audio[1:] - pre_emphasis * audio[:-1]])
+    frame_length, frame_shift, fft_length = _frame_params(
+        sample_rate, window_size, window_shift)
+    if len(audio) < frame_length:
+        return np.zeros((0, n_mels), dtype=np.float32)
+    frames = sliding_window_view(audio, frame_length)[::frame_shift]
+    mel_matrix = mel_filterbank(n_mels, fft_length // 2 + 1, sample_rate,
+                                fmin, fmax)
+    return _frames_to_db(frames, _hann(frame_length), fft_length, mel_matrix)
+
+
+def audeep_scale(db: np.ndarray, clip: float) -> np.ndarray:
+    """Clips a dB spectrogram at `clip` dB below its maximum and scales
+    it to [-1, 1], as auDeep does.
+    """
+    db = np.maximum(db - db.max(), -clip)
+    db_min = db.min()
+    db_max = db.max()
+    if db_max - db_min < 1e-4:
+        return db - db_min
+    return 2 * (db - db_min) / (db_max - db_min) - 1
+
+
+def calculate_spectrogram(audio: np.ndarray,
+                          sample_rate: int = 16000,
+                          channels: str = 'mean',
+                          pre_emphasis: float = 0.95,
+                          skip: float = 0,
+                          length: float = 5,
+                          window_size: float = 0.05,
+                          window_shift: float = 0.025,
+                          n_mels: int = 120,
+                          clip: Union[float, Sequence[float]] = 60,
+                          pad_to: Optional[int] = None) -> np.ndarray:
+    """Calculates a spectrogram from a single clip, giving the same
+    output as `calculate_spectrogram()` in extract_spectrograms.py.
+
+    Args:
+    -----
+    audio: numpy.ndarray
+        The audio to process, of shape (T, C), where T is the length of
+        the clip in samples and C is the number of channels. Values are
+        in the range of 16-bit integers.
+    sample_rate: int
+        The sample rate.
+    channels: str, one of {'mean', 'left', 'right', 'diff'}
+        How to combine the channels. Mono audio is treated as two
+        identical channels. Default is 'mean'.
+    pre_emphasis: float
+        Amount of pre-emphasis to apply. Can be 0 for no pre-emphasis.
+        Default is 0.95.
+    skip: float
+        Length in seconds to ignore from the start of the clip. Default
+        is 0.
+    length: float
+        Desired length of the clip in seconds, or 0 for the whole clip.
+        Default is 5 seconds.
+    window_size: float
+        Length of window in seconds. Default is 0.05
+    window_shift: float
+        Window shift/stride in seconds. Default is 0.025
+    n_mels: int
+        Number of mel bands to calculate
+    clip: float or list of float
+        dB level below which to clip. Default is 60. If a list is given,
+        the mel spectrogram is calculated once and a clipped spectrogram
+        is returned for each level.
+    pad_to: int, optional
+        If length is 0, the clip is padded to this many samples, as the
+        TensorFlow version pads each clip to the longest in the corpus.
+
+    Returns:
+    --------
+    spectrogram: numpy.ndarray
+        The spectrogram of shape (T', M), where T' is the number of
+        frames, M is n_mels, or (L, T', M) if L clip levels are given.
+    """
+    audio = np.asarray(audio)
+    if audio.ndim == 1:
+        audio = audio[:, np.newaxis]
+    if audio.shape[1] == 1:
+        audio = np.repeat(audio, 2, axis=1)
+    start_samples = int(round(skip * sample_rate))
+    length_samples = int(round(length * sample_rate))
+    if length_samples <= 0:
+        total = len(audio) if pad_to is None else max(pad_to, len(audio))
+        length_samples = total - start_samples
+
+    # Clip and convert audio to float in range [-1, 1]
+    audio = audio[start_samples:start_samples + length_samples]
+    audio = audio.astype(np.float32) / np.float32(32768.0)
+
+    # Channel fusion
+    if channels == 'left':
+        audio = audio[:, 0]
+    elif channels == 'right':
+        audio = audio[:, 1]
+    elif channels == 'mean':
+        audio = audio[:, :2].mean(1, dtype=np.float32)
+    elif channels == 'diff':
+        audio = audio[:, 0] - audio[:, 1]
+
+    # Padding
+    if len(audio) < length_samples:
+        audio = np.pad(audio, (0, length_samples - len(audio)))
+
+    db = mel_power_db(audio, sample_rate=sample_rate, window_size=window_size,
+                      window_shift=window_shift, n_mels=n_mels,
+                      pre_emphasis=pre_emphasis)
+    # We need to ignore a frame because the auDeep increases the window
+    # shift for some reason.
+    db = db[:-1]
+    if np.ndim(clip) > 0:
+        return np.stack([audeep_scale(db, c) for c in clip])
+    return audeep_scale(db, clip)
+
+
+class StreamingSpectrogram(Framer):
+    """Computes mel spectrogram frames from audio given in chunks of any
+    size. Each chunk is pre-emphasised using the last sample of the
+    previous chunk, and the samples of incomplete frames are kept for
+    the next chunk (overlap-save), so the frames are identical to those
+    of `mel_power_db()` over the same samples.
+
+    As a stream has no known maximum, frames can be given relative to a
+    running maximum dB level, or the maximum over a window of recent
+    frames, and clipped below `clip` dB.
+
+    Parameters:
+    -----------
+    sample_rate: int
+        The sample rate of the audio.
+    window_size, window_shift: float
+        The STFT window size and shift in seconds.
+    n_mels: int
+        The number of mel bands.
+    pre_emphasis: float
+        Pre-emphasis factor, or 0 for none.
+    fmin, fmax: float
+        Frequency range of the mel filterbank.
+    reference: str, optional
+        One of 'running' for the maximum dB of all frames so far,
+        'window' for the maximum over the last `reference_frames` frames,
+        or None for absolute dB.
+    reference_frames: int
+        The number of frames for the 'window' reference.
+    clip: float, optional
+        dB level below the reference at which to clip.
+    """
+    def __init__(self, sample_rate: int = 16000, window_size: float = 0.05,
+                 window_shift: float = 0.025, n_mels: int = 120,
+                 pre_emphasis: float = 0.95, fmin: float = 0,
+                 fmax: float = 8000, reference: Optional[str] = None,
+                 reference_frames: int = 200, clip: Optional[float] = 60):
+        if reference not in {None, 'running', 'window'}:
+            raise ValueError("Invalid reference {!r}.".format(reference))
+        frame_length, frame_shift, fft_length = _frame_params(
+            sample_rate, window_size, window_shift)
+        super().__init__(frame_length, frame_shift, self._to_db)
+        self.sample_rate = sample_rate
+        self.fft_length = fft_length
+        self.n_mels = n_mels
+        self.pre_emphasis = pre_emphasis
+        self.reference = reference
+        self.reference_frames = reference_frames
+        self.clip = clip
+        self.window = _hann(frame_length)
+        self.mel_matrix = mel_filterbank(n_mels, fft_length // 2 + 1,
+                                         sample_rate, fmin, fmax)
+        self._rest = np.zeros(0, dtype=np.float32)
+        # Zero, so that the first sample is unchanged by pre-emphasis.
+        self._last = np.float32(0)
+        self._ref = -np.inf
+        self._recent_max = np.zeros(0, dtype=np.float32)
+
+    def _to_db(self, frames: np.ndarray) -> np.ndarray:
+        return _frames_to_db(frames, self.window, self.fft_length,
+                             self.mel_matrix)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Returns the spectrogram frames completed by the given
+        samples, as an array of shape (n_frames, n_mels). Integer
+        samples are scaled to [-1, 1] and multi-channel samples of shape
+        (n_samples, n_channels) are averaged.
+        """
+        samples = np.asarray(samples)
+        if np.issubdtype(samples.dtype, np.integer):
+            samples = samples / np.float32(-np.iinfo(samples.dtype).min)
+        samples = samples.astype(np.float32)
+        if samples.ndim == 2:
+            samples = samples.mean(1, dtype=np.float32)
+        if len(samples) == 0:
+            return np.zeros((0, self.n_mels), dtype=np.float32)
+
+        if self.pre_emphasis > 0:
+            prev = np.concatenate([[self._last], samples[:-1]])
+            self._last = samples[-1]
+            samples = samples - np.float32(self.pre_emphasis) * prev
+        db = super().process(samples)
+        if self.reference is None or len(db) == 0:
+            return db
+
+        frame_max = db.max(1)
+        if self.reference == 'running':
+            ref = np.maximum.accumulate(np.concatenate(
+                [np.array([self._ref], dtype=np.float32), frame_max]))[1:]
+            self._ref = ref[-1]
+        else:
+            n = self.reference_frames
+            recent = np.concatenate([self._recent_max, frame_max])
+            padded = np.concatenate(
+                [np.full(n - 1 - len(self._recent_max), -np.inf,
+                         dtype=np.float32), recent])
+            ref = sliding_window_view(padded, n).max(1)
+            self._recent_max = recent[-(n - 1):] if n > 1 else recent[:0]
+        db = db - ref[:, np.newaxis]
+        if self.clip is not None:
+            db = np.maximum(db, -self.clip)
+        return db
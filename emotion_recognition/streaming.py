@@ -0,0 +1,247 @@
+"""Streaming inference over long recordings. Audio is read in blocks and
+features are computed incrementally, so that memory use is bounded
+regardless of the length of the recording.
+"""
+
+from os import PathLike
+from typing import Callable, Iterator, Optional, Tuple, Union
+
+import numpy as np
+import soundfile
+
+__all__ = ['RingBuffer', 'Framer', 'functionals', 'stream_windows',
+           'stream_predict']
+
+
+class RingBuffer:
+    """Fixed capacity buffer that keeps the most recent rows added.
+
+    Parameters:
+    -----------
+    capacity: int
+        The maximum number of rows.
+    shape: tuple
+        The shape of each row.
+    dtype:
+        The data type of the buffer.
+    """
+    def __init__(self, capacity: int, shape: Tuple[int, ...] = (),
+                 dtype=np.float32):
+        self.capacity = capacity
+        self._data = np.zeros((capacity,) + tuple(shape), dtype=dtype)
+        self._pos = 0
+        self.total = 0
+
+    def __len__(self) -> int:
+        return min(self.total, self.capacity)
+
+    def extend(self, rows: np.ndarray):
+        """Appends rows, discarding the oldest rows if necessary."""
+        # Rows discarded here still count towards the total.
+        self.total += len(rows)
+        rows = rows[-self.capacity:]
+        n = len(rows)
+        end = min(self._pos + n, self.capacity)
+        self._data[self._pos:end] = rows[:end - self._pos]
+        self._data[:n - (end - self._pos)] = rows[end - self._pos:]
+        self._pos = (self._pos + n) % self.capacity
+
+    def latest(self, n: Optional[int] = None) -> np.ndarray:
+        """Returns a copy of the n most recent rows, oldest first."""
+        if n is None:
+            n = len(self)
+        if n > len(self):
+            raise ValueError("Only {} rows are available.".format(len(self)))
+        idx = (self._pos - n + np.arange(n)) % self.capacity
+        return self._data[idx]
+
+
+class Framer:
+    """Splits a stream of samples into overlapping frames and applies a
+    function to each group of new frames. Samples that don't yet make up
+    a full frame are kept for the next call.
+
+    Parameters:
+    -----------
+    frame_length: int
+        Frame length in samples.
+    frame_shift: int
+        Frame shift in samples.
+    fn: callable, optional
+        Function that maps an (n_frames, frame_length) array to an
+        (n_frames, ...) array of frame features. Default is to return
+        the frames.
+    """
+    def __init__(self, frame_length: int, frame_shift: int,
+                 fn: Optional[Callable[[np.ndarray], np.ndarray]] = None):
+        self.frame_length = frame_length
+        self.frame_shift = frame_shift
+        self.fn = fn
+        self._rest = np.zeros(0, dtype=np.float32)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Returns the features of all frames completed by samples."""
+        x = np.concatenate([self._rest, samples])
+        n_frames = max(0, (len(x) - self.frame_length) // self.frame_shift + 1)
+        idx = (self.frame_shift * np.arange(n_frames)[:, None]
+               + np.arange(self.frame_length)[None, :])
+        frames = x[idx]
+        self._rest = x[n_frames * self.frame_shift:]
+        if self.fn is not None:
+            return self.fn(frames)
+        return frames
+
+
+def functionals(frames: np.ndarray) -> np.ndarray:
+    """Computes the mean, standard deviation, minimum and maximum of
+    each frame feature, as a feature vector for functional-feature
+    models.
+    """
+    return np.concatenate([frames.mean(0), frames.std(0), frames.min(0),
+                           frames.max(0)])
+
+
+def _read_blocks(path: Union[PathLike, str], block_size: int) \
+        -> Tuple[int, Iterator[np.ndarray]]:
+    sf = soundfile.SoundFile(str(path))
+
+    def blocks():
+        with sf:
+            for block in sf.blocks(block_size, dtype='float32',
+                                   always_2d=True):
+                # Downmix to mono
+                yield block.mean(1)
+    return sf.samplerate, blocks()
+
+
+def stream_windows(path: Union[PathLike, str], window: float, hop: float,
+                   frame_extractor: Optional[Framer] = None,
+                   block_size: int = 16000) \
+        -> Iterator[Tuple[float, np.ndarray]]:
+    """Reads an audio file in blocks and yields overlapping windows.
+
+    Without a frame extractor, each window is the array of samples.
+    With one, frame features are computed once as audio arrives, and
+    each window is the array of features of the frames it contains.
+
+    Args:
+    -----
+    path: pathlike or str
+        The audio file.
+    window: float
+        The window size in seconds.
+    hop: float
+        The hop between the start of consecutive windows, in seconds.
+    frame_extractor: Framer, optional
+        Stateful frame feature extractor. It must have `frame_length`
+        and `frame_shift` attributes in samples and a `process()` method
+        that takes new samples and returns features for newly completed
+        frames. The hop must be a multiple of the frame shift.
+    block_size: int
+        The number of samples to read at a time.
+
+    Yields:
+    -------
+    start: float
+        The start time of the window in seconds.
+    window: numpy.ndarray
+        The samples or frame features in the window.
+    """
+    sr, blocks = _read_blocks(path, block_size)
+    win_samples = int(round(window * sr))
+    hop_samples = int(round(hop * sr))
+    if hop_samples <= 0 or win_samples <= 0:
+        raise ValueError("Window and hop must be positive.")
+
+    if frame_extractor is None:
+        size = win_samples
+        step = hop_samples
+        buffer = RingBuffer(size)
+    else:
+        fs = frame_extractor.frame_shift
+        if hop_samples % fs != 0:
+            raise ValueError("Hop must be a multiple of the frame shift.")
+        size = (win_samples - frame_extractor.frame_length) // fs + 1
+        step = hop_samples // fs
+        buffer = None
+
+    next_end = size
+    n_windows = 0
+    for block in blocks:
+        rows = block if frame_extractor is None \
+            else frame_extractor.process(block)
+        if buffer is None:
+            if len(rows) == 0:
+                continue
+            buffer = RingBuffer(size, rows.shape[1:], rows.dtype)
+        # Add rows in pieces so no window is overwritten before it is
+        # emitted, even if a block is longer than the window.
+        while len(rows) > 0:
+            n = min(len(rows), next_end - buffer.total)
+            buffer.extend(rows[:n])
+            rows = rows[n:]
+            if buffer.total == next_end:
+                yield n_windows * hop_samples / sr, buffer.latest(size)
+                n_windows += 1
+                next_end += step
+
+
+def stream_predict(path: Union[PathLike, str],
+                   predict_fn: Callable[[np.ndarray], np.ndarray],
+                   window: float, hop: float,
+                   frame_extractor: Optional[Framer] = None,
+                   window_fn: Optional[Callable[[np.ndarray],
+                                                np.ndarray]] = None,
+                   batch_size: int = 16,
+                   block_size: int = 16000) \
+        -> Iterator[Tuple[float, np.ndarray]]:
+    """Yields a time series of predictions for overlapping windows of a
+    long recording.
+
+    For sequence models on LLDs or spectrograms, give a frame_extractor
+    and predict_fn takes a batch of (n_frames, n_features) windows. For
+    functional-feature models, window_fn maps each window (samples, or
+    frame features) to a feature vector, for example `functionals()`.
+
+    Args:
+    -----
+    path: pathlike or str
+        The audio file.
+    predict_fn: callable
+        Function that maps a batch of window features to a 2-D array of
+        class probabilities, such as a classifier's predict_proba().
+    window, hop: float
+        The window size and hop in seconds.
+    frame_extractor: Framer, optional
+        Stateful frame feature extractor. See `stream_windows()`.
+    window_fn: callable, optional
+        Function applied to each window to give the model input.
+    batch_size: int
+        The number of windows to predict at once.
+    block_size: int
+        The number of samples to read at a time.
+
+    Yields:
+    -------
+    start: float
+        The start time of the window in seconds.
+    probs: numpy.ndarray
+        The predicted class probabilities.
+    """
+    times = []
+    batch = []
+
+    def flush():
+        probs = predict_fn(np.stack(batch))
+        yield from zip(times, probs)
+        times.clear()
+        batch.clear()
+
+    for start, win in stream_windows(path, window, hop, frame_extractor,
+                                     block_size):
+        times.append(start)
+        batch.append(win if window_fn is None else window_fn(win))
+        if len(batch) == batch_size:
+            yield from flush()
+    if len(batch) > 0:
+        yield from flush()
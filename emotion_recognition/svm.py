@@ -0,0 +1,315 @@
+"""Support vector machine solver for precomputed kernels that can be
+warm-started, so that a sequence of increasing values of C can be fit
+along a regularisation path rather than each from scratch.
+"""
+
+import warnings
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.exceptions import ConvergenceWarning
+
+__all__ = ['smo', 'WarmStartSVC']
+
+TAU = 1e-12
+
+
+def _calculate_rho(alpha: np.ndarray, grad: np.ndarray, y: np.ndarray,
+                   C: np.ndarray) -> float:
+    yG = y * grad
+    upper = alpha >= C
+    lower = alpha <= 0
+    free = ~upper & ~lower
+    if np.any(free):
+        return float(np.mean(yG[free]))
+    # As in libsvm, take the midpoint of the feasible interval.
+    ub_mask = (upper & (y < 0)) | (lower & (y > 0))
+    lb_mask = (upper & (y > 0)) | (lower & (y < 0))
+    ub = np.min(yG[ub_mask]) if np.any(ub_mask) else np.inf
+    lb = np.max(yG[lb_mask]) if np.any(lb_mask) else -np.inf
+    return float((ub + lb) / 2)
+
+
+def smo(K: np.ndarray,
+        y: np.ndarray,
+        C: Union[float, np.ndarray],
+        alpha: Optional[np.ndarray] = None,
+        grad: Optional[np.ndarray] = None,
+        tol: float = 1e-3,
+        max_iter: int = -1) -> Tuple[np.ndarray, np.ndarray, float, int]:
+    """Solves the binary SVM dual problem
+
+        min_a 0.5 a^T Q a - e^T a, s.t. y^T a = 0, 0 <= a_i <= C_i,
+
+    where Q_ij = y_i y_j K_ij, by sequential minimal optimisation with
+    the second order working set selection used by libsvm [1].
+
+    A previous solution (alpha, grad) for the same K and y can be given
+    as a starting point. It remains feasible whenever every C_i is at
+    least as large as before, which is the case when following a
+    regularisation path in order of increasing C.
+
+    [1] R.-E. Fan, P.-H. Chen, and C.-J. Lin, "Working set selection
+    using second order information for training support vector
+    machines," Journal of Machine Learning Research, vol. 6, pp.
+    1889-1918, 2005.
+
+    Args:
+    -----
+    K: numpy.ndarray
+        The (n, n) kernel matrix of the training data.
+    y: numpy.ndarray
+        Labels in {-1, +1}.
+    C: float or numpy.ndarray
+        Upper bound of each dual variable. An array can be used for
+        per-instance weights.
+    alpha: numpy.ndarray, optional
+        Initial dual variables. Default is all zeros.
+    grad: numpy.ndarray, optional
+        Gradient at alpha. Calculated from alpha if not given.
+    tol: float
+        Tolerance on the maximal violating pair for stopping.
+    max_iter: int
+        Maximum number of iterations, or -1 for the libsvm default.
+
+    Returns:
+    --------
+    alpha: numpy.ndarray
+        The optimal dual variables.
+    grad: numpy.ndarray
+        The gradient at alpha.
+    rho: float
+        The negative bias. The decision function is
+        sum_i alpha_i y_i K(x_i, x) - rho.
+    n_iter: int
+        The number of iterations performed.
+    """
+    n = len(y)
+    y = np.asarray(y, dtype=np.float64)
+    C = np.broadcast_to(np.asarray(C, dtype=np.float64), (n,))
+    if alpha is None:
+        alpha = np.zeros(n)
+        grad = -np.ones(n)
+    else:
+        alpha = np.array(alpha, dtype=np.float64)
+        if grad is None:
+            grad = y * (K @ (y * alpha)) - 1
+        else:
+            grad = np.array(grad, dtype=np.float64)
+    if max_iter < 0:
+        max_iter = max(10000000, 100 * n)
+    QD = np.diag(K)
+    pos = y > 0
+
+    # -y_t * G_t, which is what the working set selection uses. This is
+    # updated directly, since y_t^2 = 1.
+    yG = -y * grad
+    # Index sets I_up and I_low from [1], updated only where alpha
+    # changes.
+    up = np.where(pos, alpha < C, alpha > 0)
+    low = np.where(pos, alpha > 0, alpha < C)
+    masked = np.empty(n)
+    obj = np.empty(n)
+
+    n_iter = 0
+    while n_iter < max_iter:
+        np.copyto(masked, -np.inf)
+        np.copyto(masked, yG, where=up)
+        i = int(np.argmax(masked))
+        g_max = masked[i]
+        np.copyto(masked, np.inf)
+        np.copyto(masked, yG, where=low)
+        if g_max == -np.inf or g_max - masked.min() < tol:
+            break
+
+        Ki = K[i]
+        # b_t = g_max - yG_t, a_t = K_ii + K_tt - 2 K_it,
+        # obj_t = -b_t^2 / a_t for t in I_low with b_t > 0.
+        b = g_max - yG
+        a = QD + QD[i]
+        a -= 2 * Ki
+        np.maximum(a, TAU, out=a)
+        np.copyto(obj, np.inf)
+        b *= b
+        b /= a
+        np.negative(b, out=b)
+        np.copyto(obj, b, where=low & (masked < g_max))
+        j = int(np.argmin(obj))
+
+        ai, aj = float(alpha[i]), float(alpha[j])
+        old_ai, old_aj = ai, aj
+        Ci, Cj = float(C[i]), float(C[j])
+        yi, yj = float(y[i]), float(y[j])
+        gi, gj = -yi * float(yG[i]), -yj * float(yG[j])
+        quad = max(float(QD[i] + QD[j] - 2 * Ki[j]), TAU)
+        if yi != yj:
+            delta = (-gi - gj) / quad
+            diff = ai - aj
+            ai += delta
+            aj += delta
+            if diff > 0:
+                if aj < 0:
+                    aj = 0.0
+                    ai = diff
+            elif ai < 0:
+                ai = 0.0
+                aj = -diff
+            if diff > Ci - Cj:
+                if ai > Ci:
+                    ai = Ci
+                    aj = Ci - diff
+            elif aj > Cj:
+                aj = Cj
+                ai = Cj + diff
+        else:
+            delta = (gi - gj) / quad
+            total = ai + aj
+            ai -= delta
+            aj += delta
+            if total > Ci:
+                if ai > Ci:
+                    ai = Ci
+                    aj = total - Ci
+            elif aj < 0:
+                aj = 0.0
+                ai = total
+            if total > Cj:
+                if aj > Cj:
+                    aj = Cj
+                    ai = total - Cj
+            elif ai < 0:
+                ai = 0.0
+                aj = total
+        alpha[i] = ai
+        alpha[j] = aj
+
+        # G += Q[:, i] da_i + Q[:, j] da_j, with Q[:, t] = y y_t K[:, t]
+        yG -= Ki * ((ai - old_ai) * yi)
+        yG -= K[j] * ((aj - old_aj) * yj)
+        for t, at in ((i, ai), (j, aj)):
+            up[t] = at < C[t] if pos[t] else at > 0
+            low[t] = at > 0 if pos[t] else at < C[t]
+        n_iter += 1
+    else:
+        warnings.warn("SMO reached max_iter={} without converging.".format(
+            max_iter), ConvergenceWarning)
+
+    grad = -y * yG
+    return alpha, grad, _calculate_rho(alpha, grad, y, C), n_iter
+
+
+class WarmStartSVC(BaseEstimator, ClassifierMixin):
+    """Support vector classifier for a precomputed kernel, trained with
+    `smo()`. Multi-class problems are handled one-vs-one, as in libsvm.
+
+    With `warm_start=True`, refitting on the same training data with a
+    larger C continues from the previous dual solution of each binary
+    problem, which usually needs fewer iterations than fitting from
+    scratch. This is useful for evaluating a range of C values in
+    increasing order.
+
+    Parameters:
+    -----------
+    C: float
+        Regularisation parameter.
+    tol: float
+        Tolerance for stopping.
+    max_iter: int
+        Maximum number of SMO iterations per binary problem, or -1 for
+        the libsvm default.
+    warm_start: bool
+        Whether to reuse the previous solution when refitting.
+    """
+    def __init__(self, C: float = 1.0, tol: float = 1e-3,
+                 max_iter: int = -1, warm_start: bool = False):
+        self.C = C
+        self.tol = tol
+        self.max_iter = max_iter
+        self.warm_start = warm_start
+
+    def _more_tags(self):
+        return {'pairwise': True}
+
+    def fit(self, X: np.ndarray, y: np.ndarray,
+            sample_weight: Optional[np.ndarray] = None):
+        """Fits the classifier to the (n_train, n_train) kernel matrix X
+        and labels y.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        classes, y_idx = np.unique(y, return_inverse=True)
+        if sample_weight is None:
+            sample_weight = np.ones(len(y_idx))
+        sample_weight = np.asarray(sample_weight, dtype=np.float64)
+
+        reuse = (self.warm_start and hasattr(self, 'alpha_')
+                 and np.array_equal(classes, self.classes_)
+                 and np.array_equal(y_idx, self._y_idx))
+
+        n_classes = len(classes)
+        pairs = [(k, l) for k in range(n_classes)
+                 for l in range(k + 1, n_classes)]
+        alphas = []
+        grads = []
+        rhos = []
+        indices = []
+        n_iter = []
+        for p, (k, l) in enumerate(pairs):
+            idx = np.nonzero((y_idx == k) | (y_idx == l))[0]
+            yb = np.where(y_idx[idx] == k, 1.0, -1.0)
+            C = self.C * sample_weight[idx]
+            if n_classes == 2:
+                K = X
+            else:
+                K = X[np.ix_(idx, idx)]
+            alpha0 = grad0 = None
+            # The previous solution is only feasible if no bound has
+            # decreased.
+            if reuse and np.all(self.alpha_[p] <= C):
+                alpha0 = self.alpha_[p]
+                grad0 = self._grad[p]
+            alpha, grad, rho, it = smo(K, yb, C, alpha0, grad0, tol=self.tol,
+                                       max_iter=self.max_iter)
+            alphas.append(alpha)
+            grads.append(grad)
+            rhos.append(rho)
+            indices.append(idx)
+            n_iter.append(it)
+
+        self.classes_ = classes
+        self._y_idx = y_idx
+        self.pairs_ = pairs
+        self.pair_indices_ = indices
+        self.alpha_ = alphas
+        self._grad = grads
+        self.dual_coef_ = [a * np.where(y_idx[i] == k, 1.0, -1.0)
+                           for a, i, (k, _) in zip(alphas, indices, pairs)]
+        self.rho_ = np.array(rhos)
+        self.n_iter_ = np.array(n_iter)
+        return self
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        """Returns the one-vs-one decision values for the (n_test,
+        n_train) kernel matrix X. For binary problems this is 1-D and,
+        as in scikit-learn, positive values correspond to `classes_[1]`.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        dec = np.stack([X[:, idx] @ coef - rho for idx, coef, rho in zip(
+            self.pair_indices_, self.dual_coef_, self.rho_)], axis=1)
+        if len(self.classes_) == 2:
+            return -dec[:, 0]
+        return dec
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Predicts classes for the (n_test, n_train) kernel matrix X by
+        one-vs-one voting.
+        """
+        dec = self.decision_function(X)
+        if len(self.classes_) == 2:
+            return self.classes_[(dec > 0).astype(int)]
+        votes = np.zeros((len(X), len(self.classes_)), dtype=int)
+        for p, (k, l) in enumerate(self.pairs_):
+            pos = dec[:, p] > 0
+            votes[pos, k] += 1
+            votes[~pos, l] += 1
+        return self.classes_[np.argmax(votes, axis=1)]
@@ -1,3 +1,4 @@
+import time
 from collections import defaultdict
 from functools import partial
 from itertools import chain
@@ -17,6 +18,7 @@ from tensorflow.keras.optimizers import Adam, Optimizer
 from tensorflow.keras.utils import Sequence
 from tqdm import tqdm
 
+from ..checkpoint import FoldCheckpoint
 from ..classification import Classifier, ScoreFunction
 from ..utils import batch_arrays, shuffle_multiple
 from .utils import create_tf_dataset_ragged, DataFunction, TFModelFunction
@@ -136,10 +138,14 @@ def tf_train_val_test(model_fn: TFModelFunction,
     tf.keras.backend.clear_session()
     clf = model_fn()
 
+    start_time = time.perf_counter()
     history = clf.fit(train_data, validation_data=valid_data, **fit_params)
+    scores['fit_time'] = time.perf_counter() - start_time
     scores['history'] = history.history
 
+    start_time = time.perf_counter()
     y_pred = np.argmax(clf.predict(test_data), axis=-1)
+    scores['score_time'] = time.perf_counter() - start_time
     y_true = np.concatenate([x[1] for x in test_data])
     dummy = DummyEstimator(y_pred)
     if isinstance(scoring, str):
@@ -167,7 +173,8 @@ def tf_cross_validate(model_fn: TFModelFunction,
                       data_fn: DataFunction = create_tf_dataset_ragged,
                       sample_weight=None,
                       log_dir: Optional[Path] = None,
-                      fit_params: Dict[str, Any] = {}):
+                      fit_params: Dict[str, Any] = {},
+                      checkpoint: Optional[FoldCheckpoint] = None):
     """Performs cross-validation on a TensorFlow model. This works with
     both sequence models and single vector models.
 
@@ -198,10 +205,22 @@ def tf_cross_validate(model_fn: TFModelFunction,
     fit_params: dict, optional
         Any keyword arguments to supply to the Keras fit() method.
         Default is no keyword arguments.
+    checkpoint: FoldCheckpoint, optional
+        If given, the scores of each fold are stored as soon as the fold
+        is complete, and folds that already have stored scores are
+        skipped.
     """
     scores = defaultdict(list)
     n_folds = cv.get_n_splits(x, y, groups)
     for fold, (train, test) in enumerate(cv.split(x, y, groups)):
+        if checkpoint is not None:
+            _scores = checkpoint.load(fold)
+            if _scores is not None:
+                print("\tFold {}/{} loaded from checkpoint".format(
+                    fold + 1, n_folds))
+                for k in _scores:
+                    scores[k].append(_scores[k])
+                continue
         print("\tFold {}/{}".format(fold + 1, n_folds))
 
         x_train = x[train]
@@ -233,6 +252,8 @@ def tf_cross_validate(model_fn: TFModelFunction,
             model_fn, train_data=train_data, valid_data=test_data,
             test_data=test_data, scoring=scoring, **fit_params
         )
+        if checkpoint is not None:
+            checkpoint.save(fold, _scores)
 
         for k in _scores:
             scores[k].append(_scores[k])
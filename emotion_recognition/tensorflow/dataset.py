@@ -1,40 +1,170 @@
+"""Reading and writing datasets stored as (sharded) TFRecord files.
+
+Each example holds one instance, with features `name`, `corpus`,
+`label`, `index` (position in the original dataset), `features` (raw
+bytes), `features_shape` and `features_dtype`. A dataset of N shards
+`data.tfrecord` is stored as `data-00000-of-0000N.tfrecord`, etc.
+"""
+
 from os import PathLike
-from typing import Union
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
 
 import numpy as np
 import tensorflow as tf
 
-from ..dataset import LabelledDataset
+from ..dataset import DatasetBackend, LabelledDataset
+
+__all__ = ['shard_path', 'tfrecord_shards', 'serialise_example',
+           'write_tfrecord', 'read_tfrecords', 'TFRecordBackend',
+           'TFRecordDataset']
+
+EXAMPLE_SPEC = {
+    'name': tf.io.FixedLenFeature([], tf.string),
+    'corpus': tf.io.FixedLenFeature([], tf.string, default_value=''),
+    'label': tf.io.FixedLenFeature([], tf.string, default_value=''),
+    'index': tf.io.FixedLenFeature([], tf.int64, default_value=-1),
+    'features': tf.io.FixedLenFeature([], tf.string),
+    'features_shape': tf.io.VarLenFeature(tf.int64),
+    'features_dtype': tf.io.FixedLenFeature([], tf.string)
+}
+
+
+def shard_path(path: Union[PathLike, str], shard: int,
+               n_shards: int) -> Path:
+    """Returns the path of a shard. A single shard is written to path
+    itself.
+    """
+    path = Path(path)
+    if n_shards == 1:
+        return path
+    return path.with_name('{}-{:05d}-of-{:05d}{}'.format(
+        path.stem, shard, n_shards, path.suffix))
+
+
+def tfrecord_shards(path: Union[PathLike, str]) -> List[Path]:
+    """Returns the shards of the TFRecord dataset at path, in order."""
+    path = Path(path)
+    if path.exists():
+        return [path]
+    shards = sorted(path.parent.glob('{}-[0-9]*-of-[0-9]*{}'.format(
+        path.stem, path.suffix)))
+    if len(shards) == 0:
+        raise FileNotFoundError("No TFRecord shards found for {}.".format(
+            path))
+    return shards
+
+
+def _bytes_feature(value: bytes) -> tf.train.Feature:
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+
+def _int64_feature(value: Sequence[int]) -> tf.train.Feature:
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=value))
+
+
+def serialise_example(name: str, features: np.ndarray, label: str = '',
+                      corpus: str = '', index: int = -1) -> bytes:
+    """Serialises a single instance to a `tf.train.Example` string."""
+    features = np.ascontiguousarray(features)
+    example = tf.train.Example(features=tf.train.Features(feature={
+        'name': _bytes_feature(name.encode()),
+        'corpus': _bytes_feature(corpus.encode()),
+        'label': _bytes_feature(label.encode()),
+        'index': _int64_feature([index]),
+        'features': _bytes_feature(features.tobytes()),
+        'features_shape': _int64_feature(list(features.shape)),
+        'features_dtype': _bytes_feature(features.dtype.str.encode())
+    }))
+    return example.SerializeToString()
+
+
+def write_tfrecord(path: Union[PathLike, str], names: Sequence[str],
+                   features: Sequence[np.ndarray],
+                   labels: Optional[Sequence[str]] = None, corpus: str = '',
+                   offset: int = 0):
+    """Writes instances to a single TFRecord file. The index of
+    instance i is offset + i.
+    """
+    if labels is None:
+        labels = [''] * len(names)
+    with tf.io.TFRecordWriter(str(path)) as writer:
+        for i, (name, x, label) in enumerate(zip(names, features, labels)):
+            writer.write(serialise_example(name, x, label, corpus,
+                                           offset + i))
+
+
+def read_tfrecords(path: Union[PathLike, str],
+                   batch_size: int = 256) -> tf.data.Dataset:
+    """Creates a `tf.data.Dataset` that reads all shards of the dataset
+    at path in parallel, yielding batches of examples parsed with
+    `tf.io.parse_example()`. The features are left as raw bytes, since
+    instances may differ in shape; `features_shape` is sparse.
+    """
+    files = [str(x) for x in tfrecord_shards(path)]
+    data = tf.data.Dataset.from_tensor_slices(files)
+    data = data.interleave(
+        tf.data.TFRecordDataset, cycle_length=len(files),
+        num_parallel_calls=tf.data.experimental.AUTOTUNE
+    )
+    data = data.batch(batch_size).map(
+        lambda x: tf.io.parse_example(x, EXAMPLE_SPEC),
+        num_parallel_calls=tf.data.experimental.AUTOTUNE
+    )
+    return data.prefetch(tf.data.experimental.AUTOTUNE)
+
+
+class TFRecordBackend(DatasetBackend):
+    """Backend that reads instances from one or more TFRecord shards.
+    Instances are returned in their original order if the examples have
+    an index.
+    """
+    def __init__(self, path: Union[PathLike, str]):
+        names = []
+        labels = []
+        corpora = []
+        index = []
+        features = []
+        for batch in read_tfrecords(path):
+            shapes = tf.RaggedTensor.from_sparse(
+                batch['features_shape']).to_list()
+            for raw, shape, dtype in zip(batch['features'].numpy(), shapes,
+                                         batch['features_dtype'].numpy()):
+                features.append(np.frombuffer(raw, dtype=dtype.decode())
+                                .reshape(shape))
+            names.extend(x.decode() for x in batch['name'].numpy())
+            labels.extend(x.decode() for x in batch['label'].numpy())
+            corpora.extend(x.decode() for x in batch['corpus'].numpy())
+            index.extend(batch['index'].numpy())
+
+        order = np.arange(len(names))
+        if len(index) > 0 and min(index) >= 0:
+            order = np.argsort(index, kind='stable')
+        self._names = [names[i] for i in order]
+        if any(labels):
+            self._labels = [labels[i] for i in order]
+        self._corpus = corpora[0] if len(corpora) > 0 else ''
+
+        if len(set(x.shape for x in features)) == 1:
+            self._features = np.stack([features[i] for i in order])
+        else:
+            self._features = np.empty(len(features), dtype=object)
+            for i, j in enumerate(order):
+                self._features[i] = features[j]
+        n_features = 0
+        if len(features) > 0:
+            # A scalar instance is a single feature.
+            n_features = features[0].shape[-1] if features[0].ndim > 0 else 1
+        self._feature_names = ['feature_{}'.format(i + 1)
+                               for i in range(n_features)]
 
 
 class TFRecordDataset(LabelledDataset):
-    """A dataset contained in TFRecord files."""
-    def __init__(self, file: Union[PathLike, str]):
-        self.tf_dataset = tf.data.TFRecordDataset([str(file)])
-        example = tf.train.Example()
-        example.ParseFromString(next(iter(self.tf_dataset)).numpy())
-        features = example.features.feature
-        corpus = features['corpus'].bytes_list.value[0].decode()
-        self.data_shape = tuple(features['features_shape'].int64_list.value)
-        self.data_dtype = features[
-            'features_dtype'].bytes_list.value[0].decode()
-        super().__init__(corpus)
-
-    def _create_data(self):
-        self._x = []
-        self._y = []
-        for item in self.tf_dataset:
-            example = tf.train.Example()
-            example.ParseFromString(item.numpy())
-            features = example.features.feature
-            data = np.frombuffer(
-                features['features'].bytes_list.value[0],
-                dtype=self.dtype
-            )
-            data = np.reshape(data, self.data_shape)
-            label = features['label'].bytes_list.value[0].decode()
-            label_int = self.class_to_int(label)
-            self._x.append(data)
-            self._y.append(label_int)
-        self._x = np.array(self._x, dtype=np.float32)
-        self._y = np.array(self._y, dtype=np.float32)
+    """A dataset contained in one or more TFRecord shards. The names,
+    speakers and labels are available as for any other dataset, and
+    `tf_dataset` gives the parsed examples as a parallel `tf.data`
+    pipeline.
+    """
+    def __init__(self, path: Union[PathLike, str]):
+        super().__init__(path)
+        self.tf_dataset = read_tfrecords(path)
@@ -1,6 +1,30 @@
-from .aldeneh2017 import aldeneh2017_model
-from .audeep import audeep_trae
-from .latif2019 import latif2019_model
-from .rbm import BBRBM, DBN, DecayType
-from .zhang2019 import zhang2019_model
-from .zhao2019 import zhao2019_model
+"""Model definitions. Each model is imported from its module when it is
+first accessed, so that using one model doesn't load the others.
+"""
+
+import importlib
+
+_MODELS = {
+    'aldeneh2017_model': 'aldeneh2017',
+    'audeep_trae': 'audeep',
+    'latif2019_model': 'latif2019',
+    'BBRBM': 'rbm',
+    'DBN': 'rbm',
+    'DecayType': 'rbm',
+    'zhang2019_model': 'zhang2019',
+    'zhao2019_model': 'zhao2019'
+}
+
+__all__ = list(_MODELS)
+
+
+def __getattr__(name: str):
+    if name not in _MODELS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(
+            __name__, name))
+    module = importlib.import_module('.' + _MODELS[name], __name__)
+    return getattr(module, name)
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_MODELS))
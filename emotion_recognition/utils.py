@@ -1,8 +1,10 @@
 """Various utility functions for modifying arrays and other things."""
 
+import json
+import os
 from pathlib import Path
-from typing import (Callable, List, Optional, Sequence, Tuple, TypeVar, Union,
-                    overload)
+from typing import (Any, Callable, List, Optional, Sequence, Tuple, TypeVar,
+                    Union, overload)
 
 import click
 import numpy as np
@@ -219,3 +221,25 @@ def batch_arrays(arrays_x: List[np.ndarray], y: np.ndarray,
     x_list = np.array(x_list, dtype=object)
     y_list = np.array(y_list, dtype=y_dtype if uniform_batch_size else object)
     return x_list, y_list
+
+
+def json_default(obj):
+    """Converts numpy scalars and arrays to Python objects, for use as
+    the `default` argument of `json.dump()`.
+    """
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError("Object of type {} is not JSON serialisable.".format(
+        type(obj).__name__))
+
+
+def write_json(path: Path, obj: Any):
+    """Writes obj as JSON to path, replacing the file atomically."""
+    # Write to a temporary file first so that an interrupted write never
+    # leaves a partial result behind.
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as fid:
+        json.dump(obj, fid, default=json_default)
+    os.replace(tmp, path)
@@ -10,7 +10,11 @@ from typing import Optional
 import numpy as np
 import pandas as pd
 import tensorflow as tf
-from emotion_recognition.classification import PrecomputedSVC
+from emotion_recognition.checkpoint import FoldCheckpoint, array_hash
+from emotion_recognition.classification import (PrecomputedSVC,
+                                                cross_validate_checkpoint,
+                                                precomputed_grid_search,
+                                                precomputed_svc)
 from emotion_recognition.dataset import LabelledDataset
 from emotion_recognition.tensorflow.classification import tf_cross_validate
 from emotion_recognition.tensorflow.models import (aldeneh2017_model,
@@ -23,7 +27,7 @@ from emotion_recognition.tensorflow.utils import create_tf_dataset_ragged
 from sklearn.metrics import (get_scorer, make_scorer, precision_score,
                              recall_score)
 from sklearn.model_selection import (GridSearchCV, GroupKFold,
-                                     LeaveOneGroupOut, cross_validate)
+                                     LeaveOneGroupOut)
 from sklearn.preprocessing import StandardScaler
 from tensorflow.keras import Model
 from tensorflow.keras.optimizers import Adam
@@ -56,7 +60,11 @@ def test_classifier(kind: str,
                     verbose: bool = False,
                     lr: float = 1e-4,
                     epochs: int = 50,
-                    bs: int = 64):
+                    bs: int = 64,
+                    run_dir: Optional[Path] = None,
+                    precompute_kernel: bool = False,
+                    kernel_cache: Optional[Path] = None,
+                    warm_start_path: bool = False):
     splitter = LeaveOneGroupOut()
     if len(dataset.speakers) > 12:
         splitter = GroupKFold(6)
@@ -79,24 +87,57 @@ def test_classifier(kind: str,
             c + '_prec': make_scorer(precision_score, average=None, labels=[i])
         })
 
+    data_hash = None
+    if run_dir:
+        data_hash = array_hash(dataset.x, dataset.y,
+                               dataset.speaker_group_indices)
+
     for rep in range(1, reps + 1):
         print("Rep {}".format(rep))
+        checkpoint = None
         if kind == 'svm':
             fit_params = dict(sample_weight=sample_weight)
             param_grid = {'C': 2.0**np.arange(-6, 7, 2), 'kernel': ['rbf'],
                           'gamma': 2.0**np.arange(-12, -1, 2)}
-            clf = GridSearchCV(PrecomputedSVC(), param_grid, cv=splitter,
-                               scoring='balanced_accuracy', n_jobs=-1)
-            clf.fit(
-                dataset.x, dataset.y, groups=dataset.speaker_group_indices,
-                sample_weight=sample_weight
-            )
-            params = clf.best_params_
-            clf = clf.best_estimator_
-            scores = cross_validate(
-                clf, dataset.x, dataset.y, cv=splitter, scoring=scoring,
-                groups=dataset.speaker_group_indices,
-                fit_params=fit_params, n_jobs=-1, verbose=int(verbose)
+            params = None
+            if run_dir:
+                checkpoint = FoldCheckpoint(run_dir, data_hash, kind,
+                                            param_grid, seed=rep)
+                params = checkpoint.load_params()
+            if params is None and precompute_kernel:
+                params, _ = precomputed_grid_search(
+                    dataset.x, dataset.y, param_grid, cv=splitter,
+                    groups=dataset.speaker_group_indices,
+                    scoring='balanced_accuracy', sample_weight=sample_weight,
+                    cache_dir=kernel_cache, n_jobs=-1,
+                    warm_start=warm_start_path
+                )
+                if checkpoint is not None:
+                    checkpoint.save_params(params)
+            elif params is None:
+                clf = GridSearchCV(PrecomputedSVC(), param_grid, cv=splitter,
+                                   scoring='balanced_accuracy', n_jobs=-1)
+                clf.fit(
+                    dataset.x, dataset.y,
+                    groups=dataset.speaker_group_indices,
+                    sample_weight=sample_weight
+                )
+                params = clf.best_params_
+                clf = clf.best_estimator_
+                if checkpoint is not None:
+                    checkpoint.save_params(params)
+            else:
+                print("Loaded parameters from checkpoint.")
+                clf = PrecomputedSVC(**params)
+            x = dataset.x
+            if precompute_kernel:
+                # Slice one kernel matrix for every split.
+                clf, x = precomputed_svc(dataset.x, params,
+                                         cache_dir=kernel_cache)
+            scores = cross_validate_checkpoint(
+                clf, x, dataset.y, cv=splitter, scoring=scoring,
+                groups=dataset.speaker_group_indices, fit_params=fit_params,
+                checkpoint=checkpoint, n_jobs=-1, verbose=int(verbose)
             )
         else:
             os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1'
@@ -117,11 +158,15 @@ def test_classifier(kind: str,
                 get_seq_model, kind, n_features=dataset.n_features,
                 n_classes=dataset.n_classes, lr=lr
             )
+            if run_dir:
+                checkpoint = FoldCheckpoint(run_dir, data_hash, kind, params,
+                                            seed=rep)
             scores = tf_cross_validate(
                 model_fn, dataset.x, dataset.y, cv=splitter, scoring=scoring,
                 groups=dataset.speaker_group_indices, data_fn=data_fn,
                 sample_weight=sample_weight, log_dir=None,
-                fit_params=dict(epochs=epochs, verbose=verbose)
+                fit_params=dict(epochs=epochs, verbose=verbose),
+                checkpoint=checkpoint
             )
             if logs:
                 log_dir = logs / ('rep_' + str(rep))
@@ -153,7 +198,7 @@ def test_classifier(kind: str,
         print(df.to_string())
 
 
-def main():
+def get_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
 
     # Required options
@@ -181,34 +226,80 @@ def main():
     parser.add_argument('--verbose', action='store_true')
     parser.add_argument('--logs', type=Path,
                         help="Folder to write training logs per fold.")
+    parser.add_argument(
+        '--run_dir', type=Path,
+        help="Directory to store per-fold results in, so that an "
+        "interrupted run can be resumed."
+    )
 
     # Model-specific options
+    parser.add_argument(
+        '--precompute_kernel', action='store_true',
+        help="Compute each SVM kernel matrix once over the whole dataset and "
+        "slice it for each cross-validation split."
+    )
+    parser.add_argument('--kernel_cache', type=Path,
+                        help="Directory in which to cache kernel matrices.")
+    parser.add_argument(
+        '--warm_start_path', action='store_true',
+        help="Search values of C for each kernel in increasing order, "
+        "warm-starting each fit from the previous one. Implies "
+        "--precompute_kernel."
+    )
     parser.add_argument('--learning_rate', type=float, default=1e-4)
     parser.add_argument('--batch_size', type=int, default=64)
     parser.add_argument('--epochs', type=int, default=50)
-    args = parser.parse_args()
+    return parser
 
-    valid_models = {'svm', 'aldeneh2017', 'latif2019', 'zhang2019', 'zhao2019'}
-    if args.kind not in valid_models:
-        raise ValueError("--kind must be one of {}.".format(valid_models))
 
+def setup_tf():
+    """Sets TensorFlow logging and GPU memory growth. Must be called
+    before any GPU is used.
+    """
     tf.get_logger().setLevel(40)  # ERROR level
     for gpu in tf.config.list_physical_devices('GPU'):
         tf.config.experimental.set_memory_growth(gpu, True)
 
-    dataset = LabelledDataset(args.data)
+
+def load_dataset(path: Path) -> LabelledDataset:
+    """Loads a dataset and normalises it per speaker."""
+    dataset = LabelledDataset(path)
     dataset.normalise(normaliser=StandardScaler(), scheme='speaker')
-    if args.pad:
-        dataset.pad_arrays(args.pad)
-    if args.clip:
-        dataset.clip_arrays(args.clip)
+    return dataset
+
+
+def preprocess(dataset: LabelledDataset, pad: Optional[int] = None,
+               clip: Optional[int] = None):
+    """Pads and/or clips the sequences of a dataset, in place."""
+    if pad:
+        dataset.pad_arrays(pad)
+    if clip:
+        dataset.clip_arrays(clip)
+
+
+def run(args: argparse.Namespace, dataset: LabelledDataset):
+    """Tests the classifier given by args on a loaded dataset."""
+    valid_models = {'svm', 'aldeneh2017', 'latif2019', 'zhang2019', 'zhao2019'}
+    if args.kind not in valid_models:
+        raise ValueError("--kind must be one of {}.".format(valid_models))
 
     test_classifier(
         args.kind, dataset, reps=args.reps, results=args.results,
         logs=args.logs, verbose=args.verbose, lr=args.learning_rate,
-        epochs=args.epochs, bs=args.batch_size
+        epochs=args.epochs, bs=args.batch_size, run_dir=args.run_dir,
+        precompute_kernel=args.precompute_kernel or args.warm_start_path,
+        kernel_cache=args.kernel_cache, warm_start_path=args.warm_start_path
     )
 
 
+def main():
+    args = get_parser().parse_args()
+
+    setup_tf()
+    dataset = load_dataset(args.data)
+    preprocess(dataset, args.pad, args.clip)
+    run(args, dataset)
+
+
 if __name__ == "__main__":
     main()
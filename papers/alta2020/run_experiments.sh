@@ -1,9 +1,11 @@
 #!/bin/sh
 
 # This script runs the main experiment script on various combinations of
-# classifier and features on a given dataset.
-
+# classifier and features on a given dataset. All configurations are run
+# by scripts/training/run_experiments.py, which loads each dataset once.
 
+configs=$(mktemp)
+cat > "$configs" <<END
 # SVM-RBF with IS09 features for reference
 python papers/alta2020/run_experiment.py --kind rbf --reps 5 --data output/$1/IS09.nc --results results/comparative2020/$1/svm_rbf/IS09.csv
 
@@ -22,3 +24,9 @@ python papers/alta2020/run_experiment.py --kind zhang2019 --batch_size 16 --reps
 
 # Zhao et al. (2019) classifier
 python papers/alta2020/run_experiment.py --kind zhao2019 --batch_size 64 --reps 3 --data output/$1/spectrograms-0.025-0.010-40-60.nc --pad 512 --results results/comparative2020/$1/zhao2019/spectrograms_40.csv
+END
+
+python scripts/training/run_experiments.py --input "$configs"
+status=$?
+rm -f "$configs"
+exit $status
@@ -6,14 +6,14 @@ for corpus in cafe crema-d demos emodb emofilm enterface iemocap jl msp-improv p
         --corpus $corpus \
         --labels datasets/$corpus/labels.csv \
         --batch_size 128 \
-        --audeep output/${corpus}/spectrograms-0.05-0.025-240-60.nc \
+        --audeep "output/${corpus}/spectrograms-0.05-0.025-240-{clip}.nc" \
         --length 5 \
         --skip 0 \
-        --clip 60 \
+        --clip 30 45 60 75 \
         --window_size 0.05 \
         --window_shift 0.025 \
         --mel_bands 240 \
         --pre_emphasis 0.95 \
         --channels mean \
-        datasets/$corpus/files.txt
+        --input datasets/$corpus/files.txt
 done
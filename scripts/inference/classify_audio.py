@@ -7,6 +7,7 @@ import pickle
 from pathlib import Path
 
 import numpy as np
+from emotion_recognition.artifact import load_svc
 from emotion_recognition.dataset import Dataset
 
 
@@ -15,25 +16,47 @@ def main():
     parser.add_argument('--input', type=Path, required=True,
                         help="Input data to predict on.")
     parser.add_argument('--model', type=Path, required=True,
-                        help="Pickled model.")
+                        help="Model file saved by train_multiple.py, or a "
+                        "pickled model.")
     parser.add_argument('--output', type=Path, required=True,
                         help="Output.")
     args = parser.parse_args()
 
     dataset = Dataset(args.input)
     names = np.array(dataset.names)
-    dataset.normalise()
-    with open(args.model, 'rb') as fid:
-        clf = pickle.load(fid)
+    class_names = ['emotional', 'neutral']
+    if args.model.suffix == '.npz':
+        clf = load_svc(args.model)
+        class_names = clf.class_names
+        if clf.norm_scheme == 'none':
+            x = dataset.x
+        elif clf.norm_scheme == 'all' and clf.norm_mean.size > 0:
+            x = clf.normalise(dataset.x)
+        elif clf.norm_scheme in ['all', 'corpus']:
+            # Per-corpus statistics can't be reused for new data, so the
+            # input, taken as a single corpus, is normalised as a whole.
+            dataset.normalise(scheme='all')
+            x = dataset.x
+        elif clf.norm_scheme == 'speaker':
+            dataset.normalise(scheme='speaker')
+            x = dataset.x
+        else:
+            raise ValueError("Unknown normalisation scheme '{}' in {}.".format(
+                clf.norm_scheme, args.model))
+    else:
+        dataset.normalise()
+        x = dataset.x
+        with open(args.model, 'rb') as fid:
+            clf = pickle.load(fid)
 
-    pred = clf.predict_proba(dataset.x)
+    pred = clf.predict_proba(x)
     sort = np.argsort(pred[:, 0])[::-1]
     names = names[sort]
     prob = pred[sort, 0]
 
     with open(args.output, 'w') as fid:
         for name, p in zip(names, prob):
-            label = 'emotional' if p > 0.5 else 'neutral'
+            label = class_names[0] if p > 0.5 else class_names[1]
             print('{},{},{}'.format(name, label, p), file=fid)
         print("Wrote CSV to {}".format(args.output))
 
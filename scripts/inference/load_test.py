@@ -0,0 +1,112 @@
+"""Load generator for benchmarking the inference server. Sends requests
+from a number of concurrent keep-alive connections and reports
+throughput and latency percentiles, along with the server's per-stage
+latency histograms.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from emotion_recognition.serving import read_http_message, write_http_message
+
+
+async def client(args, payload: bytes, path: str, n_requests: int,
+                 latencies: list):
+    if args.socket:
+        reader, writer = await asyncio.open_unix_connection(str(args.socket))
+    else:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        write_http_message(writer, 'POST {} HTTP/1.1'.format(path), payload,
+                           {'Host': args.host})
+        await writer.drain()
+        status_line, _, body = await read_http_message(reader)
+        if status_line.split()[1] != '200':
+            raise RuntimeError("Request failed: {} {}".format(
+                status_line, body.decode()))
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def get_metrics(args) -> dict:
+    if args.socket:
+        reader, writer = await asyncio.open_unix_connection(str(args.socket))
+    else:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    write_http_message(writer, 'GET /metrics HTTP/1.1',
+                       headers={'Host': args.host, 'Connection': 'close'})
+    await writer.drain()
+    _, _, body = await read_http_message(reader)
+    writer.close()
+    return json.loads(body)
+
+
+async def run(args):
+    if args.audio:
+        payload = args.audio.read_bytes()
+        path = '/predict_audio'
+    else:
+        rng = np.random.default_rng(args.seed)
+        features = rng.standard_normal(args.n_features).tolist()
+        payload = json.dumps({'features': features}).encode()
+        path = '/predict'
+
+    latencies = []
+    per_client = [args.requests // args.concurrency] * args.concurrency
+    for i in range(args.requests % args.concurrency):
+        per_client[i] += 1
+    start = time.perf_counter()
+    await asyncio.gather(*(client(args, payload, path, n, latencies)
+                           for n in per_client))
+    elapsed = time.perf_counter() - start
+
+    latencies = 1000 * np.array(latencies)
+    print("{} requests in {:.2f}s with {} connections: {:.1f} req/s".format(
+        len(latencies), elapsed, args.concurrency, len(latencies) / elapsed))
+    print("Latency (ms): mean {:.2f}, p50 {:.2f}, p90 {:.2f}, p99 {:.2f}, "
+          "max {:.2f}".format(latencies.mean(),
+                              *np.percentile(latencies, [50, 90, 99]),
+                              latencies.max()))
+
+    metrics = await get_metrics(args)
+    print()
+    print("Server stages (ms):")
+    for stage, hist in metrics['stages'].items():
+        if hist['count'] == 0:
+            continue
+        print("{:<8} n={:<7} mean {:.2f}, p50 {:.2f}, p90 {:.2f}, "
+              "p99 {:.2f}".format(stage, hist['count'], hist['mean_ms'],
+                                  hist['p50_ms'], hist['p90_ms'],
+                                  hist['p99_ms']))
+    print("Batch sizes:", metrics['batch_sizes'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help="Server host.")
+    parser.add_argument('--port', type=int, default=8080,
+                        help="Server port.")
+    parser.add_argument('--socket', type=Path,
+                        help="Connect to this Unix socket instead of TCP.")
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help="Number of concurrent connections.")
+    parser.add_argument('--requests', type=int, default=1000,
+                        help="Total number of requests.")
+    parser.add_argument('--audio', type=Path,
+                        help="Audio file to send, instead of features.")
+    parser.add_argument('--n_features', type=int, default=384,
+                        help="Size of random feature vectors to send.")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Runs a local inference server for a trained model. Concurrent
+requests are micro-batched, and audio is processed with openSMILE.
+"""
+
+import argparse
+import asyncio
+import pickle
+from pathlib import Path
+
+from emotion_recognition.artifact import load_svc
+from emotion_recognition.opensmile import OPENSMILE_BIN
+from emotion_recognition.serving import InferenceService
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--model', type=Path, required=True,
+                        help="Model file saved by train_multiple.py, or a "
+                        "pickled model.")
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help="Host to listen on.")
+    parser.add_argument('--port', type=int, default=8080,
+                        help="Port to listen on.")
+    parser.add_argument('--socket', type=Path,
+                        help="Listen on this Unix socket instead of TCP.")
+    parser.add_argument(
+        '--opensmile_config', type=Path,
+        help="openSMILE config for extracting features from audio. Must "
+        "match the features the model was trained on."
+    )
+    parser.add_argument('--opensmile_bin', type=Path,
+                        default=Path(OPENSMILE_BIN),
+                        help="Path to the SMILExtract binary.")
+    parser.add_argument('--max_batch_size', type=int, default=32,
+                        help="Maximum number of instances per batch.")
+    parser.add_argument(
+        '--max_latency', type=float, default=5,
+        help="Maximum time in milliseconds to wait for a batch to fill."
+    )
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Number of worker threads.")
+    args = parser.parse_args()
+
+    if args.model.suffix == '.npz':
+        model = load_svc(args.model)
+        if model.norm_scheme not in {'all', 'none'}:
+            print("Warning: model was trained with '{}' normalisation, so "
+                  "inputs must be normalised by the client.".format(
+                      model.norm_scheme))
+    else:
+        with open(args.model, 'rb') as fid:
+            model = pickle.load(fid)
+
+    service = InferenceService(
+        model, opensmile_config=args.opensmile_config,
+        opensmile_bin=args.opensmile_bin, max_batch_size=args.max_batch_size,
+        max_latency=args.max_latency / 1000, workers=args.workers
+    )
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
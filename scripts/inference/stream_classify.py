@@ -0,0 +1,105 @@
+"""Classifies overlapping windows of a long recording, streaming the
+audio in blocks, and writes a time series of class probabilities.
+"""
+
+import argparse
+import io
+from pathlib import Path
+
+import soundfile
+from emotion_recognition.artifact import load_svc
+from emotion_recognition.opensmile import OPENSMILE_BIN
+from emotion_recognition.serving import opensmile_features
+from emotion_recognition.spectrogram import StreamingSpectrogram, audeep_scale
+from emotion_recognition.streaming import stream_predict
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--input', type=Path, required=True,
+                        help="Audio file to classify.")
+    parser.add_argument('--model', type=Path, required=True,
+                        help="SVM model file (.npz) or saved Keras model.")
+    parser.add_argument('--output', type=Path, required=True,
+                        help="Output CSV of probabilities over time.")
+    parser.add_argument('--window', type=float, default=2,
+                        help="Window size in seconds.")
+    parser.add_argument('--hop', type=float, default=0.5,
+                        help="Hop between windows in seconds.")
+    parser.add_argument('--batch_size', type=int, default=16,
+                        help="Number of windows to predict at once.")
+
+    # SVM options
+    parser.add_argument(
+        '--opensmile_config', type=Path,
+        help="openSMILE functionals config, for SVM models."
+    )
+    parser.add_argument('--opensmile_bin', type=Path,
+                        default=Path(OPENSMILE_BIN),
+                        help="Path to the SMILExtract binary.")
+
+    # Spectrogram options, for Keras models
+    parser.add_argument('--window_size', type=float, default=0.05,
+                        help="STFT window size in seconds.")
+    parser.add_argument('--window_shift', type=float, default=0.025,
+                        help="STFT window shift in seconds.")
+    parser.add_argument('--mel_bands', type=int, default=120,
+                        help="Number of mel bands.")
+    parser.add_argument('--pre_emphasis', type=float, default=0.95,
+                        help="Pre-emphasis factor.")
+    parser.add_argument('--clip', type=float, default=60,
+                        help="Clip below this (negative) dB level.")
+    args = parser.parse_args()
+
+    sample_rate = soundfile.info(str(args.input)).samplerate
+    if args.model.suffix == '.npz':
+        if args.opensmile_config is None:
+            raise ValueError("--opensmile_config is required for SVM models.")
+        clf = load_svc(args.model)
+        class_names = clf.class_names
+
+        def window_fn(samples):
+            # openSMILE reads the window from an in-memory WAV file.
+            wav = io.BytesIO()
+            soundfile.write(wav, samples, sample_rate, format='WAV',
+                            subtype='PCM_16')
+            return opensmile_features(wav.getvalue(), args.opensmile_config,
+                                      args.opensmile_bin)
+
+        def predict_fn(x):
+            return clf.predict_proba(clf.normalise(x))
+
+        frame_extractor = None
+    else:
+        import tensorflow as tf
+
+        model = tf.keras.models.load_model(str(args.model))
+        class_names = ['class_{}'.format(i)
+                       for i in range(model.output_shape[-1])]
+        frame_extractor = StreamingSpectrogram(
+            sample_rate, window_size=args.window_size,
+            window_shift=args.window_shift, n_mels=args.mel_bands,
+            pre_emphasis=args.pre_emphasis
+        )
+
+        def window_fn(db):
+            # Drop the last frame to match calculate_spectrogram().
+            return audeep_scale(db[:-1], args.clip)
+
+        def predict_fn(x):
+            return model.predict(x)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w') as fid:
+        print(','.join(['time'] + class_names), file=fid)
+        for start, probs in stream_predict(
+                args.input, predict_fn, args.window, args.hop,
+                frame_extractor=frame_extractor, window_fn=window_fn,
+                batch_size=args.batch_size):
+            print(','.join(['{:.3f}'.format(start)]
+                           + ['{:.6f}'.format(p) for p in probs]), file=fid)
+    print("Wrote CSV to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,28 @@
 
 # Generates spectrograms using the auDeep code.
 # This script must be run in the audeep docker container.
+#
+# Usage: audeep_spectrograms.sh corpus [clip ...]
+#
+# auDeep only takes one clip level, so it recomputes the spectrograms for
+# each level given (default 60). extract_spectrograms.py can write several
+# clip levels from a single pass.
 
 corpus=$1
+shift
+clips=${*:-60}
 
-output=output/${corpus}/spectrograms_audeep-0.05-0.025-240-60.nc
+for clip in $clips; do
+    output=output/${corpus}/spectrograms_audeep-0.05-0.025-240-${clip}.nc
 
-audeep preprocess \
-    --basedir datasets/$corpus/wav_corpus \
-    --parser audeep.backend.parsers.no_metadata.NoMetadataParser \
-    --window-width 0.05 \
-    --window-overlap 0.025 \
-    --mel-spectrum 240 \
-    --fixed-length 5 \
-    --clip-below -60 \
-    --output $output
-echo "Wrote spectrograms to $output"
+    audeep preprocess \
+        --basedir datasets/$corpus/wav_corpus \
+        --parser audeep.backend.parsers.no_metadata.NoMetadataParser \
+        --window-width 0.05 \
+        --window-overlap 0.025 \
+        --mel-spectrum 240 \
+        --fixed-length 5 \
+        --clip-below -$clip \
+        --output $output
+    echo "Wrote spectrograms to $output"
+done
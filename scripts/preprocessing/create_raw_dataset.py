@@ -1,49 +1,136 @@
-"""Creates a NetCDF dataset containing the raw audio and labels."""
+"""Creates a NetCDF dataset containing the raw audio and labels. Audio
+is decoded in blocks, downmixed to mono, resampled if necessary and
+appended to the dataset as it is read, so the memory needed doesn't
+depend on the size of the corpus.
+"""
 
 import argparse
-import sys
+import time
 from pathlib import Path
+from typing import Iterator
 
 import numpy as np
 import soundfile
-from emotion_recognition.dataset import get_audio_paths, write_netcdf_dataset
+from emotion_recognition.audio_index import AudioIndex
+from emotion_recognition.cache import FeatureCache
+from emotion_recognition.dataset import (create_netcdf_dataset,
+                                         get_audio_segments)
+from emotion_recognition.resample import PolyphaseResampler, resample_blocks
+from emotion_recognition.segments import Segment, group_by_source
+
+
+def read_blocks(fid: soundfile.SoundFile, segment: Segment,
+                block_size: int = 65536) -> Iterator[np.ndarray]:
+    """Yields blocks of a segment of an open file, downmixed to mono."""
+    end = fid.frames if segment.end is None else min(segment.end, fid.frames)
+    fid.seek(min(segment.start, end))
+    remaining = end - fid.tell()
+    while remaining > 0:
+        block = fid.read(min(block_size, remaining), dtype='float32',
+                         always_2d=True)
+        if len(block) == 0:
+            break
+        remaining -= len(block)
+        yield np.mean(block, axis=1)
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--input', type=Path, required=True)
+    parser.add_argument(
+        '--input', type=Path, required=True,
+        help="File containing list of audio files, or a segment manifest."
+    )
     parser.add_argument('--corpus', type=str, required=True)
     parser.add_argument('--annotations', type=Path, required=True)
     parser.add_argument('--output', type=Path, required=True)
+    parser.add_argument('--sample_rate', type=int, default=16000,
+                        help="Sample rate of the dataset. Audio at other "
+                        "rates is resampled.")
+    parser.add_argument('--block_size', type=int, default=65536,
+                        help="Number of samples to decode at once.")
+    parser.add_argument('--chunk_size', type=int, default=65536,
+                        help="Number of samples per netCDF chunk.")
+    parser.add_argument(
+        '--cache', type=Path, help="Cache directory. Only files that aren't "
+        "already in the cache are read."
+    )
+    parser.add_argument(
+        '--index', type=Path, help="Audio metadata index, used to get "
+        "lengths and sample rates without reading the audio."
+    )
     args = parser.parse_args()
 
-    filenames = get_audio_paths(args.input)
-
-    print("Processing {} audio files.".format(len(filenames)))
-    audio_arr = []
-    for filename in filenames:
-        audio, sr = soundfile.read(filename, always_2d=True, dtype=np.float32)
-        if sr != 16000:
-            sys.stderr.write(
-                "Sample rate of {} != 16000, skipping.\n".format(filename))
-            continue
-        audio = np.mean(audio, axis=1)
-        audio = np.expand_dims(audio, axis=1)
-        audio_arr.append(audio)
-    slices = [len(x) for x in audio_arr]
-    audio_arr = np.concatenate(audio_arr)
+    cache = None
+    if args.cache:
+        cache = FeatureCache(args.cache, {'extractor': 'raw_audio',
+                                          'sample_rate': args.sample_rate})
+
+    segments = get_audio_segments(args.input)
+    print("Processing {} audio files.".format(len(segments)))
+
+    # The output length of each segment is known from the file headers,
+    # so the dataset can be created before any audio is read.
+    sources = sorted(set(seg.path for seg in segments))
+    index = AudioIndex(args.index)
+    info = index.update(sources)
+    index.save()
+    sample_rate = dict(zip(sources, info['sample_rate']))
+    frames = dict(zip(sources, info['frames']))
+    slices = []
+    for seg in segments:
+        end = frames[seg.path] if seg.end is None else min(seg.end,
+                                                           frames[seg.path])
+        n_samples = max(end - seg.start, 0)
+        slices.append(PolyphaseResampler.output_length(
+            n_samples, sample_rate[seg.path], args.sample_rate))
+    offsets = np.concatenate([[0], np.cumsum(slices)])
+
+    cached = set()
+    if cache is not None:
+        cached = set(range(len(segments))) - set(cache.missing(segments))
+
+    start_time = time.perf_counter()
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    dataset = create_netcdf_dataset(
+        args.output, [seg.name for seg in segments], 1, slices,
+        corpus=args.corpus, annotation_path=args.annotations,
+        chunk_size=args.chunk_size
+    )
+    features = dataset.variables['features']
+    try:
+        for idx in group_by_source(segments):
+            with soundfile.SoundFile(str(segments[idx[0]].path)) as fid:
+                for i in idx:
+                    if i in cached:
+                        features[offsets[i]:offsets[i + 1]] = cache.load(
+                            segments[i])
+                        continue
+                    pos = offsets[i]
+                    parts = []
+                    blocks = read_blocks(fid, segments[i], args.block_size)
+                    for out in resample_blocks(blocks, fid.samplerate,
+                                               args.sample_rate):
+                        features[pos:pos + len(out)] = out[:, np.newaxis]
+                        pos += len(out)
+                        if cache is not None:
+                            parts.append(out)
+                    assert pos == offsets[i + 1]
+                    if cache is not None:
+                        audio = np.concatenate([np.zeros(0)] + parts)
+                        cache.store(segments[i], audio.astype(np.float32)[
+                            :, np.newaxis])
+    finally:
+        dataset.close()
+        if cache is not None:
+            cache.save()
+
+    print("Wrote audio in {:.2f}s".format(time.perf_counter() - start_time))
     print("Num samples:")
     print("\ttotal: {}".format(sum(slices)))
     print("\tmin: {}".format(min(slices)))
     print("\tmax: {}".format(max(slices)))
     print("\tmean: {}".format(np.mean(slices)))
     print("\tstd: {}".format(np.std(slices)))
-
-    names = [f.stem for f in filenames]
-    write_netcdf_dataset(
-        args.output, corpus=args.corpus, names=names, slices=slices,
-        features=audio_arr, annotation_path=args.annotations
-    )
     print("Wrote NetCDF4 dataset to {}.".format(args.output))
 
 
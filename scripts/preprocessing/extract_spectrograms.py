@@ -5,33 +5,44 @@ TFRecord file holding the data.
 import argparse
 import time
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import (TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple,
+                    Union)
 
 import netCDF4
 import numpy as np
-import tensorflow as tf
-import tensorflow_io as tfio
-from emotion_recognition.dataset import (corpora, get_audio_paths,
-                                         parse_classification_annotations,
-                                         write_netcdf_dataset)
-from matplotlib import pyplot as plt
-
-
-def write_audeep_dataset(path: Path,
-                         spectrograms: np.ndarray,
-                         filenames: List[str],
-                         n_mels: int,
-                         labels: Optional[Dict[str, str]] = None,
-                         corpus: Optional[str] = None):
+import soundfile
+from emotion_recognition.cache import FeatureCache
+from emotion_recognition.dataset import (corpora, create_netcdf_dataset,
+                                         get_audio_segments,
+                                         parse_classification_annotations)
+from emotion_recognition.segments import (Segment, group_by_source,
+                                          segment_lengths)
+from emotion_recognition.spectrogram import \
+    calculate_spectrogram as calculate_spectrogram_np
+from joblib import Parallel, delayed
+
+# TensorFlow is only imported by the functions that use it, as it is slow
+# to import and isn't needed by the NumPy backend.
+if TYPE_CHECKING:
+    import tensorflow as tf
+
+
+def create_audeep_dataset(path: Path,
+                          filenames: List[str],
+                          n_frames: int,
+                          n_mels: int,
+                          labels: Optional[Dict[str, str]] = None,
+                          corpus: Optional[str] = None) -> netCDF4.Dataset:
+    """Creates a dataset in auDeep format with an empty 'features'
+    variable of shape (instance, time, freq), which can then be written
+    in batches. The dataset is returned open.
+    """
     path.parent.mkdir(parents=True, exist_ok=True)
 
-    tdim = spectrograms[0].shape[0]
-    if any(x.shape[0] != tdim for x in spectrograms):
-        tdim = 0
     dataset = netCDF4.Dataset(str(path), 'w')
-    dataset.createDimension('instance', len(spectrograms))
+    dataset.createDimension('instance', len(filenames))
     dataset.createDimension('fold', 0)
-    dataset.createDimension('time', tdim)
+    dataset.createDimension('time', n_frames)
     dataset.createDimension('freq', n_mels)
 
     # Although auDeep uses the actual path, we use just the name of the
@@ -41,10 +52,10 @@ def write_audeep_dataset(path: Path,
 
     # Partition and chunk are unused, set them to defaults.
     chunk_nr = dataset.createVariable('chunk_nr', np.int64, ('instance',))
-    chunk_nr[:] = np.zeros(spectrograms.shape[0], dtype=np.int64)
+    chunk_nr[:] = np.zeros(len(filenames), dtype=np.int64)
     partition = dataset.createVariable('partition', np.float64,
                                        ('instance',))
-    partition[:] = np.zeros(spectrograms.shape[0], dtype=np.float64)
+    partition[:] = np.zeros(len(filenames), dtype=np.float64)
 
     dataset.createVariable('cv_folds', np.int64, ('instance', 'fold'))
 
@@ -58,23 +69,78 @@ def write_audeep_dataset(path: Path,
         label_numeric[:] = np.array([emotions.index(labels[x])
                                      for x in filenames])
     else:
-        label_nominal[:] = np.zeros(spectrograms.shape[0], dtype=str)
-        label_numeric[:] = np.zeros(spectrograms.shape[0], dtype=np.int64)
+        label_nominal[:] = np.zeros(len(filenames), dtype=str)
+        label_numeric[:] = np.zeros(len(filenames), dtype=np.int64)
 
-    features = dataset.createVariable('features', np.float32,
-                                      ('instance', 'time', 'freq'))
-    features[:, :, :] = spectrograms
+    dataset.createVariable('features', np.float32,
+                           ('instance', 'time', 'freq'))
 
     dataset.setncattr_string('feature_dims', '["time", "freq"]')
     dataset.setncattr_string('corpus', corpus or '')
-    dataset.close()
+    return dataset
+
 
+class SpectrogramWriter:
+    """Writes batches of spectrograms, in any order, to auDeep and/or
+    netCDF4 datasets. The files are created when the first batch is
+    written, since all spectrograms have the same number of frames.
+    """
+    def __init__(self, filenames: List[str], n_mels: int,
+                 audeep: Optional[Path] = None,
+                 netcdf: Optional[Path] = None,
+                 labels: Optional[Dict[str, str]] = None,
+                 label_path: Optional[Path] = None,
+                 corpus: Optional[str] = None):
+        self.filenames = filenames
+        self.n_mels = n_mels
+        self.audeep = audeep
+        self.netcdf = netcdf
+        self.labels = labels
+        self.label_path = label_path
+        self.corpus = corpus
+        self.datasets = {}
+        self.n_frames = None
+
+    def _create(self, n_frames: int):
+        self.n_frames = n_frames
+        if self.audeep is not None:
+            self.datasets['audeep'] = create_audeep_dataset(
+                self.audeep, self.filenames, n_frames, self.n_mels,
+                self.labels, self.corpus
+            )
+        if self.netcdf is not None:
+            self.netcdf.parent.mkdir(parents=True, exist_ok=True)
+            self.datasets['netcdf'] = create_netcdf_dataset(
+                self.netcdf, self.filenames, self.n_mels,
+                [n_frames] * len(self.filenames), corpus=self.corpus or '',
+                annotation_path=self.label_path
+            )
+
+    def write(self, idx: Sequence[int], spectrograms: np.ndarray):
+        """Writes spectrograms for the instances with indices idx."""
+        if self.n_frames is None:
+            self._create(spectrograms.shape[1])
+        # Indices need not be contiguous, so write one instance at a time.
+        for i, spec in zip(idx, spectrograms):
+            if 'audeep' in self.datasets:
+                self.datasets['audeep'].variables['features'][i] = spec
+            if 'netcdf' in self.datasets:
+                t = self.n_frames
+                self.datasets['netcdf'].variables['features'][
+                    i * t:(i + 1) * t] = spec
+
+    def close(self):
+        for dataset in self.datasets.values():
+            dataset.close()
+
+
+def log10(x: 'tf.Tensor'):
+    import tensorflow as tf
 
-def log10(x: tf.Tensor):
     return tf.math.log(x) / tf.math.log(10.0)
 
 
-def calculate_spectrogram(audio: tf.Tensor,
+def calculate_spectrogram(audio: 'tf.Tensor',
                           sample_rate: int = 16000,
                           channels: str = 'mean',
                           pre_emphasis: float = 0.95,
@@ -83,7 +149,7 @@ def calculate_spectrogram(audio: tf.Tensor,
                           window_size: float = 0.05,
                           window_shift: float = 0.025,
                           n_mels: int = 120,
-                          clip: float = 60):
+                          clip: Union[float, Sequence[float]] = 60):
     """Calculates a spectrogram from a batch of time-domain signals.
 
     Args:
@@ -109,15 +175,20 @@ def calculate_spectrogram(audio: tf.Tensor,
         Window shift/stride in seconds. Default is 0.025
     n_mels: int
         Number of mel bands to calculate
-    clip: float
-        dB level below which to clip. Default is 60.
+    clip: float or list of float
+        dB level below which to clip. Default is 60. If a list is given,
+        the mel spectrogram is calculated once and clipped at each level.
 
     Returns:
     --------
     spectrograms: tf.Tensor
         The batched spectrograms of shape (N, T', M), where N is the batch
-        size, T' is the number of frames, M is n_mels.
+        size, T' is the number of frames, M is n_mels, or (N, L, T', M) if
+        L clip levels are given.
     """
+    import tensorflow as tf
+    import tensorflow_io as tfio
+
     sample_rate_f = tf.cast(sample_rate, tf.float32)
     start_samples = tf.cast(tf.round(skip * sample_rate_f), tf.int32)
     length_samples = tf.cast(tf.round(length * sample_rate_f), tf.int32)
@@ -165,62 +236,184 @@ def calculate_spectrogram(audio: tf.Tensor,
     power = tf.square(mel_spectrogram)
     db = 10 * log10(power)
     max_db = tf.reduce_max(db, axis=[1, 2], keepdims=True)
-    db_spectrogram = tf.maximum(db - max_db, -clip)
-
-    # Scale spectrogram values to [-1, 1] as per auDeep.
-    db_min = tf.reduce_min(db_spectrogram, axis=[1, 2], keepdims=True)
-    db_max = tf.reduce_max(db_spectrogram, axis=[1, 2], keepdims=True)
-    eps = db_max - db_min < 1e-4
-    lower = db_spectrogram - db_min
-    norm = 2 * (db_spectrogram - db_min) / (db_max - db_min) - 1
-    db_spectrogram = tf.where(eps, lower, norm)
-    return db_spectrogram
-
-
-def get_batched_audio(path: Path, batch_size: int = 128):
-    def pad_tensor(t: tf.Tensor, shape):
-        shape = tf.convert_to_tensor(list(shape))
-        diff = shape - tf.shape(t)
-        pad_dims = tf.transpose(tf.stack([tf.zeros_like(shape), diff]))
-        return tf.pad(t, pad_dims)
-
-    strings = [tf.constant(str(x)) for x in get_audio_paths(path)]
-    dataset = tf.data.Dataset.from_tensor_slices(strings)
-    map_args = dict(deterministic=True,
-                    num_parallel_calls=tf.data.experimental.AUTOTUNE)
-    dataset = dataset.map(tf.io.read_file, **map_args)
-    dataset = dataset.map(lambda x: tf.audio.decode_wav(x, desired_channels=2),
-                          **map_args)
-    sample_rate = next(iter(dataset))[1]
-    dataset = dataset.map(lambda x: x[0], **map_args)
-    max_len = max(x.shape[0] for x in dataset)
-    dataset = dataset.map(lambda x: pad_tensor(x, (max_len, 2)), **map_args)
-    dataset = dataset.batch(batch_size)
-    return dataset, sample_rate
+
+    def scale(clip):
+        db_spectrogram = tf.maximum(db - max_db, -clip)
+
+        # Scale spectrogram values to [-1, 1] as per auDeep.
+        db_min = tf.reduce_min(db_spectrogram, axis=[1, 2], keepdims=True)
+        db_max = tf.reduce_max(db_spectrogram, axis=[1, 2], keepdims=True)
+        eps = db_max - db_min < 1e-4
+        lower = db_spectrogram - db_min
+        norm = 2 * (db_spectrogram - db_min) / (db_max - db_min) - 1
+        return tf.where(eps, lower, norm)
+
+    if np.ndim(clip) > 0:
+        return tf.stack([scale(c) for c in clip], axis=1)
+    return scale(clip)
+
+
+def get_length_buckets(segments: Sequence[Segment], batch_size: int = 128) \
+        -> List[np.ndarray]:
+    """Groups clips of similar length into batches, using only the
+    file headers, so that each batch needs little padding. Returns a
+    list of arrays of indices into segments.
+    """
+    lengths = segment_lengths(segments)
+    order = np.argsort(lengths, kind='stable')
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def _sample_range(sample_rate: int, skip: float = 0, length: float = 5):
+    start = int(round(skip * sample_rate))
+    length_samples = int(round(length * sample_rate))
+    return start, length_samples
+
+
+def _read_segments(segments: Sequence[Segment], skip: float = 0,
+                   length: float = 5, dtype: str = 'int16') \
+        -> Tuple[List[np.ndarray], int]:
+    # Only the part of each segment that is used is decoded, and each
+    # source file is opened once.
+    audio = [None] * len(segments)
+    sample_rate = None
+    for idx in group_by_source(segments):
+        with soundfile.SoundFile(str(segments[idx[0]].path)) as fid:
+            sample_rate = fid.samplerate
+            start, length_samples = _sample_range(sample_rate, skip, length)
+            for i in idx:
+                seg = segments[i]
+                end = fid.frames if seg.end is None else min(seg.end,
+                                                             fid.frames)
+                pos = min(seg.start + start, end)
+                if length_samples > 0:
+                    end = min(end, pos + length_samples)
+                fid.seek(pos)
+                audio[i] = fid.read(end - pos, dtype=dtype, always_2d=True)
+    return audio, sample_rate
+
+
+def get_batched_audio(segments: Sequence[Segment], buckets: List[np.ndarray],
+                      skip: float = 0, length: float = 5,
+                      pad_to: Optional[int] = None):
+    """Returns a generator of batches of audio, one for each bucket, and
+    the sample rate. Each segment is truncated to the part used for the
+    spectrogram when it is read, and padded to the longest clip in its
+    batch, or to pad_to samples if given. Mono audio is duplicated to
+    two channels.
+    """
+    sample_rate = soundfile.info(str(segments[0].path)).samplerate
+    start, _ = _sample_range(sample_rate, skip, length)
+    if pad_to is not None:
+        pad_to = max(pad_to - start, 0)
+
+    def batches():
+        for idx in buckets:
+            audio, _ = _read_segments([segments[i] for i in idx], skip,
+                                      length, dtype='float32')
+            n_samples = max(len(x) for x in audio)
+            if pad_to is not None:
+                n_samples = max(n_samples, pad_to)
+            batch = np.zeros((len(idx), n_samples, 2), dtype=np.float32)
+            for i, x in enumerate(audio):
+                batch[i, :len(x)] = x[:, :2]
+            yield batch
+    return batches(), sample_rate
+
+
+def _numpy_spectrograms(segments: Sequence[Segment],
+                        pad_to: Optional[int] = None, skip: float = 0,
+                        length: float = 5, **kwargs) -> List[np.ndarray]:
+    audio, sample_rate = _read_segments(segments, skip, length)
+    if pad_to is not None:
+        start, _ = _sample_range(sample_rate, skip, length)
+        pad_to = max(pad_to - start, 0)
+    return [calculate_spectrogram_np(x, sample_rate, pad_to=pad_to,
+                                     length=length, **kwargs)
+            for x in audio]
+
+
+def get_numpy_spectrograms(segments: Sequence[Segment],
+                           buckets: List[np.ndarray],
+                           pad_to: Optional[int] = None, n_jobs: int = -1,
+                           **kwargs):
+    """Calculates spectrograms for each segment with the NumPy backend,
+    in parallel processes. Segments of the same source file in a bucket
+    are processed together, so each source is opened once per bucket.
+    kwargs are passed to `calculate_spectrogram()`. Yields the indices
+    and spectrograms of each bucket in turn.
+    """
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for idx in buckets:
+            bucket = [segments[i] for i in idx]
+            groups = group_by_source(bucket)
+            results = parallel(
+                delayed(_numpy_spectrograms)([bucket[i] for i in group],
+                                             pad_to, **kwargs)
+                for group in groups
+            )
+            specs = [None] * len(idx)
+            for group, group_specs in zip(groups, results):
+                for i, spec in zip(group, group_specs):
+                    specs[i] = spec
+            yield idx, np.stack(specs)
+
+
+def clip_path(path: Optional[Path], clip: float, n_clips: int = 1) \
+        -> Optional[Path]:
+    """Substitutes the clip level for '{clip}' in an output path."""
+    if path is None:
+        return None
+    if '{clip}' in str(path):
+        return Path(str(path).replace('{clip}', '{:g}'.format(clip)))
+    if n_clips > 1:
+        raise ValueError("Output path {} must contain '{{clip}}' when "
+                         "several clip levels are given.".format(path))
+    return path
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--input', type=Path,
-                        help="File containing list of WAV audio files.")
+    parser.add_argument(
+        '--input', type=Path, help="File containing list of WAV audio files, "
+        "or a segment manifest."
+    )
 
     parser.add_argument('--corpus', type=str, help="Corpus name.")
     parser.add_argument('--labels', type=Path,
                         help="Path to label annotations.")
     parser.add_argument('--batch_size', type=int, default=128,
                         help="Batch size for processsing.")
+    parser.add_argument(
+        '--backend', type=str, default='numpy', choices=['numpy', 'tf'],
+        help="Spectrogram implementation. The NumPy backend doesn't need "
+        "TensorFlow and processes files in parallel."
+    )
+    parser.add_argument('--jobs', type=int, default=-1,
+                        help="Number of processes for the NumPy backend.")
+    parser.add_argument(
+        '--cache', type=Path, help="Feature cache directory. Only files "
+        "that aren't already in the cache are processed."
+    )
 
-    parser.add_argument('--netcdf', type=Path,
-                        help="Output to NetCDF4 format.")
-    parser.add_argument('--audeep', type=Path,
-                        help="Output to NetCDF4 in audeep format.")
+    parser.add_argument(
+        '--netcdf', type=Path, help="Output to NetCDF4 format. If several "
+        "clip levels are given, '{clip}' in the path is replaced with each."
+    )
+    parser.add_argument(
+        '--audeep', type=Path, help="Output to NetCDF4 in audeep format. "
+        "'{clip}' is replaced as for --netcdf."
+    )
 
     parser.add_argument('--length', type=float, default=5,
                         help="Seconds of audio clip to take or pad.")
     parser.add_argument('--skip', type=float, default=0,
                         help="Seconds of initial audio to skip.")
-    parser.add_argument('--clip', type=float, default=60,
-                        help="Clip below this (negative) dB level.")
+    parser.add_argument(
+        '--clip', type=float, nargs='+', default=[60],
+        help="Clip below this (negative) dB level. Several levels can be "
+        "given, which share the same STFT."
+    )
     parser.add_argument('--window_size', type=float, default=0.05,
                         help="Window size in seconds.")
     parser.add_argument('--window_shift', type=float, default=0.025,
@@ -240,26 +433,33 @@ def main():
     )
     args = parser.parse_args()
 
-    with open(args.input) as fid:
-        paths = sorted(Path(x.strip()) for x in fid)
+    segments = sorted(get_audio_segments(args.input),
+                      key=lambda x: (x.path, x.start))
+    spec_args = dict(
+        channels=args.channels, skip=args.skip, length=args.length,
+        window_size=args.window_size, pre_emphasis=args.pre_emphasis,
+        window_shift=args.window_shift, n_mels=args.mel_bands, clip=args.clip
+    )
 
     if args.preview is not None:
         idx = args.preview
         if args.preview == -1:
-            idx = np.random.randint(len(paths))
-
-        wav = tf.io.read_file(str(paths[idx]))
-        audio, sample_rate = tf.audio.decode_wav(wav)
-        audio = tf.expand_dims(audio, 0)
-        spectrogram = calculate_spectrogram(
-            audio, sample_rate=sample_rate, channels=args.channels,
-            skip=args.skip, length=args.length, window_size=args.window_size,
-            pre_emphasis=args.pre_emphasis, window_shift=args.window_shift,
-            n_mels=args.mel_bands, clip=args.clip
-        )
-        spectrogram = spectrogram[0, :, :].numpy()
+            idx = np.random.randint(len(segments))
+
+        if args.backend == 'numpy':
+            spectrogram = _numpy_spectrograms([segments[idx]],
+                                              **spec_args)[0][0]
+        else:
+            batches, sample_rate = get_batched_audio(segments, [[idx]],
+                                                     length=-1)
+            audio = next(batches)
+            spectrogram = calculate_spectrogram(
+                audio, sample_rate=sample_rate, **spec_args)
+            spectrogram = spectrogram[0, 0, :, :].numpy()
 
-        print("Spectrogram for {}.".format(paths[idx]))
+        print("Spectrogram for {}.".format(segments[idx].name))
+
+        from matplotlib import pyplot as plt
 
         plt.figure()
         plt.imshow(spectrogram)
@@ -270,44 +470,92 @@ def main():
         raise ValueError(
             "Must specify either --preview, --netcdf or --audeep options.")
 
+    labels = None
     if args.labels:
         if not args.corpus:
             raise ValueError(
                 "--corpus must be provided if labels are provided.")
         labels = parse_classification_annotations(args.labels)
 
+    filenames = [x.name for x in segments]
+    writers = [
+        SpectrogramWriter(
+            filenames, args.mel_bands,
+            audeep=clip_path(args.audeep, clip, len(args.clip)),
+            netcdf=clip_path(args.netcdf, clip, len(args.clip)),
+            labels=labels, label_path=args.labels, corpus=args.corpus
+        )
+        for clip in args.clip
+    ]
+    pad_to = None
+    if args.length <= 0:
+        # Pad to the longest clip, so all spectrograms are the same size.
+        pad_to = int(segment_lengths(segments).max())
+
+    todo = np.arange(len(segments))
+    cache = None
+    if args.cache:
+        cache = FeatureCache(args.cache, dict(
+            spec_args, extractor='spectrogram', backend=args.backend,
+            pad_to=pad_to
+        ))
+        todo = todo[cache.missing(segments)]
+        print("{} of {} files are cached.".format(
+            len(segments) - len(todo), len(segments)))
+    buckets = [todo[b] for b in get_length_buckets(
+        [segments[i] for i in todo], args.batch_size)]
+
     print("Processing spectrograms:")
     start_time = time.perf_counter()
-    dataset, sample_rate = get_batched_audio(args.input, args.batch_size)
-    specs = []
-    for x in dataset:
-        specs.append(calculate_spectrogram(
-            x, sample_rate, channels=args.channels, skip=args.skip,
-            length=args.length, window_size=args.window_size,
-            pre_emphasis=args.pre_emphasis, window_shift=args.window_shift,
-            n_mels=args.mel_bands, clip=args.clip
-        ))
-    with tf.device('/device:cpu:0'):
-        specs = tf.concat(specs, 0)
-    spectrograms = specs.numpy()
+    if len(todo) == 0:
+        batches = iter([])
+    elif args.backend == 'numpy':
+        batches = get_numpy_spectrograms(segments, buckets, pad_to,
+                                         args.jobs, **spec_args)
+    else:
+        dataset, sample_rate = get_batched_audio(segments, buckets,
+                                                 args.skip, args.length,
+                                                 pad_to)
+        # Audio is already truncated, so skip is 0.
+        tf_args = dict(spec_args, skip=0)
+
+        def tf_batches():
+            for idx, x in zip(buckets, dataset):
+                yield idx, calculate_spectrogram(x, sample_rate,
+                                                 **tf_args).numpy()
+        batches = tf_batches()
+
+    def write(idx, specs):
+        # specs has shape (N, n_clips, T, M)
+        for i, writer in enumerate(writers):
+            writer.write(idx, specs[:, i])
+
+    n_done = 0
+    try:
+        for idx, specs in batches:
+            if cache is None:
+                write(idx, specs)
+            else:
+                for i, spec in zip(idx, specs):
+                    cache.store(segments[i], spec)
+            n_done += len(idx)
+        if cache is not None:
+            cache.save()
+            # Assemble the output from the cache.
+            for start in range(0, len(segments), args.batch_size):
+                idx = range(start, min(start + args.batch_size,
+                                       len(segments)))
+                write(idx, np.stack([cache.load(segments[i]) for i in idx]))
+    finally:
+        for writer in writers:
+            writer.close()
     print("Processed {} spectrograms in {:.4f}s".format(
-        len(spectrograms), time.perf_counter() - start_time))
-
-    filenames = [x.stem for x in paths]
-    if args.audeep is not None:
-        write_audeep_dataset(args.audeep, spectrograms, filenames,
-                             args.mel_bands, labels, args.corpus)
-
-        print("Wrote netCDF dataset to {}.".format(args.audeep))
-
-    if args.netcdf is not None:
-        slices = [spectrograms.shape[1] for _ in range(len(spectrograms))]
-        spectrograms = np.concatenate(spectrograms)
-        write_netcdf_dataset(
-            args.netcdf, corpus=args.corpus, names=filenames, slices=slices,
-            features=spectrograms, annotation_path=args.labels)
+        n_done, time.perf_counter() - start_time))
 
-        print("Wrote netCDF dataset to {}.".format(args.netcdf))
+    for writer in writers:
+        for path in [writer.audeep, writer.netcdf]:
+            if path is not None:
+                print("Wrote netCDF dataset to {}.".format(path))
 
 
 if __name__ == "__main__":
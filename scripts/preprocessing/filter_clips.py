@@ -3,7 +3,7 @@
 import argparse
 from pathlib import Path
 
-import soundfile
+from emotion_recognition.audio_index import AudioIndex
 
 
 def main():
@@ -19,13 +19,23 @@ def main():
     )
     parser.add_argument('--output', type=Path, required=True,
                         help="Output file.")
+    parser.add_argument(
+        '--index', type=Path, help="Audio metadata index, which is updated "
+        "with any new or changed files."
+    )
+    parser.add_argument('--jobs', type=int, default=-1,
+                        help="Number of threads used to read file headers.")
     args = parser.parse_args()
 
+    paths = sorted(args.input.glob('*.wav'))
+    index = AudioIndex(args.index)
+    length = index.update(paths, n_jobs=args.jobs)['duration'].to_numpy()
+    index.save()
+
     args.output.parent.mkdir(parents=True, exist_ok=True)
     with open(args.output, 'w') as fid:
-        for path in sorted(args.input.glob('*.wav')):
-            length = soundfile.info(path).duration
-            if args.minlength < length < args.maxlength:
+        for path, x in zip(paths, length):
+            if args.minlength < x < args.maxlength:
                 print(path.absolute(), file=fid)
 
 
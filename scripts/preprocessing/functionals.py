@@ -0,0 +1,77 @@
+"""Calculates functionals of LLD sequences in a netCDF dataset, such as
+IS13_lld, eGeMAPS_lld or logmel, and writes them to a new dataset. For
+example, logmel_IS09_func can be derived from logmel without processing
+the audio again.
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import netCDF4
+import numpy as np
+from emotion_recognition.dataset import create_netcdf_dataset
+from emotion_recognition.functionals import (FUNCTIONAL_SETS,
+                                             segment_functionals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--input', type=Path, required=True,
+                        help="Input netCDF4 dataset of LLDs.")
+    parser.add_argument('--output', type=Path, required=True,
+                        help="Output netCDF4 dataset.")
+    parser.add_argument(
+        '--functionals', type=str, nargs='+', default=['is09'],
+        help="Functionals to calculate. Either the name of a set, one of {}, "
+        "or a list of functionals.".format(set(FUNCTIONAL_SETS))
+    )
+    parser.add_argument('--chunk_size', type=int, default=1000,
+                        help="Number of instances to process at once.")
+    args = parser.parse_args()
+
+    functionals = args.functionals
+    if len(functionals) == 1 and functionals[0] in FUNCTIONAL_SETS:
+        functionals = FUNCTIONAL_SETS[functionals[0]]
+
+    start_time = time.perf_counter()
+    with netCDF4.Dataset(args.input) as dataset:
+        names = list(dataset.variables['filename'][:])
+        slices = np.array(dataset.variables['slices'][:])
+        n_lld = len(dataset.dimensions['features'])
+        annotation_vars = json.loads(dataset.annotation_vars)
+        if annotation_vars == ['label_nominal']:
+            annotation_type = 'classification'
+            annotations = np.array(dataset.variables['label_nominal'][:])
+        else:
+            annotation_type = 'regression'
+            annotations = {k: np.array(dataset.variables[k][:])
+                           for k in annotation_vars}
+
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        output = create_netcdf_dataset(
+            args.output, names, n_lld * len(functionals), [1] * len(names),
+            corpus=dataset.corpus, annotations=annotations,
+            annotation_type=annotation_type
+        )
+        # Functionals are calculated for chunks of instances, so that the
+        # whole LLD matrix needn't be in memory.
+        offsets = np.concatenate([[0], np.cumsum(slices)])
+        for start in range(0, len(names), args.chunk_size):
+            end = min(start + args.chunk_size, len(names))
+            x = np.array(dataset.variables['features'][
+                offsets[start]:offsets[end]])
+            features, _ = segment_functionals(x, slices[start:end],
+                                              functionals)
+            output.variables['features'][start:end] = features
+        output.close()
+
+    print("Calculated {} functionals of {} LLDs for {} instances in "
+          "{:.2f}s".format(len(functionals), n_lld, len(names),
+                           time.perf_counter() - start_time))
+    print("Wrote netCDF dataset to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,19 @@
 """Batch process a list of files in a dataset using the openSMILE Toolkit."""
 
 import argparse
-import subprocess
-import sys
 import tempfile
 from pathlib import Path
-from typing import List, Union
 
 import numpy as np
-import pandas as pd
-from emotion_recognition.dataset import get_audio_paths, write_netcdf_dataset
+from emotion_recognition.cache import FeatureCache, file_hash
+from emotion_recognition.dataset import (get_audio_segments,
+                                         write_netcdf_dataset)
+from emotion_recognition.opensmile import (OPENSMILE_BIN, compose_configs,
+                                           opensmile_batch,
+                                           opensmile_multi_batch,
+                                           physical_cores)
 from joblib import Parallel, delayed
 
-if sys.platform == 'win32':
-    OPENSMILE_BIN = 'third_party\\opensmile\\SMILExtract.exe'
-else:
-    OPENSMILE_BIN = 'third_party/opensmile/SMILExtract'
-
-
-def opensmile(path: Union[str, Path], config: Union[str, Path],
-              tmp: Union[str, Path] = 'tmp', debug: bool = False,
-              restargs: List[str] = []):
-    name = Path(path).stem
-    output_file = Path(tmp) / '{}.csv'.format(name)
-    if output_file.exists():
-        output_file.unlink()
-
-    smile_args = [
-        OPENSMILE_BIN,
-        '-C', str(config),
-        '-I', str(path),
-        '-csvoutput', str(output_file),
-        '-classes', '{unknown}',
-        '-class', 'unknown',
-        '-instname', name,
-        *restargs
-    ]
-
-    stdout = subprocess.DEVNULL
-    if debug:
-        stdout = None
-    subprocess.run(smile_args, stdout=stdout, stderr=subprocess.STDOUT)
-
-
-def process_csv(path: Union[str, Path]):
-    df = pd.read_csv(path, quotechar="'", header=None)
-    return df.iloc[:, 1:]
-
 
 def main():
     parser = argparse.ArgumentParser(
@@ -55,12 +22,20 @@ def main():
     required_args = parser.add_argument_group('Required args')
     required_args.add_argument('--corpus', type=str, required=True,
                                help="Corpus to process")
-    required_args.add_argument('--config', type=Path, required=True,
-                               help="Config file to use")
-    required_args.add_argument('--input', type=Path, required=True,
-                               help="File containing list of files")
-    required_args.add_argument('--output', type=Path, required=True,
-                               help="Output file.")
+    required_args.add_argument(
+        '--config', type=Path, nargs='+', required=True,
+        help="Config file to use. If several are given, they are combined "
+        "and run in a single pass, and a dataset is written for each."
+    )
+    required_args.add_argument(
+        '--input', type=Path, required=True,
+        help="File containing list of files, or a segment manifest."
+    )
+    required_args.add_argument(
+        '--output', type=Path, required=True,
+        help="Output file. '{config}' is replaced with the name of each "
+        "config file, without extension."
+    )
 
     # Flags
     parser.add_argument('--debug', action='store_true',
@@ -70,51 +45,105 @@ def main():
     parser.add_argument('--type', default='classification',
                         help="Type of annotations")
     parser.add_argument('--annotations', type=Path, help="Annotations file")
+    parser.add_argument(
+        '--jobs', type=int, help="Number of openSMILE processes to run at "
+        "once. Default is the number of physical cores."
+    )
+    parser.add_argument('--opensmile_bin', type=Path,
+                        default=Path(OPENSMILE_BIN),
+                        help="Path to the SMILExtract binary.")
+    parser.add_argument(
+        '--cache', type=Path, help="Feature cache directory. Only files "
+        "that aren't already in the cache are processed."
+    )
 
     args, restargs = parser.parse_known_args()
 
-    if not args.config.exists():
-        raise FileNotFoundError("Config file doesn't exist")
+    for config in args.config:
+        if not config.exists():
+            raise FileNotFoundError("Config file {} doesn't exist".format(
+                config))
+    feature_sets = [x.stem for x in args.config]
+    if len(set(feature_sets)) < len(feature_sets):
+        raise ValueError("Config file names must be unique.")
+    if len(args.config) > 1 and '{config}' not in str(args.output):
+        raise ValueError("--output must contain '{config}' when several "
+                         "configs are given.")
 
-    input_list = get_audio_paths(args.input)
-    names = sorted(f.stem for f in input_list)
+    input_list = sorted(get_audio_segments(args.input), key=lambda x: x.name)
+    names = [x.name for x in input_list]
 
     allowed_types = ['regression', 'classification']
     if args.type not in allowed_types:
         raise ValueError("--type must be one of", allowed_types)
 
-    with tempfile.TemporaryDirectory(prefix='opensmile',
-                                     suffix=args.corpus) as tmp:
-        parallel_args = dict(n_jobs=1 if args.debug else -1, verbose=1)
-        Parallel(prefer='threads', **parallel_args)(
-            delayed(opensmile)(path, args.config, tmp, args.debug, restargs)
-            for path in input_list
+    todo = input_list
+    caches = {}
+    if args.cache:
+        # Files included by the config aren't hashed, so changing them
+        # requires a new cache directory.
+        caches = {name: FeatureCache(args.cache, {
+            'extractor': 'opensmile', 'config': file_hash(config),
+            'args': restargs
+        }) for name, config in zip(feature_sets, args.config)}
+        missing = set()
+        for cache in caches.values():
+            missing.update(cache.missing(input_list))
+        todo = [input_list[i] for i in sorted(missing)]
+        print("{} of {} files are cached.".format(
+            len(input_list) - len(todo), len(input_list)))
+
+    with tempfile.TemporaryDirectory(prefix='opensmile') as tmp:
+        if len(args.config) == 1:
+            def run(batch):
+                results = opensmile_batch(batch, args.config[0], restargs,
+                                          args.opensmile_bin, args.debug)
+                return [{feature_sets[0]: x} for x in results]
+        else:
+            # Compose the configs so that each file is read once.
+            config = Path(tmp) / 'combined.conf'
+            config.write_text(compose_configs(
+                dict(zip(feature_sets, args.config))))
+
+            def run(batch):
+                return opensmile_multi_batch(batch, config, feature_sets,
+                                             restargs, args.opensmile_bin,
+                                             args.debug)
+
+        # Each task runs openSMILE on a batch of files, and there are a
+        # few batches per worker to balance the load.
+        n_jobs = 1 if args.debug else (args.jobs or physical_cores())
+        n_batches = min(len(todo), 4 * n_jobs)
+        batches = [todo[i::n_batches] for i in range(n_batches)]
+        results = Parallel(n_jobs=n_jobs, prefer='threads', verbose=1)(
+            delayed(run)(batch) for batch in batches
         )
-
-        tmp_files = [Path(tmp) / '{}.csv'.format(name) for name in names]
-        missing = [f for f in tmp_files if not f.exists()]
-        if len(missing) > 0:
-            msg = "Not all audio files were processed properly. These files " \
-                  "are missing:\n" + '\n'.join(map(str, missing))
-            raise RuntimeError(msg)
-        # Use CPUs for this because I don't think it releases the GIL
-        # for the whole processing.
-        arr_list = Parallel(**parallel_args)(
-            delayed(process_csv)(path) for path in tmp_files
+    file_results = [None] * len(todo)
+    for i, batch_results in enumerate(results):
+        file_results[i::n_batches] = batch_results
+
+    for name in feature_sets:
+        arr_list = [x[name] for x in file_results]
+        if name in caches:
+            cache = caches[name]
+            for path, arr in zip(todo, arr_list):
+                cache.store(path, arr)
+            cache.save()
+            arr_list = [cache.load(path) for path in input_list]
+
+        # This should be a 2D array
+        full_array = np.concatenate(arr_list, axis=0)
+        assert len(full_array.shape) == 2
+
+        output = Path(str(args.output).replace('{config}', name))
+        output.parent.mkdir(parents=True, exist_ok=True)
+        write_netcdf_dataset(
+            output, corpus=args.corpus, names=names, features=full_array,
+            slices=[x.shape[0] for x in arr_list],
+            annotation_path=args.annotations, annotation_type=args.type
         )
 
-    # This should be a 2D array
-    full_array = np.concatenate(arr_list, axis=0)
-    assert len(full_array.shape) == 2
-
-    args.output.parent.mkdir(parents=True, exist_ok=True)
-    write_netcdf_dataset(
-        args.output, corpus=args.corpus, names=names, features=full_array,
-        slices=[x.shape[0] for x in arr_list],
-        annotation_path=args.annotations, annotation_type=args.type
-    )
-
-    print("Wrote netCDF dataset to {}".format(args.output))
+        print("Wrote netCDF dataset to {}".format(output))
 
 
 if __name__ == "__main__":
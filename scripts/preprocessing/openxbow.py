@@ -1,49 +1,50 @@
-"""Process sequences of LLD vectors using the openXBOW software."""
+"""Encode sequences of LLD vectors as bags-of-audio-words, using either
+the BoAW encoder in emotion_recognition.boaw or the openXBOW software.
+
+The codebook is learned from the whole dataset, so the bag-of-words
+features of each file depend on every other file. Results are therefore
+cached for the input dataset as a whole, rather than per file.
+"""
 
 import argparse
 import os
 import subprocess
 import tempfile
 from pathlib import Path
+from typing import List
 
 import netCDF4
 import numpy as np
 import pandas as pd
 
+from emotion_recognition.boaw import BoAWEncoder
+from emotion_recognition.cache import FeatureCache
 from emotion_recognition.dataset import write_netcdf_dataset
 
 OPENXBOW_JAR = 'third_party/openxbow/openXBOW.jar'
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--input', type=Path, required=True,
-                        help="Input netCDF4 file.")
-    parser.add_argument('--output', type=Path, required=True,
-                        help="Output CSV file.")
-    parser.add_argument('--labels', required=True, type=Path,
-                        help="Path to labels CSV.")
-    parser.add_argument('--codebook', type=int, default=500,
-                        help="Size of codebook (number of outptut features).")
-    parser.add_argument(
-        '--closest', type=int, default=200,
-        help="Number of closest codes to increment per vector. This acts as a "
-        "smoothing parameter."
+def write_output(args, corpus: str, names: List[str],
+                 features: np.ndarray):
+    write_netcdf_dataset(
+        args.output, corpus=corpus, names=names,
+        slices=np.ones(len(names)), features=features,
+        annotation_path=args.labels, annotation_type='classification'
     )
-    args = parser.parse_args()
+    print("Wrote netCDF dataset to {}.".format(args.output))
+
 
+def run_openxbow(args, names: List[str]) -> np.ndarray:
     _, tmpin = tempfile.mkstemp(prefix='openxbow_', suffix='.csv')
     _, tmpout = tempfile.mkstemp(prefix='openxbow_', suffix='.csv')
 
     # We need to temporarily convert to CSV
     dataset = netCDF4.Dataset(args.input)
-    corpus = dataset.corpus
-    names = np.array(dataset.variables['filename'])
     slices = np.array(dataset.variables['slices'])
-    names = np.repeat(names, slices)
     features = np.array(dataset.variables['features'])
     n_features = features.shape[1]
-    df = pd.concat([pd.Series(names), pd.DataFrame(features)], axis=1)
+    df = pd.concat([pd.Series(np.repeat(names, slices)),
+                    pd.DataFrame(features)], axis=1)
     df.to_csv(tmpin, header=False, index=False)
     dataset.close()
 
@@ -64,15 +65,94 @@ def main():
     subprocess.call(xbow_args)
     os.remove(tmpin)
 
-    data = pd.read_csv(tmpout, header=None, quotechar="'")
+    data = pd.read_csv(tmpout, header=None, quotechar="'", index_col=0)
     os.remove(tmpout)
+    # Keep the order of the input dataset.
+    return np.array(data.loc[names], dtype=np.float32)
 
-    write_netcdf_dataset(
-        args.output, corpus=corpus, names=list(data.iloc[:, 0]),
-        slices=np.ones(len(data)), features=np.array(data.iloc[:, 1:]),
-        annotation_path=args.labels, annotation_type='classification'
+
+def run_numpy(args) -> np.ndarray:
+    encoder = BoAWEncoder(
+        args.codebook, args.closest, codebook=args.codebook_method,
+        log=True, norm=True, chunk_size=args.chunk_size,
+        random_state=args.seed
     )
-    print("Wrote netCDF dataset to {}.".format(args.output))
+    with netCDF4.Dataset(args.input) as dataset:
+        slices = np.array(dataset.variables['slices'])
+        features = dataset.variables['features']
+        # Only a sample of the LLD vectors is read to learn the codebook.
+        n_frames = len(features)
+        if n_frames > encoder.max_samples:
+            rng = np.random.default_rng(args.seed)
+            sample = np.sort(rng.choice(n_frames, encoder.max_samples,
+                                        replace=False))
+            encoder.fit(np.array(features[sample]))
+        else:
+            encoder.fit(np.array(features[:]))
+        return encoder.transform(features, slices)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', type=Path, required=True,
+                        help="Input netCDF4 file.")
+    parser.add_argument('--output', type=Path, required=True,
+                        help="Output CSV file.")
+    parser.add_argument('--labels', required=True, type=Path,
+                        help="Path to labels CSV.")
+    parser.add_argument('--codebook', type=int, default=500,
+                        help="Size of codebook (number of outptut features).")
+    parser.add_argument(
+        '--closest', type=int, default=200,
+        help="Number of closest codes to increment per vector. This acts as a "
+        "smoothing parameter."
+    )
+    parser.add_argument(
+        '--backend', type=str, default='numpy', choices=['numpy', 'java'],
+        help="Use the NumPy BoAW encoder, or openXBOW, which needs Java."
+    )
+    parser.add_argument(
+        '--codebook_method', type=str, default='random',
+        choices=['random', 'kmeans'],
+        help="Codebook learning method for the NumPy backend."
+    )
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Random seed for the NumPy backend.")
+    parser.add_argument('--chunk_size', type=int, default=10000,
+                        help="Number of LLD vectors to encode at once.")
+    parser.add_argument(
+        '--cache', type=Path, help="Cache directory. The features aren't "
+        "recalculated if the input dataset and options are unchanged."
+    )
+    args = parser.parse_args()
+
+    with netCDF4.Dataset(args.input) as dataset:
+        corpus = dataset.corpus
+        names = list(dataset.variables['filename'][:])
+
+    cache = None
+    if args.cache:
+        config = {'extractor': 'openxbow', 'codebook': args.codebook,
+                  'closest': args.closest}
+        if args.backend == 'numpy':
+            config.update(extractor='boaw', method=args.codebook_method,
+                          seed=args.seed)
+        cache = FeatureCache(args.cache, config)
+        features = cache.get(args.input)
+        if features is not None:
+            print("Using cached features for {}.".format(args.input))
+            write_output(args, corpus, names, features)
+            return
+
+    if args.backend == 'java':
+        features = run_openxbow(args, names)
+    else:
+        features = run_numpy(args)
+    if cache is not None:
+        cache.store(args.input, features)
+        cache.save()
+
+    write_output(args, corpus, names, features)
 
 
 if __name__ == "__main__":
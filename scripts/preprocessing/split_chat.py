@@ -3,8 +3,10 @@
 import argparse
 import re
 from pathlib import Path
+from typing import List
 
 import soundfile
+from emotion_recognition.segments import Segment, write_segment_manifest
 from joblib import Parallel, delayed
 
 REGEX = re.compile(
@@ -13,10 +15,16 @@ REGEX = re.compile(
 )
 
 
-def process(path: Path, out_dir: Path, prefix: str = ''):
-    audio, sr = soundfile.read(path)
+def process(path: Path, out_dir: Path, prefix: str = '',
+            manifest: bool = False) -> List[Segment]:
+    """Returns the segments of a recording, and writes each segment to
+    a file in out_dir unless manifest is True.
+    """
+    info = soundfile.info(str(path))
+    sr = info.samplerate
     assert sr == 16000, "Sample rate must be 16000 Hz."
 
+    segments = []
     cha_file = path.with_suffix('.cha')
     with open(cha_file) as fid:
         for i, match in enumerate(REGEX.finditer(fid.read())):
@@ -28,14 +36,21 @@ def process(path: Path, out_dir: Path, prefix: str = ''):
             e_ms = int(match[3])
             s_sam = int(s_ms * sr / 1000)
             e_sam = int(e_ms * sr / 1000)
-            if s_sam > len(audio):
+            if s_sam > info.frames:
                 print("WARNING: audio {} shorter than expected.".format(path))
                 break
             out_name = '{}{}_{:03d}_{}'.format(prefix, path.stem, i + 1,
                                                match[1])
-            split = audio[s_sam:e_sam]
-            out_file = out_dir / (out_name + '.wav')
+            segments.append(Segment(path.resolve(), s_sam,
+                                    min(e_sam, info.frames), out_name))
+
+    if not manifest:
+        audio, _ = soundfile.read(path)
+        for seg in segments:
+            split = audio[seg.start:seg.end]
+            out_file = out_dir / (seg.name + '.wav')
             soundfile.write(out_file, split, sr)
+    return segments
 
 
 def main():
@@ -43,17 +58,30 @@ def main():
     parser.add_argument('input', type=Path, nargs='+',
                         help="Input director(y|ies).")
     parser.add_argument('--output', type=Path, required=True,
-                        help="Output directory.")
+                        help="Output directory, or manifest file.")
     parser.add_argument('--prefix', type=str, default='', help="Name prefix.")
+    parser.add_argument(
+        '--manifest', action='store_true',
+        help="Write a segment manifest to --output instead of writing each "
+        "segment to a separate file."
+    )
     args = parser.parse_args()
 
-    args.output.mkdir(parents=True, exist_ok=True)
+    if args.manifest:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+    else:
+        args.output.mkdir(parents=True, exist_ok=True)
+    segments = []
     for path in args.input:
         print("Processing directory {}".format(path))
-        Parallel(n_jobs=-1, prefer='threads', verbose=1)(
-            delayed(process)(p, args.output, args.prefix)
+        results = Parallel(n_jobs=-1, prefer='threads', verbose=1)(
+            delayed(process)(p, args.output, args.prefix, args.manifest)
             for p in path.glob('**/*.wav')
         )
+        segments.extend(x for r in results for x in r)
+    if args.manifest:
+        write_segment_manifest(args.output, segments)
+        print("Wrote {} segments to {}".format(len(segments), args.output))
 
 
 if __name__ == "__main__":
@@ -1,13 +1,19 @@
 import argparse
 import xml.etree.ElementTree as ET
 from pathlib import Path
+from typing import List
 
 import soundfile
+from emotion_recognition.segments import Segment, write_segment_manifest
 from joblib import Parallel, delayed
 
 
-def process(path: Path, out_dir: Path, prefix: str = ''):
-    audio, sr = soundfile.read(path)
+def process(path: Path, out_dir: Path, prefix: str = '',
+            manifest: bool = False) -> List[Segment]:
+    """Returns the segments of a recording, and writes each segment to
+    a file in out_dir unless manifest is True.
+    """
+    sr = soundfile.info(str(path)).samplerate
     assert sr == 16000, "Sample rate must be 16000 Hz."
 
     eaf_file = path.with_suffix('.eaf')
@@ -24,7 +30,7 @@ def process(path: Path, out_dir: Path, prefix: str = ''):
         phrases = next(x for x in xml.iterfind('TIER')
                        if x.attrib['LINGUISTIC_TYPE_REF'] == 'phrase')
     except StopIteration:
-        return
+        return []
     group = []
     utts = []
     for annotation in phrases:
@@ -44,15 +50,22 @@ def process(path: Path, out_dir: Path, prefix: str = ''):
         w = [x[2] for x in group]
         utts.append((group[0][0], group[-1][1], ' '.join(w)))
 
+    segments = []
     for i, (start, end, w) in enumerate(utts):
         start = int(start)
         end = int(end)
         out_name = '{}{}_{:03d}'.format(prefix, path.stem, i)
         s_sam = int(start * sr / 1000)
         e_sam = int(end * sr / 1000)
-        split = audio[s_sam:e_sam]
-        out_file = out_dir / (out_name + '.wav')
-        soundfile.write(out_file, split, sr)
+        segments.append(Segment(path.resolve(), s_sam, e_sam, out_name))
+
+    if not manifest:
+        audio, _ = soundfile.read(path)
+        for seg in segments:
+            split = audio[seg.start:seg.end]
+            out_file = out_dir / (seg.name + '.wav')
+            soundfile.write(out_file, split, sr)
+    return segments
 
 
 def main():
@@ -60,17 +73,30 @@ def main():
     parser.add_argument('input', type=Path, nargs='+',
                         help="Input director(y|ies).")
     parser.add_argument('--output', type=Path, required=True,
-                        help="Output directory.")
+                        help="Output directory, or manifest file.")
     parser.add_argument('--prefix', type=str, default='', help="Name prefix.")
+    parser.add_argument(
+        '--manifest', action='store_true',
+        help="Write a segment manifest to --output instead of writing each "
+        "segment to a separate file."
+    )
     args = parser.parse_args()
 
-    args.output.mkdir(parents=True, exist_ok=True)
+    if args.manifest:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+    else:
+        args.output.mkdir(parents=True, exist_ok=True)
+    segments = []
     for path in args.input:
         print("Processing directory {}".format(path))
-        Parallel(n_jobs=-1, prefer='processes', verbose=1)(
-            delayed(process)(p, args.output, args.prefix)
+        results = Parallel(n_jobs=-1, prefer='processes', verbose=1)(
+            delayed(process)(p, args.output, args.prefix, args.manifest)
             for p in path.glob('**/*.wav')
         )
+        segments.extend(x for r in results for x in r)
+    if args.manifest:
+        write_segment_manifest(args.output, segments)
+        print("Wrote {} segments to {}".format(len(segments), args.output))
 
 
 if __name__ == "__main__":
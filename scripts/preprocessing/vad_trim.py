@@ -7,73 +7,112 @@ Processing Conference, Glasgow, 2009, pp. 2549-2553.
 https://ieeexplore.ieee.org/abstract/document/7077834
 """
 
+import csv
+from functools import partial
 from pathlib import Path
+from typing import Tuple
 
 import click
-import librosa
 import numpy as np
 import soundfile
 from click_option_group import optgroup
 from emotion_recognition.dataset import get_audio_paths
 from emotion_recognition.utils import PathlibPath
+from joblib import Parallel, delayed
+from scipy.signal import get_window, resample_poly
+
+VAD_SR = 16000
+N_FFT = 512
+
+
+def run_lengths(x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Run-length encodes a 1D array. Returns the start index and length
+    of each run of equal values.
+    """
+    x = np.asarray(x)
+    if len(x) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    starts = np.concatenate([[0], np.flatnonzero(x[1:] != x[:-1]) + 1])
+    lengths = np.diff(np.concatenate([starts, [len(x)]]))
+    return starts, lengths
 
 
 def filter_silence_speech(speech: np.ndarray, min_speech: int = 5,
-                          min_silence: int = 10):
-    silence = True
-    i = 0
-    while i < len(speech):
-        if silence and speech[i]:
-            j = next((j for j in range(i + 1, len(speech)) if not speech[j]),
-                     len(speech))
-            if j - i >= min_speech:
-                silence = False
-            else:
-                speech[i:j] = False
-        elif not silence and not speech[i]:
-            j = next((j for j in range(i + 1, len(speech)) if speech[j]),
-                     len(speech))
-            if j - i >= min_silence:
-                silence = True
-            else:
-                speech[i:j] = True
-        else:
-            j = i + 1
-        i = j
-
-
-def mh2009_vad(path: Path, energy_thresh: float, freq_thresh: float,
-               sf_thresh: float, window: float, debug: bool):
-    audio, sr = librosa.load(path, sr=16000)
-    print(path)
-    window_samples = int(sr * window)
-    s = librosa.stft(audio, n_fft=512, win_length=window_samples,
-                     hop_length=window_samples)
-    sxx = np.abs(s) ** 2
+                          min_silence: int = 10) -> np.ndarray:
+    """Applies hangover to frame-level speech decisions. Starting in
+    silence, a run of at least `min_speech` speech frames switches to
+    speech, and a run of at least `min_silence` silent frames switches
+    back to silence. Shorter runs take the current state.
+    """
+    speech = np.asarray(speech, dtype=bool)
+    starts, lengths = run_lengths(speech)
+    values = speech[starts]
+    long_run = np.where(values, lengths >= min_speech,
+                        lengths >= min_silence)
+    # The state for each run is the value of the most recent long run,
+    # which is silence before the first one.
+    last_long = np.maximum.accumulate(
+        np.where(long_run, np.arange(len(starts)), -1))
+    state = np.where(last_long >= 0, values[last_long], False)
+    return np.repeat(state, lengths)
+
+
+def power_spectrogram(audio: np.ndarray, hop: int, win_length: int,
+                      n_fft: int = N_FFT) -> np.ndarray:
+    """Power spectrogram of shape (n_fft // 2 + 1, n_frames), with
+    centred frames, as given by librosa.stft(). All frames are
+    transformed in a single call to rfft().
+    """
+    audio = np.pad(audio, n_fft // 2)
+    if len(audio) < n_fft:
+        audio = np.pad(audio, (0, n_fft - len(audio)))
+    frames = np.lib.stride_tricks.sliding_window_view(audio, n_fft)[::hop]
+    window = np.zeros(n_fft)
+    offset = (n_fft - win_length) // 2
+    window[offset:offset + win_length] = get_window('hann', win_length)
+    s = np.fft.rfft(frames * window, axis=1)
+    return (np.abs(s)**2).T
+
+
+def load_audio(path: Path) -> Tuple[np.ndarray, int]:
+    audio, sr = soundfile.read(path, dtype=np.float32, always_2d=True)
+    return audio.mean(1), sr
+
+
+def mh2009_vad(audio: np.ndarray, sr: int, energy_thresh: float,
+               freq_thresh: float, sf_thresh: float, window: float,
+               debug: bool = False) -> Tuple[int, int]:
+    """Returns the start and end sample of the speech in a clip. The
+    analysis is done at 16 kHz, but the offsets are in samples of the
+    given audio.
+    """
+    if sr != VAD_SR:
+        gcd = np.gcd(sr, VAD_SR)
+        audio = resample_poly(audio, VAD_SR // gcd, sr // gcd)
+    window_samples = int(VAD_SR * window)
+    sxx = power_spectrogram(audio, window_samples, window_samples)
 
     e = sxx.sum(0)
     min_e = e[:30].min()
 
-    freq = librosa.fft_frequencies(sr, 512)[1:]
+    freq = np.fft.rfftfreq(N_FFT, 1 / VAD_SR)[1:]
     f = freq[sxx[1:, :].argmax(0)]
     min_f = f.min()
 
-    sf = librosa.feature.spectral_flatness(audio, S=sxx, power=1)[0]
+    # Spectral flatness, as in librosa.feature.spectral_flatness()
+    s_thresh = np.maximum(sxx, 1e-10)
+    sf = np.exp(np.log(s_thresh).mean(0)) / s_thresh.mean(0)
     sf = -10 * np.log10(sf / 10)
     min_sf = sf.min()
 
-    thresh_e = energy_thresh
-    thresh_f = freq_thresh
-    thresh_sf = sf_thresh
-    cond1 = (e - min_e >= thresh_e).astype(int)
-    cond2 = (f - min_f >= thresh_f).astype(int)
-    cond3 = (sf - min_sf >= thresh_sf).astype(int)
+    cond1 = (e - min_e >= energy_thresh).astype(int)
+    cond2 = (f - min_f >= freq_thresh).astype(int)
+    cond3 = (sf - min_sf >= sf_thresh).astype(int)
     count = cond1 + cond2 + cond3
-    speech = count > 1
+    speech = filter_silence_speech(count > 1)
 
-    filter_silence_speech(speech)
-
-    if not np.any(speech):
+    idx = np.flatnonzero(speech)
+    if len(idx) == 0:
         if debug:
             np.set_printoptions(precision=3, suppress=True)
             print(e - min_e)
@@ -84,27 +123,49 @@ def mh2009_vad(path: Path, energy_thresh: float, freq_thresh: float,
             print(cond3)
         raise ValueError("No speech segments detected.")
 
-    start = next(i for i in range(len(speech)) if speech[i])
-    start *= window_samples
-    end = next(i for i in range(len(speech), 0, -1) if speech[i - 1])
-    end *= window_samples
-    trimmed = audio[start:end]
-    return trimmed
+    start = idx[0] * window_samples * sr // VAD_SR
+    end = (idx[-1] + 1) * window_samples * sr // VAD_SR
+    return int(start), int(end)
+
 
+def librosa_vad(audio: np.ndarray, sr: int) -> Tuple[int, int]:
+    import librosa
 
-def librosa_vad(path: Path) -> np.ndarray:
-    audio, _ = librosa.load(path, sr=16000)
-    trimmed = librosa.effects.trim(audio)
-    return trimmed
+    _, (start, end) = librosa.effects.trim(audio)
+    return int(start), int(end)
+
+
+def process_file(path: Path, output: Path, method: str, manifest: bool,
+                 **kwargs) -> Tuple[int, int]:
+    """Finds the trim offsets of a clip, and writes the trimmed clip to
+    the output directory unless only the offsets are needed.
+    """
+    audio, sr = load_audio(path)
+    if method == 'mh2009':
+        start, end = mh2009_vad(audio, sr, **kwargs)
+    else:
+        start, end = librosa_vad(audio, sr)
+
+    if not manifest:
+        output_path = output / path.name
+        soundfile.write(output_path, audio[start:end], sr)
+    return start, end
 
 
 @click.command()
 @click.argument('file', type=PathlibPath(exists=True, dir_okay=False))
-@click.argument('output', type=PathlibPath(file_okay=False))
+@click.argument('output', type=PathlibPath())
 @click.option(
     '--method', type=click.Choice(['mh2009', 'librosa'], case_sensitive=False),
     default='MH2009', help="The method to use for VAD."
 )
+@click.option(
+    '--manifest', is_flag=True,
+    help="Write the trim offsets of each clip to OUTPUT as a CSV file, "
+    "instead of writing trimmed clips to the OUTPUT directory."
+)
+@click.option('--jobs', type=int, default=-1,
+              help="Number of processes to use.")
 @click.option('--debug', is_flag=True)
 @optgroup.group('Arguments for method "mh2009"')
 @optgroup.option('--energy', 'energy_thresh', type=click.FLOAT, default=0.5,
@@ -115,23 +176,36 @@ def librosa_vad(path: Path) -> np.ndarray:
                  help="Spectral flatness threshold")
 @optgroup.option('--window', type=click.FLOAT, default=0.01)
 def main(file: Path, output: Path, energy_thresh: float, freq_thresh: float,
-         sf_thresh: float, window: float, method: str, debug: bool):
+         sf_thresh: float, window: float, method: str, manifest: bool,
+         jobs: int, debug: bool):
     """Performs voice activity detection (VAD) on audio clips referred
     to by FILE and cuts out the beginning and end of the clips where
     there is no voice.
     """
     paths = get_audio_paths(file)
-    output.mkdir(parents=True, exist_ok=True)
-    for path in paths:
-        if method == 'mh2009':
-            trimmed = mh2009_vad(path, energy_thresh, freq_thresh, sf_thresh,
-                                 window)
-        else:
-            trimmed = librosa_vad(path)
-
-        output_path = output / path.name
-        soundfile.write(output_path, trimmed, 16000)
-        print("Wrote trimmed audio to {}".format(output_path))
+    kwargs = {}
+    if method == 'mh2009':
+        kwargs = dict(energy_thresh=energy_thresh, freq_thresh=freq_thresh,
+                      sf_thresh=sf_thresh, window=window, debug=debug)
+    if manifest:
+        output.parent.mkdir(parents=True, exist_ok=True)
+    else:
+        output.mkdir(parents=True, exist_ok=True)
+
+    fn = partial(process_file, output=output, method=method,
+                 manifest=manifest, **kwargs)
+    offsets = Parallel(n_jobs=1 if debug else jobs, prefer='processes',
+                       verbose=1)(delayed(fn)(path) for path in paths)
+
+    if manifest:
+        with open(output, 'w', newline='') as fid:
+            writer = csv.writer(fid)
+            writer.writerow(['file', 'start', 'end'])
+            for path, (start, end) in zip(paths, offsets):
+                writer.writerow([path, start, end])
+        print("Wrote trim offsets to {}".format(output))
+    else:
+        print("Wrote trimmed audio to {}".format(output))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+"""Runs many experiment configurations in long-lived worker processes.
+Configurations are grouped by dataset, so that each dataset is loaded
+and normalised once and TensorFlow is imported once per worker, rather
+than once per configuration.
+
+The input file has one configuration per line, as the command line
+arguments of an experiment script, optionally preceded by `python
+path/to/script.py`. The script defaults to comparative.py and must
+define get_parser(), setup_tf(), load_dataset(), preprocess() and run(),
+as comparative.py and papers/alta2020/run_experiment.py do. Blank lines
+and lines starting with '#' are ignored.
+"""
+
+import argparse
+import copy
+import gc
+import importlib.util
+import multiprocessing
+import os
+import queue
+import shlex
+import sys
+import time
+import traceback
+from collections import defaultdict
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_SCRIPT = Path(__file__).resolve().parent / 'comparative.py'
+
+Config = Tuple[int, Path, List[str]]
+# Configurations for one dataset: the script, the dataset path, and a
+# list of (line number, arguments) for each set of preprocessing options.
+Group = Tuple[Path, Path, Dict[Tuple[Optional[int], Optional[int]],
+                               List[Tuple[int, List[str]]]]]
+
+_scripts: Dict[Path, ModuleType] = {}
+_tf_ready = False
+
+
+def import_script(path: Path) -> ModuleType:
+    """Imports an experiment script as a module, once per process."""
+    if path not in _scripts:
+        spec = importlib.util.spec_from_file_location(path.stem, str(path))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _scripts[path] = module
+    return _scripts[path]
+
+
+def read_configs(path: Path) -> List[Config]:
+    """Reads configuration lines, returning the line number, script and
+    arguments of each.
+    """
+    configs = []
+    with open(path) as fid:
+        for lineno, line in enumerate(fid, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            args = shlex.split(line)
+            script = DEFAULT_SCRIPT
+            for i, arg in enumerate(args):
+                if arg.endswith('.py'):
+                    script = Path(arg).resolve()
+                    args = args[i + 1:]
+                    break
+            configs.append((lineno, script, args))
+    return configs
+
+
+def group_configs(configs: List[Config]) -> List[Group]:
+    """Groups configurations by script and dataset, and then by padding
+    and clipping, preserving the order of first appearance.
+    """
+    groups = defaultdict(lambda: defaultdict(list))
+    for lineno, script, args in configs:
+        # Parse now so that invalid configurations fail early.
+        parsed = import_script(script).get_parser().parse_args(args)
+        groups[script, parsed.data][parsed.pad, parsed.clip].append(
+            (lineno, args))
+    return [(script, data, dict(prep))
+            for (script, data), prep in groups.items()]
+
+
+def run_group(group: Group, skip_existing: bool = False) -> List[int]:
+    """Loads a dataset once and runs all of its configurations. Returns
+    the line numbers of configurations that failed.
+    """
+    global _tf_ready
+    import tensorflow as tf
+
+    script, data, prep = group
+    failed = []
+    try:
+        module = import_script(script)
+        if not _tf_ready:
+            module.setup_tf()
+            _tf_ready = True
+        parser = module.get_parser()
+        base = module.load_dataset(data)
+    except Exception:
+        traceback.print_exc()
+        return [lineno for configs in prep.values() for lineno, _ in configs]
+
+    for (pad, clip), configs in prep.items():
+        dataset = base
+        if pad or clip:
+            # Padding and clipping replace the sequences of the dataset,
+            # so work on a copy that shares the loaded sequences.
+            dataset = copy.copy(base)
+            dataset._x = base.x.copy()
+            module.preprocess(dataset, pad, clip)
+        for lineno, args in configs:
+            parsed = parser.parse_args(args)
+            if skip_existing and parsed.results and parsed.results.exists():
+                print("Skipping line {}, {} exists.".format(
+                    lineno, parsed.results))
+                continue
+            print("Running line {}: {}".format(lineno, ' '.join(args)))
+            start_time = time.perf_counter()
+            # Runs may change the environment, e.g. to hide GPUs from
+            # child processes.
+            environ = os.environ.copy()
+            try:
+                module.run(parsed, dataset)
+            except Exception:
+                traceback.print_exc()
+                failed.append(lineno)
+            finally:
+                os.environ.clear()
+                os.environ.update(environ)
+                # Free the models and graph of this run before the next.
+                tf.keras.backend.clear_session()
+                gc.collect()
+            print("Line {} took {:.1f}s".format(
+                lineno, time.perf_counter() - start_time))
+        del dataset
+        gc.collect()
+    return failed
+
+
+def worker(gpu: Optional[int], groups: 'multiprocessing.Queue',
+           results: 'multiprocessing.Queue', skip_existing: bool):
+    """Runs dataset groups from a queue until it is empty. If gpu is
+    given, only that GPU is visible to this worker.
+    """
+    if gpu is not None:
+        # This must happen before TensorFlow is imported.
+        os.environ['CUDA_VISIBLE_DEVICES'] = str(gpu)
+    while True:
+        group = groups.get()
+        if group is None:
+            break
+        results.put(run_group(group, skip_existing))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--input', type=Path, required=True,
+                        help="File with one configuration per line.")
+    parser.add_argument(
+        '--gpus', type=int, default=0,
+        help="Number of GPUs. One worker is run per GPU. If 0, a single "
+        "worker runs in this process with the current devices."
+    )
+    parser.add_argument('--skip_existing', action='store_true',
+                        help="Skip configurations whose results file "
+                        "exists.")
+    args = parser.parse_args()
+
+    configs = read_configs(args.input)
+    groups = group_configs(configs)
+    print("{} configurations on {} datasets.".format(len(configs),
+                                                     len(groups)))
+
+    failed = []
+    if args.gpus == 0:
+        for group in groups:
+            failed.extend(run_group(group, args.skip_existing))
+    else:
+        # Workers are spawned rather than forked, so that each imports
+        # TensorFlow with only its own GPU visible.
+        ctx = multiprocessing.get_context('spawn')
+        group_queue = ctx.Queue()
+        result_queue = ctx.Queue()
+        for group in groups:
+            group_queue.put(group)
+        for _ in range(args.gpus):
+            group_queue.put(None)
+        procs = [ctx.Process(target=worker, args=(
+            i, group_queue, result_queue, args.skip_existing))
+            for i in range(args.gpus)]
+        for proc in procs:
+            proc.start()
+        n_done = 0
+        while n_done < len(groups):
+            try:
+                failed.extend(result_queue.get(timeout=10))
+                n_done += 1
+            except queue.Empty:
+                if not any(proc.is_alive() for proc in procs):
+                    print("All workers exited before finishing.")
+                    failed.append(0)
+                    break
+        for proc in procs:
+            proc.join()
+
+    if failed:
+        print("Failed configurations on lines: {}".format(
+            ', '.join(str(x) for x in sorted(failed) if x > 0)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,15 @@
 import argparse
-import pickle
 from pathlib import Path
 
 import numpy as np
+from emotion_recognition.artifact import save_svc
 from emotion_recognition.classification import PrecomputedSVC
-from emotion_recognition.dataset import CombinedDataset, NetCDFDataset
+from emotion_recognition.dataset import CombinedDataset, LabelledDataset
 from sklearn.metrics import (average_precision_score, f1_score, get_scorer,
                              make_scorer, precision_score, recall_score)
 from sklearn.model_selection import (GroupKFold, LeaveOneGroupOut, KFold,
                                      cross_validate)
+from sklearn.preprocessing import StandardScaler
 
 
 def main():
@@ -19,19 +20,23 @@ def main():
         '--cv', type=str, default='speaker',
         help="Cross-validation method. One of {speaker, corpus}."
     )
-    parser.add_argument('--norm', type=str, default='speaker',
-                        help="Normalisation method. One of {speaker, corpus}.")
+    parser.add_argument(
+        '--norm', type=str, default='speaker',
+        help="Normalisation method. One of {speaker, corpus, all}. Only 'all' "
+        "stores normalisation statistics in the saved model."
+    )
     parser.add_argument('--save', type=Path,
-                        help="Path to save trained model.")
+                        help="Path to save trained model (.npz).")
     args = parser.parse_args()
 
-    dataset = CombinedDataset(*(NetCDFDataset(path) for path in args.input))
+    dataset = CombinedDataset(*(LabelledDataset(path) for path in args.input))
     emotion_map = {x: 'emotional' for x in dataset.classes}
     emotion_map['neutral'] = 'neutral'
     dataset.map_classes(emotion_map)
     print(dataset.class_counts)
 
-    dataset.normalise(scheme=args.norm)
+    normaliser = StandardScaler()
+    dataset.normalise(normaliser=normaliser, scheme=args.norm)
 
     cv = LeaveOneGroupOut()
     if args.cv == 'speaker':
@@ -79,9 +84,13 @@ def main():
     if args.save:
         clf.fit(dataset.x, dataset.y, sample_weight=sample_weight)
         args.save.parent.mkdir(parents=True, exist_ok=True)
-        with open(args.save, 'wb') as fid:
-            pickle.dump(clf, fid)
-            print("Saved classifier to {}".format(args.save))
+        norm_stats = {}
+        if args.norm == 'all':
+            norm_stats = {'norm_mean': normaliser.mean_,
+                          'norm_scale': normaliser.scale_}
+        save_svc(args.save, clf, class_names=dataset.classes,
+                 norm_scheme=args.norm, **norm_stats)
+        print("Saved classifier to {}".format(args.save))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+"""Checks that `stream_windows()` yields the same windows for block sizes
+smaller and larger than the window and hop, with hops both shorter and
+longer than the window, and with and without a frame extractor. Windows
+are compared with those sliced directly from the whole signal.
+
+Exits with a non-zero status if any check fails.
+"""
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import soundfile
+
+from emotion_recognition.streaming import Framer, stream_windows
+
+
+def reference_windows(x: np.ndarray, sr: int, window: float, hop: float,
+                      framer: Optional[Framer] = None):
+    """Returns the windows of x sliced directly from the whole signal."""
+    if framer is not None:
+        x = Framer(framer.frame_length, framer.frame_shift,
+                   framer.fn).process(x)
+        win = (int(round(window * sr)) - framer.frame_length) \
+            // framer.frame_shift + 1
+        step = int(round(hop * sr)) // framer.frame_shift
+    else:
+        win = int(round(window * sr))
+        step = int(round(hop * sr))
+    n = max(0, (len(x) - win) // step + 1)
+    return [x[i * step:i * step + win] for i in range(n)]
+
+
+def check(path: Path, x: np.ndarray, sr: int, window: float, hop: float,
+          block_size: int, frames: bool) -> bool:
+    framer = Framer(int(0.025 * sr), int(0.01 * sr),
+                    lambda f: np.log(np.square(f).sum(1, keepdims=True)))
+    expected = reference_windows(x, sr, window, hop,
+                                 framer if frames else None)
+    windows = [win for _, win in stream_windows(
+        path, window, hop, framer if frames else None, block_size)]
+    ok = len(windows) == len(expected) and all(
+        np.allclose(a, b) for a, b in zip(windows, expected))
+    print("window {:<4} hop {:<4} block {:<6} frames {:<5} {:>3} windows "
+          "{}".format(window, hop, block_size, str(frames), len(windows),
+                      'ok' if ok else 'FAIL (expected {})'.format(
+                          len(expected))))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--sr', type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    x = rng.uniform(-0.5, 0.5, int(args.duration * args.sr))
+    x = x.astype(np.float32)
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'signal.wav'
+        soundfile.write(str(path), x, args.sr, subtype='FLOAT')
+        for window, hop in [(0.5, 1.0), (1.0, 0.5), (1.0, 1.0)]:
+            for block_size in [7, 300, 5000, 100000]:
+                for frames in [False, True]:
+                    ok &= check(path, x, args.sr, window, hop, block_size,
+                                frames)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Checks that a sharded TFRecord dataset written with `write_tfrecord()`
+reads back with the same names, labels, order, features and number of
+features, for both fixed-size feature vectors and variable-length
+sequences. Skips the check if TensorFlow isn't installed.
+
+Exits with a non-zero status if any check fails.
+"""
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+
+def _check(name: str, ok: bool) -> bool:
+    print("{:<40} {}".format(name, 'ok' if ok else 'FAIL'))
+    return ok
+
+
+def round_trip(tmp: Path, features, n_shards: int) -> bool:
+    from emotion_recognition.tensorflow.dataset import (TFRecordBackend,
+                                                        TFRecordDataset,
+                                                        shard_path,
+                                                        write_tfrecord)
+
+    n = len(features)
+    # EmoDB names, so the dataset can also be read as a LabelledDataset.
+    speakers = ['03', '08', '09', '10']
+    names = ['{}a{:02d}Wa'.format(speakers[i % 4], i) for i in range(n)]
+    labels = ['anger' if i % 3 else 'sadness' for i in range(n)]
+    path = tmp / 'data.tfrecord'
+    bounds = np.linspace(0, n, n_shards + 1).astype(int)
+    for i in range(n_shards):
+        s = slice(bounds[i], bounds[i + 1])
+        write_tfrecord(shard_path(path, i, n_shards), names[s], features[s],
+                       labels[s], 'emodb', bounds[i])
+
+    backend = TFRecordBackend(path)
+    ok = _check('names and order', backend.names == names)
+    ok &= _check('labels', backend.labels == labels)
+    ok &= _check('corpus', backend.corpus == 'emodb')
+    ok &= _check('features', all(np.array_equal(x, y) for x, y in zip(
+        backend.features, features)) and len(backend.features) == n)
+    n_features = features[0].shape[-1]
+    ok &= _check('n_features', len(backend.feature_names) == n_features)
+
+    dataset = TFRecordDataset(path)
+    ok &= _check('dataset n_features', dataset.n_features == n_features)
+    ok &= _check('dataset labels',
+                 [dataset.classes[i] for i in dataset.y] == labels)
+    ok &= _check('dataset speakers', [dataset.speakers[i] for i in
+                                      dataset.speaker_indices]
+                 == [x[:2] for x in names])
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--instances', type=int, default=50)
+    parser.add_argument('--shards', type=int, default=3)
+    args = parser.parse_args()
+
+    try:
+        import tensorflow  # noqa: F401
+    except ImportError:
+        print("TensorFlow isn't installed, skipping.")
+        return
+
+    rng = np.random.default_rng(0)
+    vectors = list(rng.normal(size=(args.instances, 20)).astype(np.float32))
+    sequences = [rng.normal(size=(rng.integers(5, 30), 8)).astype(np.float32)
+                 for _ in range(args.instances)]
+    ok = True
+    for kind, features in [('vectors', vectors), ('sequences', sequences)]:
+        print("Checking {}:".format(kind))
+        with tempfile.TemporaryDirectory() as tmp:
+            ok &= round_trip(Path(tmp), features, args.shards)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
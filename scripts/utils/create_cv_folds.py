@@ -1,19 +1,53 @@
-"""Create directory structure with cross-validation folds."""
+"""Create a cross-validation fold layout, with one fold per speaker.
+The layout is either a fold manifest listing the fold and emotion of
+each clip, or a directory structure fold_i/emotion/ of hard links,
+symbolic links or copies of the audio.
+"""
 
 import argparse
+import os
 import shutil
+import warnings
 from pathlib import Path
 
-from emotion_recognition.dataset import (corpora,
+from emotion_recognition.dataset import (get_audio_paths,
                                          parse_classification_annotations)
+from emotion_recognition.folds import (speaker_fold_entries,
+                                       write_fold_manifest)
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--corpus', required=True, type=str)
-parser.add_argument('--output', help="Directory in which to place folds.",
-                    required=True, type=Path)
+parser.add_argument('--output', required=True, type=Path,
+                    help="Directory in which to place folds, or manifest "
+                    "file for --layout manifest.")
 parser.add_argument('--input_list', required=True, type=Path,
                     help="File containing list of filenames")
 parser.add_argument('--annotations', help="Annotations file", type=Path)
+parser.add_argument(
+    '--layout', default='hardlink',
+    choices=['manifest', 'hardlink', 'symlink', 'copy'],
+    help="Write a fold manifest, or link or copy files into fold "
+    "directories. Hard links fall back to symbolic links across "
+    "filesystems."
+)
+
+
+def link_file(src: Path, dst: Path, layout: str):
+    """Places src at dst by hard link, symbolic link or copy."""
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+    if layout == 'hardlink':
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            warnings.warn("Can't hard link {}, using a symbolic link "
+                          "instead.".format(src))
+            layout = 'symlink'
+    if layout == 'symlink':
+        dst.symlink_to(src.resolve())
+    else:
+        shutil.copy(str(src), str(dst))
 
 
 def main():
@@ -21,22 +55,20 @@ def main():
 
     annotations = parse_classification_annotations(args.annotations)
 
-    get_speaker = corpora[args.corpus].get_speaker
-    speakers = {s: [] for s in corpora[args.corpus].speakers}
-    with open(args.input_list) as fid:
-        for line in fid:
-            filepath = Path(line.strip())
-            speaker = get_speaker(filepath.stem)
-            speakers[speaker].append(filepath)
-
-    for i, speaker in enumerate(speakers.keys()):
-        for path in speakers[speaker]:
-            emotion = annotations[path.stem]
-            fold = 'fold_{:d}'.format(i + 1)
-            newpath = args.output / fold / emotion / path.name
-            newpath.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy(str(path), str(newpath))
-            print(newpath)
+    paths = get_audio_paths(args.input_list)
+    entries = speaker_fold_entries(paths, args.corpus, annotations)
+
+    if args.layout == 'manifest':
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        write_fold_manifest(args.output, entries)
+        print("Wrote fold manifest to {}".format(args.output))
+        return
+
+    for entry in entries:
+        newpath = args.output / entry.fold / entry.emotion / entry.path.name
+        newpath.parent.mkdir(parents=True, exist_ok=True)
+        link_file(entry.path, newpath, args.layout)
+        print(newpath)
 
 
 if __name__ == "__main__":
@@ -1,70 +1,95 @@
-"""Exports a TFRecord file from ARFF or raw audio data."""
+"""Exports a (sharded) TFRecord dataset from ARFF, netCDF or raw audio
+data. Shards are written in parallel processes.
+"""
 
 import argparse
 from pathlib import Path
 
-import arff
 import numpy as np
-import soundfile
-import tensorflow as tf
+from joblib import Parallel, delayed
 
-from emotion_recognition.dataset import parse_classification_annotations
+from emotion_recognition.dataset import (ARFFBackend, NetCDFBackend,
+                                         get_audio_segments,
+                                         parse_classification_annotations)
+from emotion_recognition.segments import read_segments
 
-parser = argparse.ArgumentParser()
-parser.add_argument('input', type=Path,
-                    help="ARFF file or file with list of filepaths.")
-parser.add_argument('--labels', type=Path, help="Path to labels file.")
-parser.add_argument('output', type=Path, help="Path to write TFRecord.")
 
+def write_shard(path: Path, names, features, labels, corpus: str,
+                offset: int):
+    """Writes one shard. If features is None, names are segments whose
+    audio is read in this process.
+    """
+    from emotion_recognition.tensorflow.dataset import write_tfrecord
 
-def _bytes_feature(value):
-    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
-
-
-def _float_feature(value):
-    return tf.train.Feature(float_list=tf.train.FloatList(value=[value]))
-
-
-def _int64_feature(value):
-    return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
-
-
-def serialise_example(name: str, features: np.ndarray, label: str):
-    example = tf.train.Example(features=tf.train.Features(feature={
-        'name': _bytes_feature(name),
-        'features': _bytes_feature(features.tobytes()),
-        'label': _bytes_feature(label),
-        'features_shape': tf.train.Feature(int64_list=tf.train.Int64List(
-            value=list(features.shape))),
-        'features_dtype': _bytes_feature(np.dtype(features.dtype).str)
-    }))
-    return example.SerializeToString()
+    if features is None:
+        segments = names
+        names = [seg.name for seg in segments]
+        features = [audio.astype(np.float32)
+                    for audio, _ in read_segments(segments)]
+    write_tfrecord(path, names, features, labels, corpus, offset)
+    return path
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'input', type=Path, help="ARFF or netCDF file, file with list of "
+        "filepaths, or segment manifest."
+    )
+    parser.add_argument('output', type=Path, help="Path to write TFRecord.")
+    parser.add_argument('--labels', type=Path, help="Path to labels file.")
+    parser.add_argument('--corpus', type=str,
+                        help="Corpus name, for raw audio.")
+    parser.add_argument('--shards', type=int, default=1,
+                        help="Number of shards to write.")
+    parser.add_argument('--jobs', type=int, default=-1,
+                        help="Number of processes to write shards with.")
     args = parser.parse_args()
 
-    writer = tf.io.TFRecordWriter(str(args.output))
-    if args.input.suffix == '.arff':
-        with open(args.input) as fid:
-            data = arff.load(fid)
-        for inst in data['data']:
-            name = inst[0]
-            label = inst[-1]
-            features = np.array(inst[1:-1], dtype=np.float32)
-            writer.write(serialise_example(name, features, label))
+    # TensorFlow is only loaded once the arguments are parsed, so --help
+    # is fast.
+    from emotion_recognition.tensorflow.dataset import shard_path
+
+    segments = None
+    features = None
+    if args.input.suffix == '.nc' or args.input.suffixes[0] == '.arff':
+        if args.input.suffix == '.nc':
+            backend = NetCDFBackend(args.input)
+        else:
+            backend = ARFFBackend(args.input)
+        corpus = backend.corpus
+        names = backend.names
+        features = backend.features
+        labels = backend.labels
     else:
-        with open(args.input) as fid:
-            filenames = [x.strip() for x in fid.readlines()]
         if not args.labels:
             raise ValueError("Labels must be provided for raw audio dataset")
         label_dict = parse_classification_annotations(args.labels)
-        for filename in filenames:
-            Path(filename).stem
-            audio, sr = soundfile.read(filename, dtype=np.float32)
-            label = label_dict[Path(filename).stem]
-            writer.write(serialise_example(name, audio, label))
-    writer.close()
+        segments = get_audio_segments(args.input)
+        corpus = args.corpus or args.input.parent.stem
+        names = [seg.name for seg in segments]
+        labels = [label_dict[name] for name in names]
+
+    n_shards = max(min(args.shards, len(names)), 1)
+    bounds = np.linspace(0, len(names), n_shards + 1).astype(int)
+    jobs = []
+    for i in range(n_shards):
+        s = slice(bounds[i], bounds[i + 1])
+        path = shard_path(args.output, i, n_shards)
+        if segments is not None:
+            jobs.append(delayed(write_shard)(
+                path, segments[s], None, labels[s], corpus, bounds[i]))
+        else:
+            jobs.append(delayed(write_shard)(
+                path, names[s], features[s], labels and labels[s], corpus,
+                bounds[i]))
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    paths = Parallel(n_jobs=args.jobs, prefer='processes')(jobs)
+    print("Wrote {} instances to {} shard(s):".format(
+        len(names), len(paths)))
+    for path in paths:
+        print("\t{}".format(path))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+"""Measures the import time of emotion_recognition modules and the
+startup time of the `emotion-recognition` command, and checks them
+against a time budget. Each measurement is made in a fresh interpreter
+and the minimum over several runs is used. Also checks that heavy
+dependencies aren't loaded by importing light modules.
+
+Exits with a non-zero status if any budget is exceeded.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+# Budgets in seconds, in addition to the time taken to start the
+# interpreter and import numpy.
+BUDGETS = {
+    'emotion_recognition.corpora': 0.05,
+    'emotion_recognition.segments': 0.05,
+    'emotion_recognition.dataset': 0.1,
+    'emotion_recognition.cli': 0.1,
+    'emotion_recognition.tensorflow.models': 0.05
+}
+
+# Modules which mustn't be loaded when importing the above.
+HEAVY = ['tensorflow', 'torch', 'sklearn', 'pandas', 'netCDF4', 'arff',
+         'soundfile', 'scipy']
+
+_MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import {}
+elapsed = time.perf_counter() - start
+heavy = [m for m in {!r} if m in sys.modules]
+print(json.dumps([elapsed, heavy]))
+"""
+
+
+def measure_import(module: str, runs: int):
+    """Returns the minimum import time of module over several runs, and
+    any heavy modules it loaded.
+    """
+    times = []
+    heavy = []
+    for _ in range(runs):
+        # numpy is imported first so it isn't counted against the budget.
+        out = subprocess.run(
+            [sys.executable, '-c', 'import numpy' + _MEASURE.format(
+                module, HEAVY)],
+            check=True, stdout=subprocess.PIPE, universal_newlines=True
+        ).stdout
+        elapsed, heavy = json.loads(out.strip().splitlines()[-1])
+        times.append(elapsed)
+    return min(times), heavy
+
+
+def measure_command(args, runs: int) -> float:
+    """Returns the minimum wall time of running a command."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(args, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5,
+                        help="Number of runs of each measurement.")
+    parser.add_argument('--scale', type=float, default=1,
+                        help="Multiply all budgets by this factor, for "
+                        "slower machines.")
+    parser.add_argument('--help_budget', type=float, default=0.5,
+                        help="Budget for `emotion-recognition --help`, "
+                        "including interpreter startup.")
+    args = parser.parse_args()
+
+    failed = False
+    for module, budget in BUDGETS.items():
+        elapsed, heavy = measure_import(module, args.runs)
+        ok = elapsed <= budget * args.scale and len(heavy) == 0
+        failed |= not ok
+        print("{:<44} {:7.3f}s (budget {:.3f}s) {}{}".format(
+            module, elapsed, budget * args.scale, 'ok' if ok else 'FAIL',
+            '' if len(heavy) == 0 else ', loaded ' + ', '.join(heavy)))
+
+    elapsed = measure_command(
+        [sys.executable, '-m', 'emotion_recognition', '--help'], args.runs)
+    ok = elapsed <= args.help_budget * args.scale
+    failed |= not ok
+    print("{:<44} {:7.3f}s (budget {:.3f}s) {}".format(
+        'emotion-recognition --help', elapsed,
+        args.help_budget * args.scale, 'ok' if ok else 'FAIL'))
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Builds or updates an index of audio file metadata for a corpus, and
+prints a summary of clip lengths and sample rates.
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from emotion_recognition.audio_index import AudioIndex
+from emotion_recognition.dataset import get_audio_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'input', type=Path, nargs='+',
+        help="Directories to search for audio files, or files containing "
+        "lists of audio files."
+    )
+    parser.add_argument('--output', type=Path, required=True,
+                        help="Index file.")
+    parser.add_argument('--ext', type=str, default='wav',
+                        help="Extension of audio files in directories.")
+    parser.add_argument('--jobs', type=int, default=-1,
+                        help="Number of threads to use.")
+    parser.add_argument('--prune', action='store_true',
+                        help="Remove files from the index that weren't found.")
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.input:
+        if path.is_dir():
+            paths.extend(sorted(path.glob('**/*.{}'.format(args.ext))))
+        else:
+            paths.extend(get_audio_paths(path))
+
+    start_time = time.perf_counter()
+    index = AudioIndex(args.output)
+    n_indexed = len(index.table)
+    info = index.update(paths, n_jobs=args.jobs, prune=args.prune)
+    index.save()
+    print("Indexed {} files ({} previously) in {:.2f}s".format(
+        len(info), n_indexed, time.perf_counter() - start_time))
+
+    duration = info['duration']
+    print("Duration (s):")
+    print("\ttotal: {:.1f}".format(duration.sum()))
+    print("\tmin: {:.3f}".format(duration.min()))
+    print("\tmax: {:.3f}".format(duration.max()))
+    print("\tmean: {:.3f}".format(duration.mean()))
+    print("\tstd: {:.3f}".format(duration.std(ddof=0)))
+    print("Sample rates:")
+    for rate, count in info['sample_rate'].value_counts().items():
+        print("\t{}: {}".format(rate, count))
+    print("Channels:")
+    for channels, count in info['channels'].value_counts().items():
+        print("\t{}: {}".format(channels, count))
+
+
+if __name__ == "__main__":
+    main()